@@ -7,7 +7,11 @@
 
 # exported functions and classes
 from .easydb import Database
+from .pool import ConnectionPool
+from .sharded import ShardedDatabase
+from .aio import AsyncDatabase
 from .packet import operator
+from .columns import StringColumn
 from .exception import IntegrityError, InvalidReference, \
-    ObjectDoesNotExist, TransactionAbort, PacketError
+    ObjectDoesNotExist, TransactionAbort, PacketError, ServerBusy
 
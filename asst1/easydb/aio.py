@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+#
+# aio.py
+#
+# Definition for the asyncio Database class in EasyDB client
+#
+
+import asyncio
+import struct
+from collections import deque
+from .packet import *
+from .buffer import FeedBuffer, IncompleteResponse
+from .easydb import Database
+from .pipeline import REQUEST_ERRORS
+
+# bytes asked from the stream per read
+READ_SIZE = 65536
+
+
+# Async Database Class
+class AsyncDatabase:
+    # Data member 1: Database that holds the parsed schema "_schema"
+    #                <Database>, never connected, used for validation and codecs
+
+    # Data member 2: asyncio streams of the connection "_reader" and "_writer"
+
+    # Data member 3: Response parser and future of every request sent "_waiters"
+    #                <deque> of (<function>, <Future>), in the order sent
+
+    # Data member 4: Task that reads responses and resolves the futures "_task"
+
+    # Function 1: Represent
+    def __repr__(self):
+        return "<EasyDB AsyncDatabase object>"
+
+    # Function 2: Initializer, the schema is checked exactly like Database
+    def __init__(self, tables):
+        self._schema = tables._clone() if isinstance(tables, Database) else Database(tables)
+        self._reader = None
+        self._writer = None
+        self._waiters = deque()
+        self._task = None
+        self._error = None
+
+    # Function 3: String Output
+    def __str__(self):
+        return str(self._schema)
+
+    # Function 4: Connector
+    async def connect(self, host, port):
+        assert (self._writer is None)
+        self._reader, self._writer = await asyncio.open_connection(host, int(port))
+        code, = CODE.unpack(await self._reader.readexactly(CODE.size))
+        if code == OK:
+            self._error = None
+            self._task = asyncio.get_running_loop().create_task(self._read_responses())
+            return True
+        self._writer.close()
+        self._reader = self._writer = None
+        if code == SERVER_BUSY:
+            return False
+        raise PacketError("Unexpected code %d during connect()" % code)
+
+    # Function 5: Close Instance, waits for the requests already sent
+    async def close(self):
+        if self._writer is None:
+            return
+        if self._waiters:
+            await asyncio.gather(*(future for parse, future in self._waiters),
+                                 return_exceptions=True)
+        writer, self._writer = self._writer, None
+        if self._error is None:
+            writer.write(struct.pack("!ii", EXIT, 0))
+        self._task.cancel()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        self._reader = self._task = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+    # Function 6: Insert new row
+    async def insert(self, table_name, values):
+        codec = self._schema._check_insert(table_name, values)
+        return await self._request(codec.encode_insert(values), response_insert)
+
+    # Function 7: Update row
+    async def update(self, table_name, pk, values, version=None):
+        codec = self._schema._check_update(table_name, pk, values, version)
+        return await self._request(codec.encode_update(pk, version, values), response_update)
+
+    # Function 8: Drop
+    async def drop(self, table_name, pk):
+        index = self._schema._check_drop(table_name, pk)
+        await self._request(encode_drop(index, pk), response_drop)
+
+    # Function 9: Get
+    async def get(self, table_name, pk):
+        index = self._schema._check_get(table_name, pk)
+        return await self._request(encode_get(index, pk), self._schema.codecs[table_name].parse_get)
+
+    # Function 10: Scan
+    async def scan(self, table_name, op, column_name=None, value=None, container="list"):
+        check_container(container)
+        data = self._schema._scan_request(table_name, op, column_name, value)
+        return await self._request(data, lambda rbuf: response_scan(rbuf, container))
+
+    # Function 11: Send a request and wait for its response
+    #   The server answers strictly in order, so the waiter is queued in
+    #   the same step the request is written and responses match FIFO.
+    async def _request(self, data, parse):
+        if self._writer is None:
+            raise ConnectionError("Not connected")
+        if self._error is not None:
+            raise self._error
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((parse, future))
+        self._writer.write(bytes(data))
+        await self._writer.drain()
+        return await future
+
+    # Function 12: Read responses off the stream and resolve the waiters
+    async def _read_responses(self):
+        rbuf = FeedBuffer()
+        try:
+            while True:
+                data = await self._reader.read(READ_SIZE)
+                if not data:
+                    raise ConnectionError("Connection closed by server")
+                rbuf.feed(data)
+                # the shared packet.py parsers run on the fed bytes
+                while self._waiters:
+                    parse, future = self._waiters[0]
+                    position = rbuf.mark()
+                    try:
+                        value = parse(rbuf)
+                    except IncompleteResponse:
+                        rbuf.rewind(position)
+                        break
+                    except REQUEST_ERRORS as error:
+                        self._waiters.popleft()
+                        if not future.done():
+                            future.set_exception(error)
+                    else:
+                        self._waiters.popleft()
+                        if not future.done():
+                            future.set_result(value)
+        except Exception as error:
+            # the stream is broken, fail everything still waiting
+            self._error = error
+            while self._waiters:
+                parse, future = self._waiters.popleft()
+                if not future.done():
+                    future.set_exception(error)
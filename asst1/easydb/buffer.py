@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+#
+# buffer.py
+#
+# Definition for the per-connection receive buffer in EasyDB client
+#
+
+# default capacity of the receive buffer in bytes
+RECV_SIZE = 65536
+
+
+# raised by a FeedBuffer when a response has not fully arrived yet
+class IncompleteResponse(Exception):
+    pass
+
+
+# Receive Buffer Class
+class ReceiveBuffer:
+    # Data member 1: Socket the buffer reads from "_sock"
+
+    # Data member 2: Reusable storage "_buf" and a memoryview over it "_view"
+
+    # Data member 3: First unread byte "_start" and end of received data "_end"
+
+    # Function 1: Initializer
+    def __init__(self, sock, size=RECV_SIZE):
+        self._sock = sock
+        self._size = size
+        self._buf = bytearray(size)
+        self._view = memoryview(self._buf)
+        self._start = 0
+        self._end = 0
+
+    # Function 2: Number of buffered bytes not consumed yet
+    def __len__(self):
+        return self._end - self._start
+
+    # Function 3: Make sure at least n unread bytes are buffered
+    def fill(self, n):
+        avail = self._end - self._start
+        if avail >= n:
+            return
+        if avail == 0:
+            self._start = self._end = 0
+        self._make_room(n - avail)
+        # loop on short reads, TCP may split a response anywhere
+        while self._end - self._start < n:
+            got = self._sock.recv_into(self._view[self._end:])
+            if not got:
+                raise ConnectionError("Connection closed by server")
+            self._end += got
+
+    # Make sure n more bytes fit after the received data
+    def _make_room(self, n):
+        if self._end + n <= len(self._buf):
+            return
+        avail = self._end - self._start
+        if avail + n > len(self._buf):
+            # grow for responses wider than the buffer
+            new_buf = bytearray(max(avail + n, 2 * len(self._buf)))
+            new_buf[:avail] = self._view[self._start:self._end]
+            self._view.release()
+            self._buf = new_buf
+            self._view = memoryview(new_buf)
+        else:
+            # move the unread tail to the front
+            self._view[:avail] = self._view[self._start:self._end]
+        self._start = 0
+        self._end = avail
+
+    # Function 4: Unpack a struct.Struct from the buffer
+    def unpack(self, fmt):
+        self.fill(fmt.size)
+        values = fmt.unpack_from(self._buf, self._start)
+        self._start += fmt.size
+        return values
+
+    # Function 5: Unpack a struct.Struct without consuming it
+    def peek(self, fmt):
+        self.fill(fmt.size)
+        return fmt.unpack_from(self._buf, self._start)
+
+    # Function 6: Read n raw bytes from the buffer
+    def read(self, n):
+        self.fill(n)
+        data = bytes(self._view[self._start:self._start + n])
+        self._start += n
+        return data
+
+    # Function 7: Read len(view) bytes into a writable byte view
+    #   Buffered bytes are copied first, the rest is received straight into
+    #   view, so a wide response never grows the buffer. A read that fits
+    #   the buffer is filled like any other, one recv serves many of them.
+    def read_into(self, view):
+        n = len(view)
+        if n <= self._size:
+            self.fill(n)
+            view[:] = self._view[self._start:self._start + n]
+            self._start += n
+            return
+        got = min(n, self._end - self._start)
+        view[:got] = self._view[self._start:self._start + got]
+        self._start += got
+        while got < n:
+            size = self._sock.recv_into(view[got:])
+            if not size:
+                raise ConnectionError("Connection closed by server")
+            got += size
+
+    # Function 8: Drop buffered bytes and give back memory grown for wide responses
+    def clear(self):
+        self._start = self._end = 0
+        if len(self._buf) > self._size:
+            self._view.release()
+            self._buf = bytearray(self._size)
+            self._view = memoryview(self._buf)
+
+    # Function 9: Check that n more bytes can be read, before the memory
+    #   they go into is allocated. A socket buffer waits for them as it
+    #   reads, so there is nothing to check.
+    def expect(self, n):
+        pass
+
+
+
+# Feed Buffer Class: receive buffer filled from the outside, for asyncio
+#   Parsing a response that has not fully arrived raises IncompleteResponse,
+#   the caller rewinds to its mark and parses again after the next feed().
+class FeedBuffer(ReceiveBuffer):
+    # Function 1: Initializer
+    def __init__(self, size=RECV_SIZE):
+        super().__init__(None, size)
+
+    # Function 2: Append received bytes
+    def feed(self, data):
+        if len(self) == 0:
+            self._start = self._end = 0
+        self._make_room(len(data))
+        self._view[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    # Function 3: Never reads, a short buffer means the response is incomplete
+    def fill(self, n):
+        if self._end - self._start < n:
+            raise IncompleteResponse
+
+    # Function 4: Read len(view) bytes into a writable byte view
+    def read_into(self, view):
+        self.fill(len(view))
+        super().read_into(view)
+
+    # Function 5: Raise IncompleteResponse unless n more bytes have arrived
+    def expect(self, n):
+        self.fill(n)
+
+    # Function 6: Position to rewind to if the response is incomplete
+    def mark(self):
+        return self._start
+
+    def rewind(self, position):
+        self._start = position
@@ -0,0 +1,286 @@
+#!/usr/bin/python3
+#
+# bulk.py
+#
+# Definition for the bulk insert, update and drop functions in EasyDB client
+#
+
+from array import array
+from collections import namedtuple
+from collections.abc import Sequence
+from .packet import *
+from .pipeline import REQUEST_ERRORS
+
+# default number of rows encoded into one write
+BULK_CHUNK = 1024
+
+# result of a bulk call: compact pk and version arrays, and the
+# (row position, exception) pairs of the rows that failed
+BulkResult = namedtuple("BulkResult", ["pks", "versions", "errors"])
+
+# scans encoded into one write by scan_many, kept small because scan
+# responses have no size bound and must not be left unread for long
+SCAN_MANY_CHUNK = 64
+
+# what get_many does with ids that do not exist
+MISSING_POLICIES = ("skip", "none", "raise")
+
+
+# Helper Function
+# Function 1: Zero-filled array of 8-byte integers
+def zeros(count):
+    return array("q", bytes(8 * count))
+
+
+# Function 2: Validate every item, return the positions that passed
+def check_all(items, check, errors):
+    todo = []
+    for i, item in enumerate(items):
+        try:
+            check(item)
+        except PacketError as error:
+            errors.append((i, error))
+        else:
+            todo.append(i)
+    return todo
+
+
+# Function 3: Positions of todo that got no error from the server
+def succeeded(todo, errors):
+    failed = set(i for i, error in errors)
+    return [i for i in todo if i not in failed]
+
+
+# Function 4: Write the rows in chunks and read their responses
+#   While chunk k is written the responses of chunk k-1 are still unread,
+#   so the link never idles. At most two chunks are in flight.
+def stream(db, todo, size, pack, parse, store, errors, chunk_size):
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    buf = bytearray()
+    rbuf = db._rbuf
+    if db._stream is not None:
+        db._settle()
+
+    def read(chunk):
+        for i in chunk:
+            try:
+                value = parse(rbuf)
+            except REQUEST_ERRORS as error:
+                errors.append((i, error))
+            else:
+                store(i, value)
+
+    in_flight = []
+    for start in range(0, len(todo), chunk_size):
+        chunk = todo[start:start + chunk_size]
+        # 3.1 encode the whole chunk into one buffer
+        total = sum(map(size, chunk))
+        if len(buf) < total:
+            buf = bytearray(total)
+        offset = 0
+        for i in chunk:
+            offset = pack(buf, offset, i)
+        with memoryview(buf) as view:
+            db._socket.sendall(view[:offset])
+        # 3.2 read the responses of the previous chunk
+        read(in_flight)
+        in_flight = chunk
+    read(in_flight)
+
+
+# Function 5: Insert many rows
+def insert_many(db, table_name, rows, chunk_size=BULK_CHUNK):
+    if not isinstance(rows, Sequence):
+        rows = list(rows)
+    pks = zeros(len(rows))
+    versions = zeros(len(rows))
+    errors = []
+    codec = db.codecs.get(table_name)
+    if codec is None:
+        raise PacketError("Not found table name during insert_many()")
+    todo = check_all(rows, lambda values: db._check_insert(table_name, values), errors)
+
+    def size(i):
+        return codec.insert_size(rows[i])
+
+    def pack(buf, offset, i):
+        return codec.pack_insert(buf, offset, rows[i])
+
+    def store(i, key):
+        if key is None:
+            errors.append((i, PacketError("Unexpected code during insert_many()")))
+        else:
+            pks[i], versions[i] = key
+
+    stream(db, todo, size, pack, response_insert, store, errors, chunk_size)
+    if db.cache is not None:
+        for i in succeeded(todo, errors):
+            db.cache.refresh(table_name, pks[i], rows[i], versions[i])
+    errors.sort(key=lambda error: error[0])
+    return BulkResult(pks, versions, errors)
+
+
+# Function 6: Update many rows given as (pk, values, version)
+def update_many(db, table_name, items, chunk_size=BULK_CHUNK):
+    if not isinstance(items, Sequence):
+        items = list(items)
+    pks = zeros(len(items))
+    versions = zeros(len(items))
+    errors = []
+    codec = db.codecs.get(table_name)
+    if codec is None:
+        raise PacketError("Not found table name during update_many()")
+
+    def check(item):
+        # a malformed item fails on its own instead of aborting the batch
+        if not isinstance(item, (tuple, list)) or len(item) != 3:
+            raise PacketError("Not a (pk, values, version) item during update_many()")
+        db._check_update(table_name, *item)
+
+    todo = check_all(items, check, errors)
+
+    def size(i):
+        return codec.update_size(items[i][1])
+
+    def pack(buf, offset, i):
+        pk, values, version = items[i]
+        return codec.pack_update(buf, offset, pk, version, values)
+
+    def store(i, version):
+        if version is None:
+            errors.append((i, PacketError("Unexpected code during update_many()")))
+        else:
+            versions[i] = version
+
+    for i in todo:
+        pks[i] = items[i][0]
+    stream(db, todo, size, pack, response_update, store, errors, chunk_size)
+    if db.cache is not None:
+        for i in succeeded(todo, errors):
+            db.cache.refresh(table_name, pks[i], items[i][1], versions[i])
+        for i, error in errors:
+            if isinstance(error, TransactionAbort):
+                db.cache.invalidate(table_name, items[i][0])
+            elif isinstance(error, ObjectDoesNotExist):
+                db.cache.dropped(table_name, items[i][0])
+    errors.sort(key=lambda error: error[0])
+    return BulkResult(pks, versions, errors)
+
+
+# Function 7: Drop many rows, versions of the result is None
+def drop_many(db, table_name, pks, chunk_size=BULK_CHUNK):
+    if not isinstance(pks, Sequence):
+        pks = list(pks)
+    errors = []
+    index = db.table_index.get(table_name)
+    if index is None:
+        raise PacketError("Not found table name during drop_many()")
+    todo = check_all(pks, lambda pk: db._check_drop(table_name, pk), errors)
+
+    def size(i):
+        return KEY_REQUEST.size
+
+    def pack(buf, offset, i):
+        KEY_REQUEST.pack_into(buf, offset, DROP, index, pks[i])
+        return offset + KEY_REQUEST.size
+
+    def store(i, value):
+        pass
+
+    dropped = zeros(len(pks))
+    for i in todo:
+        dropped[i] = pks[i]
+    stream(db, todo, size, pack, response_drop, store, errors, chunk_size)
+    if db.cache is not None:
+        # a row that was already gone took its dependents with it too
+        gone = succeeded(todo, errors)
+        gone += [i for i, error in errors if isinstance(error, ObjectDoesNotExist)]
+        for i in gone:
+            db.cache.dropped(table_name, pks[i])
+    errors.sort(key=lambda error: error[0])
+    return BulkResult(dropped, None, errors)
+
+
+# Function 8: Get many rows, returns (values, version) pairs in input order
+#   missing: "skip" leaves out ids that do not exist, "none" puts None in
+#   their place and "raise" raises ObjectDoesNotExist once all are read
+def get_many(db, table_name, pks, missing="skip", chunk_size=BULK_CHUNK):
+    if missing not in MISSING_POLICIES:
+        raise ValueError("missing must be one of %s" % ", ".join(MISSING_POLICIES))
+    if not isinstance(pks, Sequence):
+        pks = list(pks)
+    codec = db.codecs.get(table_name)
+    if codec is None:
+        raise PacketError("Not found table name during get_many()")
+    index = codec.index
+    for pk in pks:
+        if type(pk) is not int:
+            raise PacketError("Not correct id type during get_many()")
+    rows = [None] * len(pks)
+    errors = []
+
+    def size(i):
+        return KEY_REQUEST.size
+
+    def pack(buf, offset, i):
+        KEY_REQUEST.pack_into(buf, offset, GET, index, pks[i])
+        return offset + KEY_REQUEST.size
+
+    def store(i, row):
+        if row is None:
+            errors.append((i, PacketError("Unexpected code during get_many()")))
+        rows[i] = row
+
+    # cached rows are answered without a request
+    todo = range(len(pks))
+    if db.cache is not None:
+        todo = []
+        for i, pk in enumerate(pks):
+            rows[i] = db.cache.lookup(table_name, pk)
+            if rows[i] is None:
+                todo.append(i)
+    stream(db, todo, size, pack, codec.parse_get, store, errors, chunk_size)
+    if db.cache is not None:
+        for i in succeeded(todo, errors):
+            db.cache.put(table_name, pks[i], *rows[i])
+        for i, error in errors:
+            if isinstance(error, ObjectDoesNotExist):
+                db.cache.dropped(table_name, pks[i])
+    for i, error in errors:
+        if missing == "raise" or not isinstance(error, ObjectDoesNotExist):
+            raise error
+    if missing == "skip" and errors:
+        rows = [row for row in rows if row is not None]
+    return rows
+
+
+# Function 9: Run the same scan for many values, returns one result per value
+def scan_many(db, table_name, op, column_name, values, container="list",
+              chunk_size=SCAN_MANY_CHUNK):
+    check_container(container)
+    if not isinstance(values, Sequence):
+        values = list(values)
+    # every scan is checked and encoded before any is sent
+    requests = [db._scan_request(table_name, op, column_name, value) for value in values]
+    results = [None] * len(values)
+    errors = []
+
+    def size(i):
+        return len(requests[i])
+
+    def pack(buf, offset, i):
+        end = offset + len(requests[i])
+        buf[offset:end] = requests[i]
+        return end
+
+    def parse(rbuf):
+        return response_scan(rbuf, container)
+
+    def store(i, ids):
+        results[i] = ids
+
+    stream(db, range(len(values)), size, pack, parse, store, errors, chunk_size)
+    for i, error in errors:
+        raise error
+    return results
@@ -0,0 +1,206 @@
+#!/usr/bin/python3
+#
+# cache.py
+#
+# Definition for the client-side row cache in EasyDB client
+#
+
+from collections import OrderedDict
+from .packet import *
+
+# default number of rows kept by a cache
+CACHE_ENTRIES = 1024
+
+
+# Row Cache Class
+#   Only reads allocate entries. Writes made through this client refresh
+#   the entries already held and drops evict the row and, following the
+#   foreign-key columns of the schema, every cached row the server deletes
+#   along with it. Writes made by other clients are not seen.
+class RowCache:
+    # Data member 1: Cached rows in least to most recently used order "_entries"
+    #                <OrderedDict> -> (<str>, <int>) : (<tuple>, <int>, <int>)
+    #                (table, pk) : (values, version, size)
+
+    # Data member 2: Foreign-key positions of every table "_foreign"
+    #                <dict> -> <str> : <list> of (<int>, <str>) value index, target table
+
+    # Data member 3: Tables with a foreign key to a table "_dependents"
+    #                <dict> -> <str> : <list> of <str>
+
+    # Data member 4: Cached rows referencing a row "_refs"
+    #                <dict> -> <str> : <dict>, <dict> -> <int> : <set> of (<str>, <int>)
+
+    # Function 1: Initializer
+    #   max_entries: rows kept, None for no limit
+    #   max_bytes: encoded size of the rows kept, None for no limit
+    def __init__(self, db, max_entries=CACHE_ENTRIES, max_bytes=None):
+        if max_entries is None and max_bytes is None:
+            raise ValueError("A cache needs max_entries or max_bytes")
+        if max_entries is not None and max_entries < 1 or max_bytes is not None and max_bytes < 1:
+            raise ValueError("Cache budgets must be at least 1")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._codecs = db.codecs
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._foreign = dict()
+        self._dependents = dict()
+        self._refs = dict()
+        for table_name, columns in db.dict_tables.items():
+            self._foreign[table_name] = []
+            self._dependents[table_name] = []
+            for i, col in enumerate(columns):
+                if type(col[1]) == str:
+                    # the schema only references tables defined before
+                    self._foreign[table_name].append((i, col[1]))
+                    self._dependents[col[1]].append(table_name)
+                    self._refs[col[1]] = dict()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB RowCache object, %d rows, %d bytes>" % (len(self._entries), self._bytes)
+
+    # Function 3: Number of cached rows
+    def __len__(self):
+        return len(self._entries)
+
+    # Function 4: Cached (values, version) of a row, or None on a miss
+    def lookup(self, table_name, pk):
+        entry = self._entries.get((table_name, pk))
+        if entry is None:
+            self._stats["misses"] += 1
+            return None
+        self._entries.move_to_end((table_name, pk))
+        self._stats["hits"] += 1
+        # callers get their own list, the cached tuple stays untouched
+        return list(entry[0]), entry[1]
+
+    # Function 5: Store a row that was read from the server
+    def put(self, table_name, pk, values, version):
+        key = (table_name, pk)
+        if key in self._entries:
+            self._remove(key)
+        values = tuple(values)
+        size = self._codecs[table_name].insert_size(values)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._entries[key] = (values, version, size)
+        self._bytes += size
+        for i, target in self._foreign[table_name]:
+            self._refs[target].setdefault(values[i], set()).add(key)
+        # evict the least recently used rows until the budgets hold
+        while self.max_entries is not None and len(self._entries) > self.max_entries \
+                or self.max_bytes is not None and self._bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    # Function 6: Replace a row written by this client if it is cached
+    def refresh(self, table_name, pk, values, version):
+        if (table_name, pk) in self._entries:
+            self.put(table_name, pk, values, version)
+
+    # Function 7: Forget a row whose cached copy may be stale
+    def invalidate(self, table_name, pk):
+        if (table_name, pk) in self._entries:
+            self._remove((table_name, pk))
+            self._stats["invalidations"] += 1
+
+    # Function 8: Forget a dropped row and the rows the server deleted with it
+    def dropped(self, table_name, pk):
+        self.invalidate(table_name, pk)
+        refs = self._refs.get(table_name)
+        if refs is not None:
+            for key in list(refs.get(pk, ())):
+                self.invalidate(*key)
+        for dependent in self._dependents[table_name]:
+            self._sweep(dependent)
+
+    # Function 9: Forget every row
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+        for refs in self._refs.values():
+            refs.clear()
+
+    # Function 10: Snapshot of the cache metrics
+    def stats(self):
+        stats = dict(self._stats)
+        stats["entries"] = len(self._entries)
+        stats["bytes"] = self._bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # Function 11: Response parsers that keep the cache in step
+    #   Every request path (single call, pipeline, async) runs the same
+    #   parser, so wrapping it covers all of them.
+    def track_insert(self, table_name, values):
+        def parse(rbuf):
+            key = response_insert(rbuf)
+            if key is not None:
+                # a pk can be reused after a drop made by another client
+                self.refresh(table_name, key[0], values, key[1])
+            return key
+        return parse
+
+    def track_update(self, table_name, pk, values):
+        def parse(rbuf):
+            try:
+                version = response_update(rbuf)
+            except TransactionAbort:
+                self.invalidate(table_name, pk)
+                raise
+            except ObjectDoesNotExist:
+                self.dropped(table_name, pk)
+                raise
+            self.refresh(table_name, pk, values, version)
+            return version
+        return parse
+
+    def track_drop(self, table_name, pk):
+        def parse(rbuf):
+            try:
+                response_drop(rbuf)
+            except ObjectDoesNotExist:
+                # already gone, and so are the rows that referenced it
+                self.dropped(table_name, pk)
+                raise
+            self.dropped(table_name, pk)
+        return parse
+
+    def track_get(self, table_name, pk, get_parse):
+        def parse(rbuf):
+            try:
+                row = get_parse(rbuf)
+            except ObjectDoesNotExist:
+                self.dropped(table_name, pk)
+                raise
+            if row is not None:
+                self.put(table_name, pk, *row)
+            return row
+        return parse
+
+    # Remove the rows referencing rows of table_name that are not cached.
+    # Such rows may have been deleted by the cascade without the cache
+    # seeing them, so their dependents cannot be trusted either.
+    def _sweep(self, table_name):
+        refs = self._refs.get(table_name)
+        if refs is not None:
+            for target in [pk for pk in refs if (table_name, pk) not in self._entries]:
+                for key in list(refs.get(target, ())):
+                    self.invalidate(*key)
+        for dependent in self._dependents[table_name]:
+            self._sweep(dependent)
+
+    def _remove(self, key):
+        values, version, size = self._entries.pop(key)
+        self._bytes -= size
+        for i, target in self._foreign[key[0]]:
+            refs = self._refs[target]
+            keys = refs.get(values[i])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del refs[values[i]]
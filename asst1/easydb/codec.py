@@ -0,0 +1,196 @@
+#!/usr/bin/python3
+#
+# codec.py
+#
+# Definition for the precompiled per-table row codec in EasyDB client
+#
+
+import struct
+from .packet import INSERT, UPDATE, FLOAT, STRING, FOREIGN, OK, CODE, VALUE_HEADER, response_get, \
+    string_size
+from .exception import PacketError
+
+# Header layouts of the row-carrying requests and responses
+INSERT_HEADER = "!iii"    # command, table, count
+UPDATE_HEADER = "!iiqqi"  # command, table, pk, version, count
+GET_HEADER = "!iqi"       # code, version, count
+
+# zero bytes used to pad strings to 4-byte alignment
+PADDING = bytes(3)
+
+
+# Helper Function
+# Function 1: Struct format for one fixed-width value (type, size, value)
+def value_format(type_val):
+    if type_val == FLOAT:
+        return "iid"
+    return "iiq"  # integer and foreign are both 8-byte ids
+
+
+# Function 2: Python type accepted for a numeric column type
+def python_type(type_val):
+    if type_val == FLOAT:
+        return float
+    elif type_val == STRING:
+        return str
+    return int  # integer and foreign
+
+
+# Row Codec Class
+class RowCodec:
+    # Data member 1: Table index used in the request header "index"
+    #                <int>
+
+    # Data member 2: Numeric column types "types" and python types "py_types"
+    #                <tuple> of <int>, <tuple> of <type>
+
+    # Data member 3: Whole-request Structs for tables without string columns
+    #                "_insert" and "_update", or None
+
+    # Data member 4: Runs of fixed-width columns between strings "_segments"
+    #                <list> of (<Struct> or None, <list> of column indices, <list> of args)
+
+    # Data member 5: Whole-response Struct of a get for tables without strings "_row"
+
+    # Function 1: Initializer, compiles the layout once per table
+    def __init__(self, index, types):
+        self.index = index
+        self.types = tuple(types)
+        self.count = len(self.types)
+        self.py_types = tuple(python_type(t) for t in self.types)
+        self._buf = bytearray(1024)
+        self._insert = None
+        self._update = None
+        self._row = None
+        self._segments = []
+
+        # template of the per-value args: type, size and a slot for the value
+        body_args = []
+        for type_val in self.types:
+            body_args += [type_val, 8, None]
+
+        if STRING not in self.types:
+            # Fast path: the whole request is a single Struct
+            body = "".join(value_format(t) for t in self.types)
+            self._insert = struct.Struct(INSERT_HEADER + body)
+            self._insert_args = [INSERT, index, self.count] + body_args
+            self._update = struct.Struct(UPDATE_HEADER + body)
+            self._update_args = [UPDATE, index, 0, 0, self.count] + body_args
+            self._row = struct.Struct(GET_HEADER + body)
+            self._buf = bytearray(self._update.size)
+        else:
+            # General path: fixed runs are precompiled, strings are copied in
+            run = []
+            for col, type_val in enumerate(self.types + (STRING,)):
+                if type_val != STRING:
+                    run.append(col)
+                    continue
+                if run:
+                    fmt = "!" + "".join(value_format(self.types[i]) for i in run)
+                    args = []
+                    for i in run:
+                        args += [self.types[i], 8, None]
+                    self._segments.append((struct.Struct(fmt), run, args))
+                    run = []
+                if col < self.count:
+                    self._segments.append((None, col, None))
+            self._fixed_size = 16 * (self.count - self.types.count(STRING))
+            self._string_cols = [i for i, t in enumerate(self.types) if t == STRING]
+            self._insert_header = struct.Struct(INSERT_HEADER)
+            self._update_header = struct.Struct(UPDATE_HEADER)
+
+    # Function 2: Fused validator for a whole row
+    def validate(self, values, caller):
+        if len(values) != self.count:
+            raise PacketError("Element number mismatch during %s()" % caller)
+        if tuple(map(type, values)) != self.py_types:
+            # slow path only to build the right message
+            for value, py_type, type_val in zip(values, self.py_types, self.types):
+                if type(value) is not py_type:
+                    if type_val == FOREIGN:
+                        raise PacketError("Element types mismatch during %s(): foreign" % caller)
+                    raise PacketError("Element types mismatch during %s()" % caller)
+
+    # Function 3: Encoded size of the row body (string tables only)
+    def _body_size(self, values):
+        size = self._fixed_size
+        for col in self._string_cols:
+            size += 8 + string_size(len(values[col]))
+        return size
+
+    # Function 4: Size of an insert request for the row
+    def insert_size(self, values):
+        if self._insert is not None:
+            return self._insert.size
+        return self._insert_header.size + self._body_size(values)
+
+    # Function 5: Size of an update request for the row
+    def update_size(self, values):
+        if self._update is not None:
+            return self._update.size
+        return self._update_header.size + self._body_size(values)
+
+    # Function 6: Pack an insert request into buf at offset, return the end offset
+    def pack_insert(self, buf, offset, values):
+        if self._insert is not None:
+            args = self._insert_args[:]
+            args[5::3] = values
+            self._insert.pack_into(buf, offset, *args)
+            return offset + self._insert.size
+        self._insert_header.pack_into(buf, offset, INSERT, self.index, self.count)
+        return self._pack_body(buf, offset + self._insert_header.size, values)
+
+    # Function 7: Pack an update request into buf at offset, return the end offset
+    def pack_update(self, buf, offset, pk, version, values):
+        if version is None:  # atomic update is not activated
+            version = 0
+        if self._update is not None:
+            args = self._update_args[:]
+            args[2] = pk
+            args[3] = version
+            args[7::3] = values
+            self._update.pack_into(buf, offset, *args)
+            return offset + self._update.size
+        self._update_header.pack_into(buf, offset, UPDATE, self.index, pk, version, self.count)
+        return self._pack_body(buf, offset + self._update_header.size, values)
+
+    # Function 8: Pack the row body segment by segment
+    def _pack_body(self, buf, offset, values):
+        for fmt, cols, args in self._segments:
+            if fmt is None:
+                data = values[cols].encode("ascii")
+                size = string_size(len(data))
+                VALUE_HEADER.pack_into(buf, offset, STRING, size)
+                offset += 8
+                end = offset + len(data)
+                buf[offset:end] = data
+                buf[end:offset + size] = PADDING[:size - len(data)]
+                offset += size
+            else:
+                args = args[:]
+                args[2::3] = [values[i] for i in cols]
+                fmt.pack_into(buf, offset, *args)
+                offset += fmt.size
+        return offset
+
+    # Function 9: Encode an insert request into the codec's own buffer
+    def encode_insert(self, values):
+        size = self.insert_size(values)
+        if len(self._buf) < size:
+            self._buf = bytearray(max(size, 2 * len(self._buf)))
+        return memoryview(self._buf)[:self.pack_insert(self._buf, 0, values)]
+
+    # Function 10: Encode an update request into the codec's own buffer
+    def encode_update(self, pk, version, values):
+        size = self.update_size(values)
+        if len(self._buf) < size:
+            self._buf = bytearray(max(size, 2 * len(self._buf)))
+        return memoryview(self._buf)[:self.pack_update(self._buf, 0, pk, version, values)]
+
+    # Function 11: Parse a get response, a fixed-width row is one unpack
+    def parse_get(self, rbuf):
+        if self._row is None or rbuf.peek(CODE)[0] != OK:
+            return response_get(rbuf)
+        row = rbuf.unpack(self._row)
+        # layout: code, version, count, then (type, size, value) per column
+        return list(row[5::3]), row[1]
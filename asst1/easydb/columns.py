@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+#
+# columns.py
+#
+# Definition for the columnar fetch in EasyDB client
+#
+
+import sys
+from array import array
+from collections.abc import Sequence
+from .packet import *
+from .bulk import stream, BULK_CHUNK
+
+# what fetch_columns does with ids that do not exist
+FETCH_MISSING = ("skip", "raise")
+
+# bytes of one fixed-width value on the wire: type, size and the value
+VALUE_SIZE = 16
+
+
+# Helper Function
+# Function 1: Wire layout of a row
+#   Returns the segments of the row body, (size, None) for a run of
+#   fixed-width values copied as they are and (0, column) for a string,
+#   and the position of every fixed-width column in the copied record.
+def row_layout(types):
+    segments = []
+    position = {}
+    run = 0
+    for col, type_val in enumerate(types):
+        if type_val == STRING:
+            if run:
+                segments.append((run * VALUE_SIZE, None))
+                run = 0
+            segments.append((0, col))
+        else:
+            position[col] = len(position)
+            run += 1
+    if run:
+        segments.append((run * VALUE_SIZE, None))
+    return segments, position
+
+
+# Function 2: One fixed-width column out of the copied records
+#   The records are VALUE_SIZE bytes per fixed-width column, the value is
+#   the second 8-byte word of its entry. Nothing is boxed on the way.
+def extract(raw, count, fixed, position, type_val, container):
+    words = 2 * fixed
+    word = 2 * position + 1
+    if container == "numpy":
+        dtype = ">f8" if type_val == FLOAT else ">i8"
+        native = numpy.float64 if type_val == FLOAT else numpy.int64
+        records = numpy.frombuffer(raw, dtype=dtype, count=count * words).reshape(count, words)
+        return records[:, word].astype(native)
+    records = array("d" if type_val == FLOAT else "q")
+    records.frombytes(memoryview(raw)[:count * words * 8])
+    column = records[word::words]
+    if sys.byteorder == "little":
+        column.byteswap()
+    if container == "list":
+        return column.tolist()
+    return column
+
+
+# String Column Class: strings stored back to back
+#   Value i is data[offsets[i]:offsets[i + 1]], so a column of a million
+#   strings is two buffers rather than a million str objects. Values are
+#   decoded only when read.
+class StringColumn:
+    # Data member 1: Start of every value and the end of the last "offsets"
+    #                <array> of int64, or a numpy int64 array
+
+    # Data member 2: ASCII bytes of all the values "data"
+    #                <bytearray>
+
+    # Function 1: Initializer
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB StringColumn object, %d values>" % len(self)
+
+    # Function 3: Number of values
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Function 4: Value at an index
+    def __getitem__(self, i):
+        if type(i) is not int:
+            raise TypeError("StringColumn indices must be int")
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("StringColumn index out of range")
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("ascii")
+
+    # Function 5: Iterate the values
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # Function 6: Values as a list of str
+    def tolist(self):
+        return list(self)
+
+
+# Function 3: Read some columns of many rows, returns {name: column}
+#   The get responses are decoded straight into one preallocated record
+#   per row, integer, foreign and float columns are then cut out of the
+#   records as int64 and float64 arrays and string columns are collected
+#   as a StringColumn. "id" holds the pk of every row read.
+#   container: "array", "numpy" or "list", as for scan
+#   missing: "skip" leaves out ids that do not exist, "raise" raises
+#   ObjectDoesNotExist once all are read
+def fetch_columns(db, table_name, pks, columns, container="array", missing="skip",
+                  chunk_size=BULK_CHUNK):
+    check_container(container)
+    if missing not in FETCH_MISSING:
+        raise ValueError("missing must be one of %s" % ", ".join(FETCH_MISSING))
+    if not isinstance(pks, Sequence):
+        pks = list(pks)
+    codec = db.codecs.get(table_name)
+    if codec is None:
+        raise PacketError("Not found table name during fetch_columns()")
+    index = codec.index
+    for pk in pks:
+        if type(pk) is not int:
+            raise PacketError("Not correct id type during fetch_columns()")
+    col_index = db.col_index[table_name]
+    wanted = []
+    for name in columns:
+        if name not in col_index:
+            raise PacketError("Illegal column name during fetch_columns()")
+        wanted.append(col_index[name] - 1)
+
+    segments, position = row_layout(codec.types)
+    stride = VALUE_SIZE * len(position)
+    raw = bytearray(stride * len(pks))
+    view = memoryview(raw)
+    ids = array("q", bytes(8 * len(pks)))
+    strings = {}
+    for col in wanted:
+        if codec.types[col] == STRING:
+            strings[col] = (array("q", bytes(8 * (len(pks) + 1))), bytearray())
+    errors = []
+    found = 0
+
+    def size(i):
+        return KEY_REQUEST.size
+
+    def pack(buf, offset, i):
+        KEY_REQUEST.pack_into(buf, offset, GET, index, pks[i])
+        return offset + KEY_REQUEST.size
+
+    def parse(rbuf):
+        code, = rbuf.unpack(CODE)
+        if code == NOT_FOUND:
+            raise ObjectDoesNotExist("Unexpected code %d during fetch_columns()" % code)
+        if code != OK:
+            return None
+        rbuf.unpack(ROW_HEADER)
+        offset = found * stride
+        for run, col in segments:
+            if col is None:
+                rbuf.read_into(view[offset:offset + run])
+                offset += run
+                continue
+            type_val, length = rbuf.unpack(VALUE_HEADER)
+            data = rbuf.read(length)
+            if col in strings:
+                offsets, values = strings[col]
+                values += data.rstrip(b"\x00")
+                offsets[found + 1] = len(values)
+        return True
+
+    def store(i, ok):
+        nonlocal found
+        if ok is None:
+            errors.append((i, PacketError("Unexpected code during fetch_columns()")))
+        else:
+            ids[found] = pks[i]
+            found += 1
+
+    stream(db, range(len(pks)), size, pack, parse, store, errors, chunk_size)
+    view.release()
+    for i, error in errors:
+        if missing == "raise" or not isinstance(error, ObjectDoesNotExist):
+            raise error
+
+    del ids[found:]
+    result = {"id": ids}
+    if container == "numpy":
+        result["id"] = numpy.frombuffer(ids, dtype=numpy.int64)
+    elif container == "list":
+        result["id"] = ids.tolist()
+    for name, col in zip(columns, wanted):
+        if col in strings:
+            offsets, values = strings[col]
+            del offsets[found + 1:]
+            if container == "numpy":
+                offsets = numpy.frombuffer(offsets, dtype=numpy.int64)
+            result[name] = StringColumn(offsets, values)
+            if container == "list":
+                result[name] = result[name].tolist()
+        else:
+            result[name] = extract(raw, found, len(position), position[col],
+                                   codec.types[col], container)
+    return result
@@ -8,9 +8,17 @@
 # Import Module
 import socket
 from .packet import *
+from .buffer import ReceiveBuffer
+from .codec import RowCodec
+from .pipeline import Pipeline, MAX_IN_FLIGHT
+from . import bulk
+from .bulk import BULK_CHUNK
+from .cache import RowCache, CACHE_ENTRIES
+from .stream import ScanStream, SCAN_CHUNK, skip_ids
+from .columns import fetch_columns, StringColumn
 from .exception import PacketError
 from .exception import IntegrityError
-from collections import Iterable
+from collections.abc import Iterable
 
 
 # Helper Function
@@ -78,6 +86,19 @@ class Database:
     # Data member 5: Access the column index with table name and column name "col_index"
     #                <dict> -> <str> : <dict>, <dict> -> <str> : <int>
 
+    # Data member 6: Receive buffer of the current connection "_rbuf"
+    #                <ReceiveBuffer>
+
+    # Data member 7: Access the precompiled row codec with table name "codecs"
+    #                <dict> -> <str> : <RowCodec>
+
+    # Data member 8: Optional cache of the rows read by get "cache"
+    #                <RowCache> or None
+
+    # Data member 9: Scan stream still reading the connection "_stream"
+    #                <weakref> to <ScanStream> or None, and the ids an
+    #                abandoned stream left unread "_unread"
+
     # Function 1: Represent
     def __repr__(self):
         return "<EasyDB Database object>"
@@ -85,11 +106,16 @@ class Database:
     # Function 2: Initializer
     def __init__(self, tables):
         self._socket = None
+        self._rbuf = None
+        self._stream = None
+        self._unread = 0
+        self.cache = None
         # Create Data Structure members
         self.dict_tables = dict()
         self.table_index = dict()
         self.num_type = dict()
         self.col_index = dict()
+        self.codecs = dict()
         # Check if the table is iterable
         if not isinstance(tables, Iterable):
             raise TypeError
@@ -148,6 +174,7 @@ class Database:
                 self.num_type[table[0]].append(num_type_map(col[1]))
                 self.col_index[table[0]][col[0]] = col_i
                 col_i += 1
+            self.codecs[table[0]] = RowCodec(index, self.num_type[table[0]])
             index += 1
 
     # Function 3: Connector
@@ -155,12 +182,14 @@ class Database:
         assert (self._socket is None)
         self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._socket.connect((host, int(port)))
-        code = response(self._socket)
+        self._rbuf = ReceiveBuffer(self._socket)
+        code = response(self._rbuf)
         if code == OK:
             return True
         elif code == SERVER_BUSY:
             self._socket.close()
             self._socket = None
+            self._rbuf = None
             return False
         else:
             raise PacketError("Unexpected code %d during connect()" % code)
@@ -169,9 +198,12 @@ class Database:
     def close(self):
         if self._socket is None:
             return
-        request(EXIT, 0)
+        if self._stream is not None:
+            self._settle(True)
+        request(self._socket, EXIT)
         self._socket.close()
         self._socket = None
+        self._rbuf = None
 
     # Function 5: String Output
     def __str__(self):
@@ -196,39 +228,144 @@ class Database:
 
     # Function 6: Insert new row
     def insert(self, table_name, values):
-        # 6.1 Error Checking: PacketError & InvalidReference
-        # 6.1.1 Check If the table name exists
-        if table_name not in self.dict_tables:
-            raise PacketError("Not found table name during insert()")
-
-        # 6.1.2 Check If the values has the correct length
-        if len(values) != len(self.dict_tables[table_name]):
-            raise PacketError("Element number mismatch during insert()")
-
-        # Store table column list
-        table_columns = self.dict_tables[table_name]
-
-        # traverse both table template and input
-        for (column, colInput) in zip(table_columns, values):
-            column_name, col_type = column
-            if col_type is not type(colInput):
-                # 6.1.3 Compare each element's type in values
-                if type(col_type) is not str:
-                    if type(colInput) is not col_type:
-                        raise PacketError("Element types mismatch during insert()")
-
-                # the colType is a foreign ref
-                if type(colInput) is not int:
-                    raise PacketError("Element types mismatch during insert(): foreign")
+        codec = self._check_insert(table_name, values)
 
         # 6.2 Call Request
-        request_insert(self._socket, values, self.table_index[table_name], self.num_type[table_name])
+        if self._stream is not None:
+            self._settle()
+        request_insert(self._socket, codec, values)
 
         # 6.3 Wait for Response and Return pk & version
-        return response_insert(self._socket)
+        if self.cache is None:
+            return response_insert(self._rbuf)
+        return self.cache.track_insert(table_name, values)(self._rbuf)
 
     # Function 7: Update row
     def update(self, table_name, pk, values, version=None):
+        codec = self._check_update(table_name, pk, values, version)
+
+        # 7.3 Call Request
+        if self._stream is not None:
+            self._settle()
+        request_update(self._socket, codec, pk, values, version)
+
+        # 7.4 Wait for Response and Return new Version
+        if self.cache is None:
+            return response_update(self._rbuf)
+        return self.cache.track_update(table_name, pk, values)(self._rbuf)
+
+    # Function 8: Drop
+    def drop(self, table_name, pk):
+        index = self._check_drop(table_name, pk)
+
+        # 8.2 Call Request
+        if self._stream is not None:
+            self._settle()
+        request_drop(self._socket, index, pk)
+
+        # 8.3 Wait for Response
+        if self.cache is None:
+            response_drop(self._rbuf)
+        else:
+            self.cache.track_drop(table_name, pk)(self._rbuf)
+
+    # Function 9: Get
+    def get(self, table_name, pk):
+        index = self._check_get(table_name, pk)
+        if self.cache is not None:
+            row = self.cache.lookup(table_name, pk)
+            if row is not None:
+                return row
+        # Error-free, start to interact with server
+        if self._stream is not None:
+            self._settle()
+        request_get(self._socket, index, pk)
+        if self.cache is None:
+            return self.codecs[table_name].parse_get(self._rbuf)
+        return self.cache.track_get(table_name, pk, self.codecs[table_name].parse_get)(self._rbuf)
+
+    # Function 10: Scan
+    #   container: "list" of ids, or opt in to "array" (array('q')) or
+    #   "numpy" (int64) to skip building an int object per id
+    def scan(self, table_name, op, column_name=None, value=None, container="list"):
+        check_container(container)
+        data = self._scan_request(table_name, op, column_name, value)
+        if self._stream is not None:
+            self._settle()
+        self._socket.sendall(data)
+        # Receive Response
+        return response_scan(self._rbuf, container)
+
+    # Function 11: Scan that yields the ids in batches as they arrive
+    #   Returns a ScanStream, use it as a context manager or close() it to
+    #   stop early. Another request on this Database reads the rest first.
+    def scan_iter(self, table_name, op, column_name=None, value=None,
+                  chunk_size=SCAN_CHUNK, container="list"):
+        check_container(container)
+        if type(chunk_size) is not int or chunk_size < 1:
+            raise ValueError("chunk_size must be a positive int")
+        data = self._scan_request(table_name, op, column_name, value)
+        if self._stream is not None:
+            self._settle()
+        self._socket.sendall(data)
+        count = response_scan_header(self._rbuf)
+        if count is None:
+            raise PacketError("Unexpected code during scan_iter()")
+        return ScanStream(self, count, chunk_size, container)
+
+    # Function 12: Pipeline
+    def pipeline(self, max_in_flight=MAX_IN_FLIGHT):
+        return Pipeline(self, max_in_flight)
+
+    # Function 13: Insert many rows, returns BulkResult(pks, versions, errors)
+    def insert_many(self, table_name, rows, chunk_size=BULK_CHUNK):
+        return bulk.insert_many(self, table_name, rows, chunk_size)
+
+    # Function 14: Update many (pk, values, version) items
+    def update_many(self, table_name, items, chunk_size=BULK_CHUNK):
+        return bulk.update_many(self, table_name, items, chunk_size)
+
+    # Function 15: Drop many rows
+    def drop_many(self, table_name, pks, chunk_size=BULK_CHUNK):
+        return bulk.drop_many(self, table_name, pks, chunk_size)
+
+    # Function 16: Get many rows in one pipelined pass
+    def get_many(self, table_name, pks, missing="skip", chunk_size=BULK_CHUNK):
+        return bulk.get_many(self, table_name, pks, missing, chunk_size)
+
+    # Function 17: Run the same scan for many values in one pipelined pass
+    def scan_many(self, table_name, op, column_name, values, container="list"):
+        return bulk.scan_many(self, table_name, op, column_name, values, container)
+
+    # Function 18: Read some columns of many rows into per-column storage
+    #   Returns {"id": pks read, name: column}, see columns.fetch_columns.
+    def fetch_columns(self, table_name, pks, columns, container="array", missing="skip",
+                      chunk_size=BULK_CHUNK):
+        return fetch_columns(self, table_name, pks, columns, container, missing, chunk_size)
+
+    # Function 19: Cache the rows read by get and get_many
+    #   Returns the new RowCache, use_cache(None, None) turns caching off.
+    def use_cache(self, max_entries=CACHE_ENTRIES, max_bytes=None):
+        if max_entries is None and max_bytes is None:
+            self.cache = None
+        else:
+            self.cache = RowCache(self, max_entries, max_bytes)
+        return self.cache
+
+    # Function 20: Check an insert, return the codec of the table
+    def _check_insert(self, table_name, values):
+        # 6.1 Error Checking: PacketError & InvalidReference
+        # 6.1.1 Check If the table name exists
+        codec = self.codecs.get(table_name)
+        if codec is None:
+            raise PacketError("Not found table name during insert()")
+
+        # 6.1.2 Check the length and the type of every element at once
+        codec.validate(values, "insert")
+        return codec
+
+    # Function 21: Check an update, return the codec of the table
+    def _check_update(self, table_name, pk, values, version):
         # 7.1 Error Checking: PacketError
         # 7.1.1 pk is not int
         if type(pk) is not int:
@@ -239,38 +376,16 @@ class Database:
             raise PacketError("Not correct version type during update()")
 
         # 7.1.2 table name does not exist
-        if table_name not in self.dict_tables:
+        codec = self.codecs.get(table_name)
+        if codec is None:
             raise PacketError("Not found table name during update()")
 
-        # 7.1.3 Check If the values has the correct length
-        if len(values) != len(self.dict_tables[table_name]):
-            raise PacketError("Element number mismatch during update()")
-
-        # 7.1.4 Check If the types match
-        # Store table column list
-        table_columns = self.dict_tables[table_name]
-
-        # traverse both table template and input
-        for (column, colInput) in zip(table_columns, values):
-            column_name, col_type = column
-            if col_type is not type(colInput):
-                # 6.1.3 Compare each element's type in values
-                if type(col_type) is not str:
-                    if type(colInput) is not col_type:
-                        raise PacketError("Element types mismatch during update()")
-
-                # the colType is a foreign ref
-                if type(colInput) is not int:
-                    raise PacketError("Element types mismatch during update(): foreign")
+        # 7.1.3 Check the length and the type of every element at once
+        codec.validate(values, "update")
+        return codec
 
-        # 7.3 Call Request
-        request_update(self._socket, pk, values, version, self.table_index[table_name], self.num_type[table_name])
-
-        # 7.4 Wait for Response and Return new Version
-        return response_update(self._socket)
-
-    # Function 8: Drop
-    def drop(self, table_name, pk):
+    # Function 22: Check a drop, return the table index
+    def _check_drop(self, table_name, pk):
         # 8.1 Error Checking: Packet Error
         # 8.1.1 Table Name does not Exist
         if table_name in self.dict_tables:
@@ -279,26 +394,19 @@ class Database:
                 raise PacketError("Not correct id type during drop()")
         else:
             raise PacketError("Not found table name during drop()")
+        return self.table_index[table_name]
 
-        # 8.2 Call Request
-        request_drop(self._socket, self.table_index[table_name], pk)
-
-        # 8.3 Wait for Response
-        response_drop(self._socket)
-
-    # Function 9: Get
-    def get(self, table_name, pk):
+    # Function 23: Check a get, return the table index
+    def _check_get(self, table_name, pk):
         # Error checking
         if type(pk) is not int:
             raise PacketError
         if table_name not in self.dict_tables:
             raise PacketError
-        # Error-free, start to interact with server
-        request_get(self._socket, self.table_index[table_name], pk)
-        return response_get(self._socket)
+        return self.table_index[table_name]
 
-    # Function 10: Scan
-    def scan(self, table_name, op, column_name=None, value=None):
+    # Function 24: Check a scan, return the encoded request
+    def _scan_request(self, table_name, op, column_name, value):
         # Error checking
         legal_tb_name = False
         legal_col_name = False
@@ -340,16 +448,44 @@ class Database:
             raise PacketError("Illegal column name")
         if not legal_rt_op:
             raise PacketError("Illegal value name")
-        # The input is error-free, start to interact with server
+        # The input is error-free, encode the request
         if op == operator.AL:
-            request_scan(self._socket, self.table_index[table_name], op, 0, None, 0)
-        else:
-            if column_name == 'id':
-                request_scan(self._socket, self.table_index[table_name], op, 0, value, int)
+            return encode_scan(self.table_index[table_name], op, 0, None, 0)
+        if column_name == 'id':
+            return encode_scan(self.table_index[table_name], op, 0, value, INTEGER)
+        col_idx = self.col_index[table_name][column_name]
+        tb_idx = self.table_index[table_name]
+        return encode_scan(tb_idx, op, col_idx, value, self.num_type[table_name][col_idx - 1])
+
+    # Function 25: Read what an open scan stream left on the connection
+    #   discard: drop the ids instead of handing them to the stream
+    def _settle(self, discard=False):
+        stream = self._stream()
+        self._stream = None
+        if stream is not None:
+            if discard:
+                stream.close()
             else:
-                col_idx = self.col_index[table_name][column_name]
-                tb_idx = self.table_index[table_name]
-                request_scan(self._socket, tb_idx, op, col_idx, value, self.num_type[table_name][col_idx - 1])
-        # Receive Response
-        return response_scan(self._socket)
-
+                stream._settle()
+        if self._unread:
+            unread, self._unread = self._unread, 0
+            skip_ids(self._rbuf, unread)
+
+    # Function 26: Unconnected copy that shares the parsed schema
+    def _clone(self):
+        db = Database.__new__(Database)
+        db._socket = None
+        db._rbuf = None
+        db._stream = None
+        db._unread = 0
+        db.cache = None
+        db.tables = self.tables
+        db.dict_tables = self.dict_tables
+        db.table_index = self.table_index
+        db.num_type = self.num_type
+        db.col_index = self.col_index
+        # codecs own an encode buffer, so every connection gets its own
+        db.codecs = dict()
+        for table_name, codec in self.codecs.items():
+            db.codecs[table_name] = RowCodec(codec.index, codec.types)
+        return db
@@ -29,3 +29,7 @@ class TransactionAbort(Exception):
 class PacketError(Exception):
 	pass
 
+
+# customized exception for the error code SERVER_BUSY (no thread available)
+class ServerBusy(Exception):
+	pass
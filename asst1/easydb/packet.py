@@ -6,9 +6,15 @@
 #
 
 import struct
-import math
+import sys
+from array import array
 from .exception import *
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # request commands
 INSERT = 1
 UPDATE = 2
@@ -38,6 +44,11 @@ STRING = 3
 FOREIGN = 4
 
 
+# Bytes a string value takes on the wire, padded to 4-byte alignment
+def string_size(length):
+    return (length + 3) & ~3
+
+
 # operator types
 class operator:
     AL = 1  # everything
@@ -50,87 +61,54 @@ class operator:
 
 
 # Request Function Family
+# Struct shared by the requests that only carry a key
+KEY_REQUEST = struct.Struct("!iiq")
+
+
 # Function 0. Request Function
 def request(sock, command, table_nr=0):
     # sending struct request to server
     buf = struct.pack("!ii", command, table_nr)
-    sock.send(buf)
+    sock.sendall(buf)
 
 
 # Function 1. Request to Insert a row
-def request_insert(sock, values, index, types):
-    # 1.1 Pack Request Struct
-    buf = struct.pack("!ii", INSERT, index)
-
-    # 1.2 Pack Row Struct
-    # 1.2.1 Pack Count
-    buf += struct.pack("!i", len(values))
-
-    # 1.2.2 Pack value
-    for (value, type_val) in zip(values, types):
-        if type_val == INTEGER:
-            # since we define an 'int' as 8 bytes, so we actually use 'long long' below
-            buf += struct.pack("!iiq", type_val, 8, value)
-        elif type_val == FLOAT:
-            # since we define a 'float' as 8 bytes, so we actually use 'double' below
-            buf += struct.pack("!iid", type_val, 8, value)
-        elif type_val == STRING:
-            size = math.ceil(len(value) / 4) + len(value)
-            buf += struct.pack("!ii" + str(size) + "s", type_val, size, value.encode('ascii'))
-        else:  # foreign
-            # let's hope the id field is 8 bytes
-            buf += struct.pack("!iiq", type_val, 8, value)
-
-    # Send Request to Server
-    sock.send(buf)
+def request_insert(sock, codec, values):
+    # the codec packs header and row with precompiled structs
+    sock.sendall(codec.encode_insert(values))
 
 
 # Function 2. Request to Update a row
-def request_update(sock, pk, values, version, index, types):
-    # 2.1 Pack Request
-    buf = struct.pack("!ii", UPDATE, index)
-
-    # 2.2 Pack key
-    if version is not None:  # activate atomic update
-        buf += struct.pack("!qq", pk, version)
-    else:  # atomic update is not activated
-        buf += struct.pack("!qq", pk, 0)
-
-    # 2.3 Pack Row
-    # 2.3.1 Pack Count
-    buf += struct.pack("!i", len(values))
-
-    # 2.3.2 Pack value
-    for (value, type_val) in zip(values, types):
-        if type_val == INTEGER:
-            buf += struct.pack("!iiq", type_val, 8, value)
-        elif type_val == FLOAT:
-            buf += struct.pack("!iid", type_val, 8, value)
-        elif type_val == STRING:
-            size = math.ceil(len(value) / 4) + len(value)
-            buf += struct.pack("!ii" + str(size) + "s", type_val, size, value.encode('ascii'))
-        else:  # foreign
-            buf += struct.pack("!iiq", type_val, 8, value)
-
-    # sending struct request to server
-    sock.send(buf)
+def request_update(sock, codec, pk, values, version):
+    # a version of 0 tells the server the update is not atomic
+    sock.sendall(codec.encode_update(pk, version, values))
 
 
 # Function 3. Request to drop a row
 def request_drop(sock, index, pk):
     # sending struct request to server
-    buf = struct.pack("!iiq", DROP, index, pk)
-    sock.send(buf)
+    sock.sendall(encode_drop(index, pk))
+
+
+def encode_drop(index, pk):
+    return KEY_REQUEST.pack(DROP, index, pk)
 
 
 # Function 4. Request to get
 def request_get(sock, index, pk):
-    buf = struct.pack("!iiq", GET, index, pk)
-    sock.send(buf)
+    sock.sendall(encode_get(index, pk))
+
+
+def encode_get(index, pk):
+    return KEY_REQUEST.pack(GET, index, pk)
 
 
 # Function 5. Request to scan
 def request_scan(sock, tb_idx, op, col_num, val, col_type):
+    sock.sendall(encode_scan(tb_idx, op, col_num, val, col_type))
+
+
+def encode_scan(tb_idx, op, col_num, val, col_type):
     # Append buf with "request", "table index", "column index", and "operator"
     buf = struct.pack("!ii", SCAN, tb_idx)
     buf += struct.pack("!ii", col_num, op)
@@ -141,116 +119,149 @@ def request_scan(sock, tb_idx, op, col_num, val, col_type):
     elif col_type == FLOAT:
         buf += struct.pack("!iid", FLOAT, 8, val)
     elif col_type == STRING:
-        size = math.ceil(len(val) / 4) + len(val)
-        buf += struct.pack("!ii" + str(size) + "s", STRING, size, val.encode('ascii'))
+        data = val.encode('ascii')
+        size = string_size(len(data))
+        buf += struct.pack("!ii" + str(size) + "s", STRING, size, data)
     else:
         buf += struct.pack("!iiq", FOREIGN, 8, val)
-    sock.send(buf)
+    return buf
 
 
 # Response Function Family
+# Structs shared by the response functions
+CODE = struct.Struct("!i")
+KEY = struct.Struct("!qq")
+VERSION = struct.Struct("!q")
+ROW_HEADER = struct.Struct("!qi")
+VALUE_HEADER = struct.Struct("!ii")
+LONG = struct.Struct("!q")
+DOUBLE = struct.Struct("!d")
+
+# result types a scan can return
+SCAN_CONTAINERS = ("array", "list", "numpy")
+
+
 # Function 0. Response Function
-def response(sock):
+def response(rbuf):
     # expecting struct response, which is 4 bytes
-    buf = sock.recv(4)
-    return struct.unpack("!i", buf)[0]
+    return rbuf.unpack(CODE)[0]
 
 
 # Function 1. Response to Insert Request
-def response_insert(sock):
+def response_insert(rbuf):
     # 1.1 Receive Response Code
-    buf = sock.recv(4)
-    code, = struct.unpack("!i", buf)  # comma used to only receive first 4 bytes
+    code, = rbuf.unpack(CODE)  # comma used to only receive first 4 bytes
 
     # 1.2 Receive Key if code is ok
-    if code is OK:
-        buf = sock.recv(8+8)
-        return struct.unpack('!qq', buf)
-    elif code is BAD_FOREIGN:
+    if code == OK:
+        return rbuf.unpack(KEY)
+    elif code == BAD_FOREIGN:
         raise InvalidReference("Unexpected code %d during insert()" % code)
 
 
 # Function 2. Response Function to update
-def response_update(sock):
+def response_update(rbuf):
     # 2.1 Receive Response Code
-    buf = sock.recv(4)
-    code, = struct.unpack("!i", buf)
+    code, = rbuf.unpack(CODE)
 
     # 2.2 Receive version if code is ok
-    if code is OK:
-        buf = sock.recv(8)
-        return struct.unpack('!q', buf)[0]
-    elif code is TXN_ABORT:
+    if code == OK:
+        return rbuf.unpack(VERSION)[0]
+    elif code == TXN_ABORT:
         raise TransactionAbort("Unexpected code %d during update()" % code)
-    elif code is BAD_FOREIGN:
+    elif code == BAD_FOREIGN:
         raise InvalidReference("Unexpected code %d during update()" % code)
-    elif code is NOT_FOUND:
+    elif code == NOT_FOUND:
         raise ObjectDoesNotExist("Unexpected code %d during update()" % code)
 
 
 # Function 3. Response Function to drop
-def response_drop(sock):
+def response_drop(rbuf):
     # 3.1 Receive
-    buf = sock.recv(4)
-    code, = struct.unpack("!i", buf)
+    code, = rbuf.unpack(CODE)
 
-    if code is NOT_FOUND:
+    if code == NOT_FOUND:
         raise ObjectDoesNotExist("Unexpected code %d during drop()" % code)
 
 
 # Function 4. Response to Get
-def response_get(sock):
+def response_get(rbuf):
     # Receive Response Code
-    buf = sock.recv(4)
-    code = struct.unpack("!i", buf)[0]
-
-    if code is OK:
-        buf = sock.recv(8)
-        version = struct.unpack("!q", buf)[0]
-        buf = sock.recv(4)
-        row_count = struct.unpack("!i", buf)[0]
+    code, = rbuf.unpack(CODE)
+
+    if code == OK:
+        version, row_count = rbuf.unpack(ROW_HEADER)
         value_list = []
         for i in range(row_count):
-            # Grab value type
-            buf = sock.recv(4)
-            curr_val_type = struct.unpack("!i", buf)[0]
-            # Grab value size
-            buf = sock.recv(4)
-            curr_val_size = struct.unpack("!i", buf)[0]
+            # Grab value type and size
+            curr_val_type, curr_val_size = rbuf.unpack(VALUE_HEADER)
             # Grab data itself according to different data type
-            buf = sock.recv(curr_val_size)
-            if curr_val_type == INTEGER:
-                curr_val_buf = struct.unpack("!q", buf)[0]
+            if curr_val_type == INTEGER or curr_val_type == FOREIGN:
+                curr_val_buf = rbuf.unpack(LONG)[0]
             elif curr_val_type == FLOAT:
-                curr_val_buf = struct.unpack("!d", buf)[0]
+                curr_val_buf = rbuf.unpack(DOUBLE)[0]
             elif curr_val_type == STRING:
-                curr_val_buf = struct.unpack("!" + str(curr_val_size) + "s", buf)[0]
+                curr_val_buf = rbuf.read(curr_val_size)
                 curr_val_buf = curr_val_buf.decode("ascii")
                 curr_val_buf = curr_val_buf.replace("\x00", "")
-            else:  # foreign
-                curr_val_buf = struct.unpack("!q", buf)[0]
+            else:  # null
+                rbuf.read(curr_val_size)
+                curr_val_buf = None
             value_list.append(curr_val_buf)
         ret_tuple = value_list, version
         return ret_tuple
-    elif code is NOT_FOUND:
+    elif code == NOT_FOUND:
         raise ObjectDoesNotExist
 
 
 # Function 5: Response to Scan
-def response_scan(sock):
+#   container: "list" for a list of ints, "array" for an array('q') or
+#   "numpy" for a numpy int64 array
+def response_scan(rbuf, container="list"):
     # 3.1 Receive
-    buf = sock.recv(4)
-    code = struct.unpack("!i", buf)[0]
-
-    if code is OK:
-        buf = sock.recv(4)
-        count = struct.unpack("!i", buf)[0]
-        ans = []
-        for i in range(count):
-            buf = sock.recv(8)
-            ret_id = struct.unpack("!q", buf)[0]
-            ans.append(ret_id)
-        return ans
-    elif code is BAD_QUERY:
+    code, = rbuf.unpack(CODE)
+
+    if code == OK:
+        count, = rbuf.unpack(CODE)
+        return read_ids(rbuf, count, container)
+    elif code == BAD_QUERY:
         raise PacketError
 
+
+# Function 6: Header of a scan response, returns the number of ids that follow
+def response_scan_header(rbuf):
+    code, = rbuf.unpack(CODE)
+
+    if code == OK:
+        return rbuf.unpack(CODE)[0]
+    elif code == BAD_QUERY:
+        raise PacketError
+
+
+# Function 7: Read count ids of a scan response
+def read_ids(rbuf, count, container="list"):
+    # the id block goes straight into the result's memory, then the
+    # big-endian ids are swapped in one step. A response still arriving
+    # is given up on before the memory is allocated.
+    rbuf.expect(8 * count)
+    if container == "numpy":
+        ids = numpy.empty(count, dtype=numpy.int64)
+        rbuf.read_into(memoryview(ids).cast("B"))
+        if sys.byteorder == "little":
+            ids.byteswap(inplace=True)
+        return ids
+    ids = array("q", bytes(8 * count))
+    rbuf.read_into(memoryview(ids).cast("B"))
+    if sys.byteorder == "little":
+        ids.byteswap()
+    if container == "list":
+        return ids.tolist()
+    return ids
+
+
+# Function 8: Check the container asked of a scan
+def check_container(container):
+    if container not in SCAN_CONTAINERS:
+        raise ValueError("container must be one of %s" % ", ".join(SCAN_CONTAINERS))
+    if container == "numpy" and numpy is None:
+        raise ImportError("numpy is required for container=\"numpy\"")
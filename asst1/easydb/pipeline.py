@@ -0,0 +1,222 @@
+#!/usr/bin/python3
+#
+# pipeline.py
+#
+# Definition for request pipelining in EasyDB client
+#
+
+from .packet import *
+
+# default cap on requests written before their responses are read
+MAX_IN_FLIGHT = 128
+
+# errors the server reports for a single request, the connection stays usable
+REQUEST_ERRORS = (TransactionAbort, InvalidReference, ObjectDoesNotExist, PacketError)
+
+
+# Reply Class: future-like handle for the response of one pipelined request
+class Reply:
+    # Function 1: Initializer
+    def __init__(self, pipeline):
+        self._pipeline = pipeline
+        self._done = False
+        self._value = None
+        self._error = None
+
+    # Function 2: Represent
+    def __repr__(self):
+        if not self._done:
+            return "<EasyDB Reply pending>"
+        if self._error is not None:
+            return "<EasyDB Reply error=%r>" % self._error
+        return "<EasyDB Reply value=%r>" % (self._value,)
+
+    # Function 3: True once the response has been read
+    def done(self):
+        return self._done
+
+    # Function 4: Value of the response, raises the error of the request
+    def result(self):
+        if not self._done:
+            self._pipeline.flush()
+        if self._error is not None:
+            raise self._error
+        return self._value
+
+    # Function 5: Error of the request, or None
+    def exception(self):
+        if not self._done:
+            self._pipeline.flush()
+        return self._error
+
+    def _set(self, value, error):
+        self._done = True
+        self._value = value
+        self._error = error
+
+
+# Pipeline Class
+class Pipeline:
+    # Data member 1: Database whose connection is used "_db"
+
+    # Data member 2: Encoded requests not sent yet "_buf", valid up to "_end"
+
+    # Data member 3: Response parser and reply of every queued request "_pending"
+    #                <list> of (<function>, <Reply>)
+
+    # Data member 4: Number of queued inserts, updates and drops "_writes"
+
+    # Data member 5: Pipeline flushed in place of this one "_group"
+    #                a ShardedPipeline that writes all of its shards before
+    #                reading any, or None
+
+    # Function 1: Initializer
+    def __init__(self, db, max_in_flight=MAX_IN_FLIGHT):
+        if type(max_in_flight) is not int:
+            raise TypeError("max_in_flight must be an int")
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self._db = db
+        self._max_in_flight = max_in_flight
+        self._buf = bytearray(4096)
+        self._end = 0
+        self._pending = []
+        self._writes = 0
+        self._group = None
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB Pipeline object, %d queued>" % len(self._pending)
+
+    # Function 3: Number of queued requests
+    def __len__(self):
+        return len(self._pending)
+
+    # Function 4: Context manager, sends what is left on a clean exit
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    # Function 5: Queue an insert, the reply holds (pk, version)
+    def insert(self, table_name, values):
+        codec = self._db._check_insert(table_name, values)
+        offset = self._reserve(codec.insert_size(values))
+        self._end = codec.pack_insert(self._buf, offset, values)
+        self._writes += 1
+        cache = self._db.cache
+        return self._queue(response_insert if cache is None else cache.track_insert(table_name, values))
+
+    # Function 6: Queue an update, the reply holds the new version
+    def update(self, table_name, pk, values, version=None):
+        codec = self._db._check_update(table_name, pk, values, version)
+        offset = self._reserve(codec.update_size(values))
+        self._end = codec.pack_update(self._buf, offset, pk, version, values)
+        self._writes += 1
+        cache = self._db.cache
+        return self._queue(response_update if cache is None else cache.track_update(table_name, pk, values))
+
+    # Function 7: Queue a drop, the reply holds None
+    def drop(self, table_name, pk):
+        self._append(encode_drop(self._db._check_drop(table_name, pk), pk))
+        self._writes += 1
+        cache = self._db.cache
+        return self._queue(response_drop if cache is None else cache.track_drop(table_name, pk))
+
+    # Function 8: Queue a get, the reply holds (values, version)
+    def get(self, table_name, pk):
+        index = self._db._check_get(table_name, pk)
+        parse = self._db.codecs[table_name].parse_get
+        cache = self._db.cache
+        if cache is not None:
+            # with no write queued ahead of it, a cached row is answered
+            # without a request
+            row = None if self._writes else cache.lookup(table_name, pk)
+            if row is not None:
+                reply = Reply(self)
+                reply._set(row, None)
+                return reply
+            parse = cache.track_get(table_name, pk, parse)
+        self._append(encode_get(index, pk))
+        return self._queue(parse)
+
+    # Function 9: Queue a scan, the reply holds the ids
+    def scan(self, table_name, op, column_name=None, value=None, container="list"):
+        check_container(container)
+        self._append(self._db._scan_request(table_name, op, column_name, value))
+        # a scan response has no size bound, so it is always read before
+        # anything else is written
+        return self._queue(lambda rbuf: response_scan(rbuf, container), True)
+
+    # Function 10: Send every queued request and read the responses in order
+    def flush(self):
+        if self._group is not None:
+            self._group.flush()
+        else:
+            self._receive(self._send())
+
+    # write the queued requests, returns what is pending on the responses
+    def _send(self):
+        if not self._pending:
+            return []
+        pending, self._pending = self._pending, []
+        self._writes = 0
+        end, self._end = self._end, 0
+        db = self._db
+        try:
+            if db._stream is not None:
+                db._settle()
+            with memoryview(self._buf) as view:
+                db._socket.sendall(view[:end])
+        except Exception as error:
+            for parse, reply in pending:
+                reply._set(None, error)
+            raise
+        return pending
+
+    # read the responses of the requests _send() wrote
+    def _receive(self, pending):
+        rbuf = self._db._rbuf
+        for i, (parse, reply) in enumerate(pending):
+            try:
+                value = parse(rbuf)
+            except REQUEST_ERRORS as error:
+                reply._set(None, error)
+            except Exception as error:
+                # the stream is broken, nothing after this can be read
+                for rest_parse, rest in pending[i:]:
+                    rest._set(None, error)
+                raise
+            else:
+                reply._set(value, None)
+
+    # Function 11: Drop the queued requests without sending them
+    def discard(self):
+        for parse, reply in self._pending:
+            reply._set(None, RuntimeError("Request discarded before it was sent"))
+        self._pending = []
+        self._end = 0
+        self._writes = 0
+
+    def _reserve(self, size):
+        offset = self._end
+        if offset + size > len(self._buf):
+            self._buf.extend(bytes(max(size, len(self._buf))))
+        return offset
+
+    def _append(self, data):
+        offset = self._reserve(len(data))
+        self._end = offset + len(data)
+        self._buf[offset:self._end] = data
+
+    def _queue(self, parse, closes_window=False):
+        reply = Reply(self)
+        self._pending.append((parse, reply))
+        if closes_window or len(self._pending) >= self._max_in_flight:
+            self.flush()
+        return reply
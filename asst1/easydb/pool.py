@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+#
+# pool.py
+#
+# Definition for the thread-safe connection pool in EasyDB client
+#
+
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from .easydb import Database
+from .exception import ServerBusy
+from .pipeline import REQUEST_ERRORS
+
+
+# Helper Function
+# Function 1: True if an idle connection can still be used
+def healthy(db):
+    if db._socket is None or len(db._rbuf) != 0:
+        # unread bytes mean the stream is out of step with the requests
+        return False
+    try:
+        data = db._socket.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+    except BlockingIOError:
+        return True  # nothing to read, the socket is open and quiet
+    except OSError:
+        return False
+    # b"" means the server closed the connection, anything else is stray data
+    return False
+
+
+# Function 2: Close a connection, ignoring a server that is already gone
+def discard(db):
+    try:
+        db.close()
+    except OSError:
+        if db._socket is not None:
+            db._socket.close()
+        db._socket = None
+        db._rbuf = None
+
+
+# Connection Pool Class
+class ConnectionPool:
+    # Data member 1: Database that holds the parsed schema "_schema"
+    #                <Database>, never connected
+
+    # Data member 2: Idle connections with the time they were checked in "_idle"
+    #                <list> of (<Database>, <float>)
+
+    # Data member 3: Number of connections handed out or idle "_size"
+
+    # Data member 4: Wait time and connection counters "_stats"
+    #                <dict> -> <str> : <int> or <float>
+
+    # Function 1: Initializer
+    #   min_idle: connections opened up front and kept ready, the idle
+    #       connections are topped up to it again when a broken or stale
+    #       one is closed
+    #   max_idle: connections kept open when returned, the rest are closed
+    #   max_size: connections open at once, checkout() waits beyond it
+    #   retries, backoff, max_backoff: SERVER_BUSY retry policy, the n-th
+    #       retry sleeps a random time up to min(max_backoff, backoff * 2^n)
+    #   idle_timeout: idle connections older than this are health-checked
+    def __init__(self, tables, host, port, min_idle=1, max_idle=4, max_size=8,
+                 retries=6, backoff=0.05, max_backoff=2.0, idle_timeout=30.0):
+        if not 0 <= min_idle <= max_idle <= max_size or max_size < 1:
+            raise ValueError("Need 0 <= min_idle <= max_idle <= max_size and max_size >= 1")
+        # the schema is validated once and shared by every connection
+        self._schema = tables if isinstance(tables, Database) else Database(tables)
+        self.host = host
+        self.port = port
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.max_size = max_size
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.idle_timeout = idle_timeout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._stats = {
+            "checkouts": 0, "waits": 0, "wait_time": 0.0, "max_wait": 0.0,
+            "opened": 0, "closed": 0, "busy_retries": 0, "stale": 0,
+        }
+        try:
+            for i in range(min_idle):
+                db = self._open()
+                with self._cond:
+                    self._size += 1
+                    self._idle.append((db, time.monotonic()))
+        except BaseException:
+            # the connections opened before the failure are not leaked
+            self.close()
+            raise
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB ConnectionPool %s:%s, %d open, %d idle>" % (
+            self.host, self.port, self._size, len(self._idle))
+
+    # Function 3: Take a connection out of the pool
+    #   Waits up to timeout seconds (forever if None) when max_size
+    #   connections are in use, then raises TimeoutError.
+    def checkout(self, timeout=None):
+        start = time.monotonic()
+        waited = False
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    db, since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    db = None
+                    break
+                waited = True
+                remaining = None if timeout is None else timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError("No connection available after %.3fs" % timeout)
+                self._cond.wait(remaining)
+            self._record_wait(time.monotonic() - start, waited)
+
+        # Connections are opened and checked outside the lock
+        try:
+            stale = db is not None and time.monotonic() - since > self.idle_timeout \
+                and not healthy(db)
+            if stale:
+                self._count("stale")
+                self._close(db)
+                db = None
+            if db is None:
+                db = self._open()
+        except BaseException:
+            self._release_slot()
+            raise
+        if stale:
+            self._refill()
+        return db
+
+    # Function 4: Give a connection back to the pool
+    #   broken: the connection is closed instead of reused
+    def checkin(self, db, broken=False):
+        if not broken and db._stream is not None:
+            # an unfinished scan stream is read off before reuse
+            try:
+                db._settle(True)
+            except OSError:
+                broken = True
+        if broken or db._socket is None:
+            self._close(db)
+            self._release_slot()
+            self._refill()
+            return
+        with self._cond:
+            if not self._closed and len(self._idle) < self.max_idle:
+                self._idle.append((db, time.monotonic()))
+                self._cond.notify()
+                return
+        self._close(db)
+        self._release_slot()
+
+    # Function 5: Context manager around checkout() and checkin()
+    @contextmanager
+    def connection(self, timeout=None):
+        db = self.checkout(timeout)
+        try:
+            yield db
+        except REQUEST_ERRORS:
+            # the server answered, the connection is still in step
+            self.checkin(db)
+            raise
+        except BaseException:
+            self.checkin(db, broken=True)
+            raise
+        else:
+            self.checkin(db)
+
+    # Function 6: Snapshot of the pool metrics
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["mean_wait"] = stats["wait_time"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    # Function 7: Close the idle connections, in-use ones close on checkin
+    def close(self):
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for db, since in idle:
+            self._close(db)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Function 8: Open a connection, retrying SERVER_BUSY with jittered backoff
+    def _open(self, retries=None):
+        if retries is None:
+            retries = self.retries
+        for attempt in range(retries + 1):
+            db = self._schema._clone()
+            if db.connect(self.host, self.port):
+                self._count("opened")
+                return db
+            if attempt == retries:
+                break
+            self._count("busy_retries")
+            time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        raise ServerBusy("Server busy after %d retries" % retries)
+
+    # Function 9: Open idle connections until there are min_idle again
+    #   A busy or unreachable server is not waited for, the next closed
+    #   connection tries again.
+    def _refill(self):
+        while True:
+            with self._cond:
+                if self._closed or len(self._idle) >= self.min_idle \
+                        or self._size >= self.max_size:
+                    return
+                self._size += 1
+            try:
+                db = self._open(0)
+            except (ServerBusy, OSError):
+                self._release_slot()
+                return
+            with self._cond:
+                if self._closed:
+                    self._size -= 1
+                else:
+                    self._idle.append((db, time.monotonic()))
+                    self._cond.notify()
+                    db = None
+            if db is not None:
+                self._close(db)
+                return
+
+    def _close(self, db):
+        discard(db)
+        self._count("closed")
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _count(self, name):
+        with self._cond:
+            self._stats[name] += 1
+
+    def _record_wait(self, wait, waited):
+        # called with the lock held
+        self._stats["checkouts"] += 1
+        self._stats["wait_time"] += wait
+        if waited:
+            self._stats["waits"] += 1
+        if wait > self._stats["max_wait"]:
+            self._stats["max_wait"] = wait
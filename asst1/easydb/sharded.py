@@ -0,0 +1,782 @@
+#!/usr/bin/python3
+#
+# sharded.py
+#
+# Definition for the client that spreads rows over several EasyDB servers
+#
+
+import bisect
+import hashlib
+from array import array
+from collections.abc import Sequence
+from .packet import *
+from .easydb import Database
+from .bulk import BulkResult, BULK_CHUNK, SCAN_MANY_CHUNK, MISSING_POLICIES, zeros
+from .columns import StringColumn, FETCH_MISSING
+from .pipeline import REQUEST_ERRORS, MAX_IN_FLIGHT
+from .cache import CACHE_ENTRIES
+from .stream import SCAN_CHUNK
+
+# the shard of a row is kept in the high bits of its pk, the pk the
+# server handed out in the low ones
+SHARD_BITS = 48
+LOCAL_MASK = (1 << SHARD_BITS) - 1
+MAX_SHARDS = 1 << (63 - SHARD_BITS)
+
+# points every server gets on the hash ring
+SHARD_VNODES = 64
+
+# what a scan operator keeps, given the row's value and the scanned one
+COMPARE = {operator.EQ: lambda a, b: a == b, operator.NE: lambda a, b: a != b,
+           operator.LT: lambda a, b: a < b, operator.GT: lambda a, b: a > b,
+           operator.LE: lambda a, b: a <= b, operator.GE: lambda a, b: a >= b}
+
+
+# Helper Function
+# Function 1: Position of a key on the hash ring, stable across processes
+def ring_point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# Function 2: Shard of a pk
+def shard_of(pk):
+    return pk >> SHARD_BITS
+
+
+# Function 3: Pk of a row given its shard and the pk its server handed out
+def global_pk(shard, pk):
+    return (shard << SHARD_BITS) | pk
+
+
+# Function 4: Ids of one shard made global, in the container they came in
+def globalize(ids, shard, container):
+    base = shard << SHARD_BITS
+    if base == 0:
+        return ids
+    if container == "numpy":
+        return ids + base
+    if container == "list":
+        return [pk + base for pk in ids]
+    return array("q", [pk + base for pk in ids])
+
+
+# Function 5: Foreign keys of one shard made global, like globalize but a
+#   key of 0 references nothing and stays 0
+def globalize_keys(keys, shard, container):
+    base = shard << SHARD_BITS
+    if base == 0:
+        return keys
+    if container == "numpy":
+        return keys + (keys != 0) * base
+    if container == "list":
+        return [key + base if key else key for key in keys]
+    return array("q", [key + base if key else key for key in keys])
+
+
+# Function 6: Join the columns of every shard, in shard order
+def merge(parts, container):
+    if parts and isinstance(parts[0], StringColumn):
+        return merge_strings(parts)
+    if container == "numpy":
+        if not parts:
+            return numpy.empty(0, dtype=numpy.int64)
+        return numpy.concatenate(parts)
+    if container == "list":
+        ret = []
+    else:
+        ret = array(parts[0].typecode if parts else "q")
+    for part in parts:
+        ret.extend(part)
+    return ret
+
+
+# Function 7: Join string columns, the offsets of every part are shifted
+def merge_strings(parts):
+    data = bytearray()
+    offsets = array("q", [0])
+    for part in parts:
+        shift = len(data)
+        offsets.extend(offset + shift for offset in part.offsets[1:])
+        data += part.data
+    if numpy is not None and type(parts[0].offsets) is not array:
+        offsets = numpy.frombuffer(offsets, dtype=numpy.int64)
+    return StringColumn(offsets, data)
+
+
+# Function 8: Values of a merged column at the given rows, in that order
+def take(column, order, container):
+    if all(i == row for i, row in enumerate(order)) and len(order) == len(column):
+        return column
+    if isinstance(column, StringColumn):
+        data = bytearray()
+        offsets = array("q", [0])
+        for i in order:
+            data += column.data[column.offsets[i]:column.offsets[i + 1]]
+            offsets.append(len(data))
+        if numpy is not None and type(column.offsets) is not array:
+            offsets = numpy.frombuffer(offsets, dtype=numpy.int64)
+        return StringColumn(offsets, data)
+    if container == "numpy":
+        return column[numpy.array(order, dtype=numpy.int64)]
+    if container == "list":
+        return [column[i] for i in order]
+    return array(column.typecode, [column[i] for i in order])
+
+
+# Sharded Database Class
+#   Same API as Database over several servers. connect() adds a server.
+#   Every row lives on one server: a row with a shard key follows the row
+#   its foreign key points at ("Account" follows "User"), any other row is
+#   placed by consistent hashing of its shard key column, or of the whole
+#   row. Foreign keys are only valid within a server, so every foreign key
+#   of a row must point at its own shard. Pks carry the shard in their high
+#   bits, gets, updates and drops go straight to the server of the pk, and
+#   scans are sent to every server before any response is read.
+class ShardedDatabase(Database):
+    # Data member 1: Connection of every shard "shards"
+    #                <list> of <Database>, a shard is its index
+
+    # Data member 2: Hash ring "_points" and the shard of every point "_owners"
+    #                <list> of <int>, sorted
+
+    # Data member 3: Shard key of every table "_keys"
+    #                <dict> -> <str> : (<int> column index or None, <bool> foreign)
+
+    # Data member 4: Foreign key columns of every table "_foreign"
+    #                <dict> -> <str> : <list> of <int>
+
+    # Function 1: Represent
+    def __repr__(self):
+        return "<EasyDB ShardedDatabase object, %d shards>" % len(self.shards)
+
+    # Function 2: Initializer
+    #   shard_keys: {table name: column name}, a table with foreign keys
+    #   and no entry follows its first foreign key
+    #   vnodes: points every server gets on the hash ring
+    def __init__(self, tables, shard_keys=None, vnodes=SHARD_VNODES):
+        super().__init__(tables)
+        if shard_keys is None:
+            shard_keys = {}
+        self.shards = []
+        self.vnodes = vnodes
+        self._points = []
+        self._owners = []
+        self._cache_args = None
+        self._keys = dict()
+        self._foreign = dict()
+        for table_name, types in self.num_type.items():
+            self._foreign[table_name] = [i for i, t in enumerate(types) if t == FOREIGN]
+        for table_name in shard_keys:
+            if table_name not in self.col_index:
+                raise PacketError("Illegal table name")
+            if shard_keys[table_name] not in self.col_index[table_name]:
+                raise PacketError("Illegal column name")
+        for table_name, foreign in self._foreign.items():
+            if table_name in shard_keys:
+                column = self.col_index[table_name][shard_keys[table_name]] - 1
+            elif foreign:
+                column = foreign[0]
+            else:
+                column = None
+            self._keys[table_name] = (column, column is not None and column in foreign)
+
+    # Function 3: Connector, adds a server as the next shard
+    def connect(self, host, port):
+        if len(self.shards) == MAX_SHARDS:
+            raise ValueError("At most %d shards" % MAX_SHARDS)
+        shard = self._clone()
+        if not shard.connect(host, port):
+            return False
+        if self._cache_args is not None:
+            shard.use_cache(*self._cache_args)
+        index = len(self.shards)
+        self.shards.append(shard)
+        ring = list(zip(self._points, self._owners))
+        ring += [(ring_point("%s:%s#%d" % (host, port, v)), index) for v in range(self.vnodes)]
+        ring.sort()
+        self._points = [point for point, owner in ring]
+        self._owners = [owner for point, owner in ring]
+        return True
+
+    # Function 4: Close every shard
+    def close(self):
+        for shard in self.shards:
+            shard.close()
+        self.shards = []
+        self._points = []
+        self._owners = []
+
+    # Function 5: Insert new row, returns the global (pk, version)
+    def insert(self, table_name, values):
+        self._check_insert(table_name, values)
+        shard = self._route(table_name, values)
+        pk, version = self.shards[shard].insert(table_name, self._localize(table_name, shard, values))
+        return global_pk(shard, pk), version
+
+    # Function 6: Update row on the shard of its pk
+    def update(self, table_name, pk, values, version=None):
+        self._check_update(table_name, pk, values, version)
+        shard, local = self._node(pk)
+        return self.shards[shard].update(table_name, local,
+                                         self._localize(table_name, shard, values), version)
+
+    # Function 7: Drop row on the shard of its pk
+    def drop(self, table_name, pk):
+        self._check_drop(table_name, pk)
+        shard, local = self._node(pk)
+        self.shards[shard].drop(table_name, local)
+
+    # Function 8: Get row from the shard of its pk
+    def get(self, table_name, pk):
+        self._check_get(table_name, pk)
+        shard, local = self._node(pk)
+        values, version = self.shards[shard].get(table_name, local)
+        return self._globalize(table_name, shard, values), version
+
+    # Function 9: Scan every shard that can hold a match in parallel
+    #   The ids come grouped by shard.
+    def scan(self, table_name, op, column_name=None, value=None, container="list"):
+        check_container(container)
+        self._scan_request(table_name, op, column_name, value)
+        routes = self._scan_routes(table_name, op, column_name, value)
+        for shard, op, value in routes:
+            db = self.shards[shard]
+            if db._stream is not None:
+                db._settle()
+            db._socket.sendall(self._scan_request(table_name, op, column_name, value))
+        parts = []
+        error = None
+        # every response is read, even after an error, to keep the shards in step
+        for shard, op, value in routes:
+            try:
+                ids = response_scan(self.shards[shard]._rbuf, container)
+            except REQUEST_ERRORS as e:
+                error = error or e
+            else:
+                parts.append(globalize(ids, shard, container))
+        if error is not None:
+            raise error
+        return merge(parts, container)
+
+    # Function 10: Scan that yields the ids in batches, shard after shard
+    def scan_iter(self, table_name, op, column_name=None, value=None,
+                  chunk_size=SCAN_CHUNK, container="list"):
+        check_container(container)
+        if type(chunk_size) is not int or chunk_size < 1:
+            raise ValueError("chunk_size must be a positive int")
+        self._scan_request(table_name, op, column_name, value)
+        routes = self._scan_routes(table_name, op, column_name, value)
+
+        def batches():
+            for shard, op, value in routes:
+                for ids in self.shards[shard].scan_iter(table_name, op, column_name, value,
+                                                        chunk_size, container):
+                    yield globalize(ids, shard, container)
+        return batches()
+
+    # Function 11: Pipeline routing every request to the shard it belongs to
+    def pipeline(self, max_in_flight=MAX_IN_FLIGHT):
+        return ShardedPipeline(self, max_in_flight)
+
+    # Function 12: Insert many rows, returns BulkResult(pks, versions, errors)
+    def insert_many(self, table_name, rows, chunk_size=BULK_CHUNK):
+        if not isinstance(rows, Sequence):
+            rows = list(rows)
+        errors = []
+        groups = {}
+        for i, values in enumerate(rows):
+            try:
+                self._check_insert(table_name, values)
+                shard = self._route(table_name, values)
+                values = self._localize(table_name, shard, values)
+            except (PacketError, InvalidReference) as error:
+                errors.append((i, error))
+            else:
+                groups.setdefault(shard, ([], []))
+                groups[shard][0].append(i)
+                groups[shard][1].append(values)
+        return self._scatter(len(rows), groups, errors, True,
+                             lambda db, items: db.insert_many(table_name, items, chunk_size))
+
+    # Function 13: Update many (pk, values, version) items
+    def update_many(self, table_name, items, chunk_size=BULK_CHUNK):
+        if not isinstance(items, Sequence):
+            items = list(items)
+        errors = []
+        groups = {}
+        for i, item in enumerate(items):
+            try:
+                if not isinstance(item, (tuple, list)) or len(item) != 3:
+                    raise PacketError("Not a (pk, values, version) item during update_many()")
+                pk, values, version = item
+                self._check_update(table_name, pk, values, version)
+                shard, local = self._node(pk)
+                values = self._localize(table_name, shard, values)
+            except (PacketError, InvalidReference, ObjectDoesNotExist) as error:
+                errors.append((i, error))
+            else:
+                groups.setdefault(shard, ([], []))
+                groups[shard][0].append(i)
+                groups[shard][1].append((local, values, version))
+        return self._scatter(len(items), groups, errors, True,
+                             lambda db, items: db.update_many(table_name, items, chunk_size))
+
+    # Function 14: Drop many rows, versions of the result is None
+    def drop_many(self, table_name, pks, chunk_size=BULK_CHUNK):
+        if not isinstance(pks, Sequence):
+            pks = list(pks)
+        errors = []
+        groups = {}
+        for i, pk in enumerate(pks):
+            try:
+                self._check_drop(table_name, pk)
+                shard, local = self._node(pk)
+            except (PacketError, ObjectDoesNotExist) as error:
+                errors.append((i, error))
+            else:
+                groups.setdefault(shard, ([], []))
+                groups[shard][0].append(i)
+                groups[shard][1].append(local)
+        return self._scatter(len(pks), groups, errors, False,
+                             lambda db, items: db.drop_many(table_name, items, chunk_size))
+
+    # Function 15: Get many rows, every shard in one pipelined pass
+    def get_many(self, table_name, pks, missing="skip", chunk_size=BULK_CHUNK):
+        if missing not in MISSING_POLICIES:
+            raise ValueError("missing must be one of %s" % ", ".join(MISSING_POLICIES))
+        if not isinstance(pks, Sequence):
+            pks = list(pks)
+        if table_name not in self.codecs:
+            raise PacketError("Not found table name during get_many()")
+        groups = {}
+        for i, pk in enumerate(pks):
+            if type(pk) is not int:
+                raise PacketError("Not correct id type during get_many()")
+            if shard_of(pk) < len(self.shards):
+                groups.setdefault(shard_of(pk), ([], []))
+                groups[shard_of(pk)][0].append(i)
+                groups[shard_of(pk)][1].append(pk & LOCAL_MASK)
+        rows = [None] * len(pks)
+        for shard, (positions, local) in groups.items():
+            found = self.shards[shard].get_many(table_name, local, "none", chunk_size)
+            for i, row in zip(positions, found):
+                if row is not None:
+                    rows[i] = self._globalize(table_name, shard, row[0]), row[1]
+        if missing == "raise" and None in rows:
+            raise ObjectDoesNotExist("Unexpected code %d during get_many()" % NOT_FOUND)
+        if missing == "skip":
+            rows = [row for row in rows if row is not None]
+        return rows
+
+    # Function 16: Run the same scan for many values, returns one result per value
+    #   The scans go out SCAN_MANY_CHUNK per shard at a time: a chunk is
+    #   written to every shard, then the previous chunk of every shard is
+    #   read, so all shards work at once as in bulk.stream.
+    def scan_many(self, table_name, op, column_name, values, container="list",
+                  chunk_size=SCAN_MANY_CHUNK):
+        check_container(container)
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if not isinstance(values, Sequence):
+            values = list(values)
+        # every scan is checked and encoded before any is sent
+        groups = {}
+        for i, value in enumerate(values):
+            self._scan_request(table_name, op, column_name, value)
+            for shard, shard_op, shard_value in self._scan_routes(table_name, op, column_name,
+                                                                   value):
+                groups.setdefault(shard, ([], []))
+                groups[shard][0].append(i)
+                groups[shard][1].append(self._scan_request(table_name, shard_op, column_name,
+                                                           shard_value))
+        parts = [dict() for value in values]
+        errors = []
+        shards = sorted(groups)
+        for shard in shards:
+            if self.shards[shard]._stream is not None:
+                self.shards[shard]._settle()
+
+        def read(shard, chunk):
+            positions = groups[shard][0]
+            for j in chunk:
+                try:
+                    ids = response_scan(self.shards[shard]._rbuf, container)
+                except REQUEST_ERRORS as error:
+                    errors.append(error)
+                else:
+                    parts[positions[j]][shard] = globalize(ids, shard, container)
+
+        in_flight = {}
+        longest = max([len(groups[shard][0]) for shard in shards] + [0])
+        for start in range(0, longest, chunk_size):
+            sent = {}
+            for shard in shards:
+                requests = groups[shard][1]
+                chunk = range(start, min(start + chunk_size, len(requests)))
+                if len(chunk):
+                    self.shards[shard]._socket.sendall(b"".join(requests[j] for j in chunk))
+                    sent[shard] = chunk
+            for shard, chunk in in_flight.items():
+                read(shard, chunk)
+            in_flight = sent
+        for shard, chunk in in_flight.items():
+            read(shard, chunk)
+        if errors:
+            raise errors[0]
+        return [merge([part[shard] for shard in sorted(part)], container) for part in parts]
+
+    # Function 17: Read some columns of many rows, in the order of pks
+    #   Every shard reads its rows in one pipelined pass, then the rows are
+    #   put back in input order, as get_many does.
+    def fetch_columns(self, table_name, pks, columns, container="array", missing="skip",
+                      chunk_size=BULK_CHUNK):
+        check_container(container)
+        if missing not in FETCH_MISSING:
+            raise ValueError("missing must be one of %s" % ", ".join(FETCH_MISSING))
+        if not isinstance(pks, Sequence):
+            pks = list(pks)
+        groups = {}
+        for i, pk in enumerate(pks):
+            if type(pk) is not int:
+                raise PacketError("Not correct id type during fetch_columns()")
+            if shard_of(pk) < len(self.shards):
+                groups.setdefault(shard_of(pk), ([], []))
+                groups[shard_of(pk)][0].append(i)
+                groups[shard_of(pk)][1].append(pk & LOCAL_MASK)
+            elif missing == "raise":
+                raise ObjectDoesNotExist("Unexpected code %d during fetch_columns()" % NOT_FOUND)
+        if not groups:
+            # an empty fetch still checks the table and the columns
+            return self._clone().fetch_columns(table_name, [], columns, container, missing)
+        foreign = set(self._foreign.get(table_name, ()))
+        col_index = self.col_index.get(table_name, {})
+        parts = {}
+        # row of the merged columns that holds every input position
+        rows = [None] * len(pks)
+        offset = 0
+        for shard in sorted(groups):
+            positions, local = groups[shard]
+            result = self.shards[shard].fetch_columns(table_name, local, columns,
+                                                      container, missing, chunk_size)
+            # a shard keeps the order it was asked in and skips missing rows
+            found = result["id"]
+            j = 0
+            for i, pk in zip(positions, local):
+                if j < len(found) and found[j] == pk:
+                    rows[i] = offset + j
+                    j += 1
+            offset += len(found)
+            for name, column in result.items():
+                if name == "id":
+                    column = globalize(column, shard, container)
+                elif col_index[name] - 1 in foreign:
+                    column = globalize_keys(column, shard, container)
+                parts.setdefault(name, []).append(column)
+        order = [row for row in rows if row is not None]
+        return dict((name, take(merge(column, container), order, container))
+                    for name, column in parts.items())
+
+    # Function 18: Cache the rows read by get and get_many on every shard
+    #   Returns a ShardedCache over the caches of every shard, the budgets
+    #   apply to each shard. use_cache(None, None) turns caching off.
+    def use_cache(self, max_entries=CACHE_ENTRIES, max_bytes=None):
+        if max_entries is None and max_bytes is None:
+            self._cache_args = None
+            self.cache = None
+        else:
+            self._cache_args = (max_entries, max_bytes)
+            self.cache = ShardedCache(self)
+        for shard in self.shards:
+            shard.use_cache(max_entries, max_bytes)
+        return self.cache
+
+    # Function 19: Shard and server pk of a pk
+    def _node(self, pk):
+        shard = shard_of(pk)
+        if shard >= len(self.shards):
+            raise ObjectDoesNotExist("Shard %d is not connected" % shard)
+        return shard, pk & LOCAL_MASK
+
+    # Function 20: Shard a new row goes to
+    def _route(self, table_name, values):
+        if not self.shards:
+            raise ConnectionError("No shard connected")
+        column, foreign = self._keys[table_name]
+        if foreign:
+            # the row follows the row its shard key points at
+            value = values[column]
+            if value != 0 and shard_of(value) < len(self.shards):
+                return shard_of(value)
+            # a row that references nothing is spread like a row without a key
+            column = None
+        key = repr((table_name, values[column] if column is not None else list(values)))
+        i = bisect.bisect(self._points, ring_point(key)) % len(self._points)
+        return self._owners[i]
+
+    # Function 21: Values with the foreign keys turned into server pks
+    def _localize(self, table_name, shard, values):
+        values = list(values)
+        for i in self._foreign[table_name]:
+            value = values[i]
+            # 0 references nothing
+            if type(value) is int and value != 0:
+                if shard_of(value) != shard:
+                    raise InvalidReference("Foreign key points at another shard")
+                values[i] = value & LOCAL_MASK
+        return values
+
+    # Function 22: Values read from a shard with the foreign keys made global
+    def _globalize(self, table_name, shard, values):
+        if shard == 0:
+            return values
+        values = list(values)
+        for i in self._foreign[table_name]:
+            if values[i]:
+                values[i] = global_pk(shard, values[i])
+        return values
+
+    # Function 23: Shards a scan has to run on, [(shard, op, value)]
+    #   A scan comparing pks, on "id" or a foreign key, runs with the server
+    #   pk on the shard of the value. Every pk of a lower shard is smaller
+    #   and every pk of a higher one larger, so on other shards the set
+    #   foreign keys all match or none do. A foreign key of 0 references
+    #   nothing and stays 0 on every shard, so it is compared on its own:
+    #   AL, NE 0, EQ 0 or no scan at all.
+    def _scan_routes(self, table_name, op, column_name, value):
+        shards = range(len(self.shards))
+        keyed = column_name == "id" or column_name in self.col_index.get(table_name, {}) and \
+            self.col_index[table_name][column_name] - 1 in self._foreign[table_name]
+        if op == operator.AL or not keyed or value == 0:
+            return [(shard, op, value) for shard in shards]
+        owner = shard_of(value)
+        # whether a foreign key of 0 matches, a pk is never 0
+        nulls = column_name != "id" and COMPARE[op](0, value)
+        routes = []
+        for shard in shards:
+            if shard == owner:
+                routes.append((shard, op, value & LOCAL_MASK))
+                continue
+            keys = COMPARE[op](shard, owner)
+            if keys and (nulls or column_name == "id"):
+                routes.append((shard, operator.AL, 0))
+            elif keys:
+                routes.append((shard, operator.NE, 0))
+            elif nulls:
+                routes.append((shard, operator.EQ, 0))
+        return routes
+
+    # Function 24: Run a bulk call on every shard, results in input order
+    #   groups: {shard: (input positions, items)}
+    #   has_versions: False for drops, whose result has versions None
+    def _scatter(self, count, groups, errors, has_versions, call):
+        pks = zeros(count)
+        versions = zeros(count) if has_versions else None
+        for shard, (positions, items) in groups.items():
+            result = call(self.shards[shard], items)
+            for j, i in enumerate(positions):
+                if result.pks[j]:
+                    pks[i] = global_pk(shard, result.pks[j])
+                if has_versions:
+                    versions[i] = result.versions[j]
+            errors.extend((positions[j], error) for j, error in result.errors)
+        for i, error in errors:
+            # a row that failed has no pk in the result
+            pks[i] = 0
+        errors.sort(key=lambda error: error[0])
+        return BulkResult(pks, versions, errors)
+
+
+# Sharded Cache Class: one view over the row cache of every shard
+#   Pks are global, as everywhere in ShardedDatabase. Rows are cached by
+#   the shard that read them, so lookups go to the cache of the pk's shard.
+class ShardedCache:
+    # Function 1: Initializer
+    def __init__(self, db):
+        self._db = db
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB ShardedCache object, %d rows, %d shards>" % (
+            len(self), len(self._caches()))
+
+    # Function 3: Number of cached rows
+    def __len__(self):
+        return sum(len(cache) for cache in self._caches())
+
+    # Function 4: Cached (values, version) of a row, or None on a miss
+    def lookup(self, table_name, pk):
+        cache = self._cache_of(pk)
+        if cache is None:
+            return None
+        entry = cache.lookup(table_name, pk & LOCAL_MASK)
+        if entry is None:
+            return None
+        return self._db._globalize(table_name, shard_of(pk), entry[0]), entry[1]
+
+    # Function 5: Forget a row whose cached copy may be stale
+    def invalidate(self, table_name, pk):
+        cache = self._cache_of(pk)
+        if cache is not None:
+            cache.invalidate(table_name, pk & LOCAL_MASK)
+
+    # Function 6: Forget every row
+    def clear(self):
+        for cache in self._caches():
+            cache.clear()
+
+    # Function 7: Metrics of every shard added up
+    def stats(self):
+        stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0,
+                 "entries": 0, "bytes": 0}
+        for cache in self._caches():
+            for name, value in cache.stats().items():
+                if name in stats:
+                    stats[name] += value
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _caches(self):
+        return [shard.cache for shard in self._db.shards if shard.cache is not None]
+
+    def _cache_of(self, pk):
+        if type(pk) is not int or not 0 <= shard_of(pk) < len(self._db.shards):
+            return None
+        return self._db.shards[shard_of(pk)].cache
+
+
+# Sharded Reply Class: reply made of the replies of one or more shards
+class ShardedReply:
+    # Function 1: Initializer
+    #   convert turns the result of every shard into the result
+    def __init__(self, replies, convert):
+        self._replies = replies
+        self._convert = convert
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB ShardedReply of %d shards>" % len(self._replies)
+
+    # Function 3: True once every response has been read
+    def done(self):
+        return all(reply.done() for reply in self._replies)
+
+    # Function 4: Value of the response, raises the error of the request
+    def result(self):
+        return self._convert([reply.result() for reply in self._replies])
+
+    # Function 5: Error of the request, or None
+    def exception(self):
+        for reply in self._replies:
+            error = reply.exception()
+            if error is not None:
+                return error
+        return None
+
+
+# Sharded Pipeline Class: one pipeline per shard, requests go where they belong
+#   The pipeline of every shard is flushed through this one, so a full
+#   window or a scan on one shard writes every shard before reading any.
+class ShardedPipeline:
+    # Function 1: Initializer
+    def __init__(self, db, max_in_flight=MAX_IN_FLIGHT):
+        self._db = db
+        self._pipes = [shard.pipeline(max_in_flight) for shard in db.shards]
+        self._holding = False
+        for pipe in self._pipes:
+            pipe._group = self
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB ShardedPipeline object, %d queued>" % len(self)
+
+    # Function 3: Number of queued requests
+    def __len__(self):
+        return sum(len(pipe) for pipe in self._pipes)
+
+    # Function 4: Context manager, sends what is left on a clean exit
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.discard()
+        return False
+
+    # Function 5: Queue an insert, the reply holds the global (pk, version)
+    def insert(self, table_name, values):
+        db = self._db
+        db._check_insert(table_name, values)
+        shard = db._route(table_name, values)
+        reply = self._pipes[shard].insert(table_name, db._localize(table_name, shard, values))
+        return ShardedReply([reply], lambda keys: (global_pk(shard, keys[0][0]), keys[0][1]))
+
+    # Function 6: Queue an update, the reply holds the new version
+    def update(self, table_name, pk, values, version=None):
+        db = self._db
+        db._check_update(table_name, pk, values, version)
+        shard, local = db._node(pk)
+        reply = self._pipes[shard].update(table_name, local,
+                                          db._localize(table_name, shard, values), version)
+        return ShardedReply([reply], lambda versions: versions[0])
+
+    # Function 7: Queue a drop, the reply holds None
+    def drop(self, table_name, pk):
+        self._db._check_drop(table_name, pk)
+        shard, local = self._db._node(pk)
+        return ShardedReply([self._pipes[shard].drop(table_name, local)], lambda values: None)
+
+    # Function 8: Queue a get, the reply holds (values, version)
+    def get(self, table_name, pk):
+        db = self._db
+        db._check_get(table_name, pk)
+        shard, local = db._node(pk)
+        reply = self._pipes[shard].get(table_name, local)
+        return ShardedReply([reply], lambda rows: (db._globalize(table_name, shard, rows[0][0]),
+                                                   rows[0][1]))
+
+    # Function 9: Queue a scan on every shard that can hold a match
+    def scan(self, table_name, op, column_name=None, value=None, container="list"):
+        db = self._db
+        check_container(container)
+        db._scan_request(table_name, op, column_name, value)
+        routes = db._scan_routes(table_name, op, column_name, value)
+        # the scan of every shard is queued before any is sent
+        self._holding = True
+        try:
+            replies = [self._pipes[shard].scan(table_name, op, column_name, value, container)
+                       for shard, op, value in routes]
+        finally:
+            self._holding = False
+        self.flush()
+        shards = [shard for shard, op, value in routes]
+        return ShardedReply(replies, lambda parts: merge(
+            [globalize(ids, shard, container) for shard, ids in zip(shards, parts)], container))
+
+    # Function 10: Send every queued request, every shard is written before
+    #   any response is read, so the shards work on them at the same time
+    def flush(self):
+        if self._holding:
+            return
+        sent = []
+        error = None
+        for pipe in self._pipes:
+            try:
+                sent.append((pipe, pipe._send()))
+            except Exception as e:
+                error = error or e
+        # every response is read, even after an error, to keep the shards in step
+        for pipe, pending in sent:
+            try:
+                pipe._receive(pending)
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            raise error
+
+    # Function 11: Drop the queued requests without sending them
+    def discard(self):
+        for pipe in self._pipes:
+            pipe.discard()
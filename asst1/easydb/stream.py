@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+#
+# stream.py
+#
+# Definition for the streaming scan iterator in EasyDB client
+#
+
+import weakref
+from .packet import *
+
+# default number of ids in one batch of a streamed scan
+SCAN_CHUNK = 8192
+
+
+# Helper Function
+# Function 1: Read and discard count ids, a batch at a time
+def skip_ids(rbuf, count, chunk_size=SCAN_CHUNK):
+    scratch = bytearray(8 * min(chunk_size, count))
+    with memoryview(scratch) as view:
+        while count:
+            n = min(chunk_size, count)
+            rbuf.read_into(view[:8 * n])
+            count -= n
+
+
+# Scan Stream Class: iterator over the ids of a scan in batches
+#   The ids are read off the socket one batch at a time. The connection
+#   cannot carry another response until the scan is read to its end, so a
+#   request made on the same Database while the stream is open first moves
+#   the unread ids into memory. close() discards them, and so does dropping
+#   the last reference to the stream.
+class ScanStream:
+    # Data member 1: Database whose connection carries the scan "_db"
+
+    # Data member 2: Ids still on the socket "_remaining"
+    #                <int>
+
+    # Data member 3: Ids moved into memory by another request "_spill"
+    #                <array> of 'q', read from "_spill_at"
+
+    # Function 1: Initializer, the header of the response is already read
+    def __init__(self, db, count, chunk_size, container):
+        self._db = db
+        self.count = count
+        self._remaining = count
+        self._chunk_size = chunk_size
+        self._container = container
+        self._spill = None
+        self._spill_at = 0
+        if count == 0:
+            self._db = None
+        else:
+            # the Database only holds a weak reference, an abandoned
+            # stream leaves its unread ids to be skipped
+            db._stream = weakref.ref(self)
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<EasyDB ScanStream object, %d of %d ids left>" % (self.left(), self.count)
+
+    # Function 3: Number of ids not yielded yet
+    def left(self):
+        spilled = 0 if self._spill is None else len(self._spill) - self._spill_at
+        return self._remaining + spilled
+
+    # Function 4: Iterator protocol, every step yields one batch of ids
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._spill is not None and self._spill_at < len(self._spill):
+            end = min(self._spill_at + self._chunk_size, len(self._spill))
+            ids = self._spill[self._spill_at:end]
+            self._spill_at = end
+            return self._convert(ids)
+        if self._remaining == 0:
+            self._detach()
+            raise StopIteration
+        n = min(self._chunk_size, self._remaining)
+        ids = read_ids(self._db._rbuf, n, self._container)
+        self._remaining -= n
+        if self._remaining == 0:
+            self._detach()
+        return ids
+
+    # Function 5: Context manager, closes the stream on exit
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Function 6: Stop iterating, the unread ids are discarded
+    def close(self):
+        self._spill = None
+        if self._remaining:
+            skip_ids(self._db._rbuf, self._remaining, self._chunk_size)
+            self._remaining = 0
+        self._detach()
+
+    def __del__(self):
+        # no socket I/O here, the Database skips the ids before its next request
+        if self._db is not None and self._remaining:
+            self._db._unread += self._remaining
+
+    # Called by the Database before it sends another request
+    def _settle(self):
+        self._spill = read_ids(self._db._rbuf, self._remaining, "array")
+        self._spill_at = 0
+        self._remaining = 0
+        self._detach()
+
+    def _detach(self):
+        if self._db is not None:
+            self._db._stream = None
+        self._db = None
+
+    def _convert(self, ids):
+        if self._container == "list":
+            return ids.tolist()
+        if self._container == "numpy":
+            return numpy.frombuffer(ids, dtype=numpy.int64)
+        return ids
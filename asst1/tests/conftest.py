@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+#
+# conftest.py
+#
+# Fixtures shared by the EasyDB client tests
+#
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import pytest
+import easydb
+from fakeserver import FakeServer, TABLES
+
+
+@pytest.fixture
+def server():
+    with FakeServer(TABLES) as srv:
+        yield srv
+
+
+@pytest.fixture
+def db(server):
+    db = easydb.Database(TABLES)
+    assert db.connect("localhost", server.port)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def users(db):
+    return [db.insert("User", ["first%d" % i, "last", 1.5 + i, i])[0] for i in range(5)]
@@ -0,0 +1,352 @@
+#!/usr/bin/python3
+#
+# fakeserver.py
+#
+# Definition for the in-process EasyDB server the client tests run against
+#
+
+import random
+import socket
+import struct
+import threading
+import time
+
+# commands
+INSERT, UPDATE, DROP, GET, SCAN, EXIT = 1, 2, 3, 4, 5, 6
+
+# response codes
+OK, NOT_FOUND, BAD_TABLE, BAD_QUERY, TXN_ABORT = 1, 2, 3, 4, 5
+BAD_VALUE, BAD_ROW, BAD_REQUEST, BAD_FOREIGN, SERVER_BUSY = 6, 7, 8, 9, 10
+
+# value types
+NULL, INTEGER, FLOAT, STRING, FOREIGN = 0, 1, 2, 3, 4
+
+# operators
+AL, EQ, NE, LT, GT, LE, GE = 1, 2, 3, 4, 5, 6, 7
+COMPARE = {EQ: lambda a, b: a == b, NE: lambda a, b: a != b,
+           LT: lambda a, b: a < b, GT: lambda a, b: a > b,
+           LE: lambda a, b: a <= b, GE: lambda a, b: a >= b}
+
+# largest request the asst3 server accepts
+MAX_PACKET_SIZE = 16384
+
+# schema of the client tests, asst3/default.txt and a table without strings
+TABLES = (
+    ("User", (
+        ("firstName", str),
+        ("lastName", str),
+        ("height", float),
+        ("age", int),
+    )),
+    ("Account", (
+        ("user", "User"),
+        ("type", str),
+        ("balance", float),
+    )),
+    ("Pt", (
+        ("x", float),
+        ("y", float),
+        ("n", int),
+    )),
+)
+
+
+class Malformed(Exception):
+    pass
+
+
+# Helper Function
+# Function 1: Read exactly n bytes, never past the current request
+def recv_exact(conn, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = conn.recv(n - len(data))
+        if not chunk:
+            raise EOFError
+        data += chunk
+    return bytes(data)
+
+
+# Function 2: Encode one value of a get response
+def encode_value(type_val, value):
+    if type_val == STRING:
+        data = value.encode("ascii")
+        data += b"\x00" * (-len(data) % 4)
+        return struct.pack("!ii", STRING, len(data)) + data
+    if type_val == FLOAT:
+        return struct.pack("!iid", FLOAT, 8, value)
+    return struct.pack("!iiq", type_val, 8, value)
+
+
+# Fake Server Class
+#   Speaks the EasyDB wire format on a local port and follows the rules of
+#   the asst3 server: one request is read at a time, so pipelined requests
+#   are answered in order; scans return ids in no particular order; only
+#   EQ and NE compare pks and foreign keys; more than max_clients open
+#   connections are answered SERVER_BUSY.
+class FakeServer:
+    # Data member 1: Columns of every table "tables"
+    #                <list> of (<str>, <list> of (<str>, <int> type, <int> or None target))
+
+    # Data member 2: Rows of every table "rows"
+    #                <list> of <dict> -> <int> : [<int> version, <list> values]
+
+    # Data member 3: Every request served "log"
+    #                <list> of (<int> command, <int> table id, <int> column, <int> op)
+
+    # Data member 4: When every request of the log arrived "arrivals"
+    #                <list> of <float>, time.monotonic()
+
+    # Function 1: Initializer, the server runs until close()
+    #   tables: the schema in the client's format
+    #   chunky: send every response in pieces of a few bytes
+    #   strict: False lets pks and foreign keys take range scans
+    #   delay: seconds every request takes before it is answered
+    def __init__(self, tables, max_clients=4, chunky=False, strict=True, delay=0.0):
+        names = [name for name, columns in tables]
+        self.tables = []
+        for name, columns in tables:
+            parsed = []
+            for column, kind in columns:
+                if type(kind) is str:
+                    parsed.append((column, FOREIGN, names.index(kind)))
+                else:
+                    parsed.append((column, {int: INTEGER, float: FLOAT, str: STRING}[kind], None))
+            self.tables.append((name, parsed))
+        self.rows = [dict() for table in tables]
+        self.max_clients = max_clients
+        self.chunky = chunky
+        self.strict = strict
+        self.delay = delay
+        self.log = []
+        self.arrivals = []
+        self.clients = 0
+        self.connections = 0
+        self._next = 1
+        self._lock = threading.Lock()
+        self._random = random.Random(7)
+        self._open = []
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("localhost", 0))
+        self._listener.listen(64)
+        self.port = self._listener.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Function 2: Stop listening and drop every connection
+    def close(self):
+        self._listener.close()
+        with self._lock:
+            for conn in self._open:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                conn.close()
+            self._open = []
+
+    # Function 3: Number of requests served of a command
+    def count(self, command):
+        with self._lock:
+            return sum(1 for entry in self.log if entry[0] == command)
+
+    # Function 4: Scans served as (column, op)
+    def scans(self):
+        with self._lock:
+            return [(column, op) for command, table, column, op in self.log if command == SCAN]
+
+    def _accept(self):
+        while True:
+            try:
+                conn, addr = self._listener.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        with self._lock:
+            busy = self.clients >= self.max_clients
+            if not busy:
+                self.clients += 1
+                self.connections += 1
+                self._open.append(conn)
+        try:
+            if busy:
+                conn.sendall(struct.pack("!i", SERVER_BUSY))
+                return
+            self._send(conn, struct.pack("!i", OK))
+            while True:
+                try:
+                    request = self._read_request(conn)
+                except Malformed:
+                    self._send(conn, struct.pack("!i", BAD_REQUEST))
+                    return
+                if request[0] == EXIT:
+                    return
+                response = self._handle(*request)
+                if self.delay:
+                    time.sleep(self.delay)
+                self._send(conn, response)
+        except (EOFError, OSError):
+            pass
+        finally:
+            if not busy:
+                with self._lock:
+                    self.clients -= 1
+                    if conn in self._open:
+                        self._open.remove(conn)
+            conn.close()
+
+    def _send(self, conn, data):
+        if not self.chunky:
+            conn.sendall(data)
+            return
+        i = 0
+        while i < len(data):
+            j = i + self._random.randint(1, 7)
+            conn.sendall(data[i:j])
+            i = j
+
+    # one request off the stream, as asst3 Network::receive reads it
+    def _read_request(self, conn):
+        command, table_id = struct.unpack("!ii", recv_exact(conn, 8))
+        size = [8]
+
+        def read(n):
+            size[0] += n
+            if size[0] > MAX_PACKET_SIZE:
+                raise Malformed
+            return recv_exact(conn, n)
+
+        def read_value():
+            type_val, length = struct.unpack("!ii", read(8))
+            if length < 0:
+                raise Malformed
+            data = read(length)
+            if type_val == NULL:
+                return NULL, None
+            if type_val in (INTEGER, FOREIGN):
+                return type_val, struct.unpack("!q", data)[0]
+            if type_val == FLOAT:
+                return type_val, struct.unpack("!d", data)[0]
+            if type_val == STRING:
+                return type_val, data.rstrip(b"\x00").decode("ascii")
+            raise Malformed
+
+        if command in (INSERT, UPDATE):
+            head = () if command == INSERT else struct.unpack("!qq", read(16))
+            count, = struct.unpack("!i", read(4))
+            return (command, table_id) + head + ([read_value() for i in range(count)],)
+        if command in (DROP, GET):
+            return command, table_id, struct.unpack("!q", read(8))[0]
+        if command == SCAN:
+            column, op = struct.unpack("!ii", read(8))
+            return command, table_id, column, op, read_value()
+        if command == EXIT:
+            return (EXIT,)
+        raise Malformed
+
+    def _handle(self, command, table_id, *args):
+        with self._lock:
+            column, op = (args[0], args[1]) if command == SCAN else (None, None)
+            self.log.append((command, table_id, column, op))
+            self.arrivals.append(time.monotonic())
+            if not 1 <= table_id <= len(self.tables):
+                return struct.pack("!i", BAD_TABLE)
+            table = table_id - 1
+            if command == INSERT:
+                return self._insert(table, args[0])
+            if command == UPDATE:
+                return self._update(table, *args)
+            if command == DROP:
+                if args[0] not in self.rows[table]:
+                    return struct.pack("!i", NOT_FOUND)
+                self._cascade(table, args[0])
+                return struct.pack("!i", OK)
+            if command == GET:
+                row = self.rows[table].get(args[0])
+                if row is None:
+                    return struct.pack("!i", NOT_FOUND)
+                columns = self.tables[table][1]
+                data = struct.pack("!iqi", OK, row[0], len(columns))
+                for (name, type_val, target), value in zip(columns, row[1]):
+                    data += encode_value(type_val, value)
+                return data
+            return self._scan(table, *args)
+
+    def _check(self, table, values):
+        columns = self.tables[table][1]
+        if len(values) != len(columns):
+            return BAD_ROW
+        for (type_val, value), (name, column_type, target) in zip(values, columns):
+            if type_val != column_type:
+                return BAD_VALUE
+            # a foreign key of 0 references nothing
+            if type_val == FOREIGN and value != 0 and value not in self.rows[target]:
+                return BAD_FOREIGN
+        return None
+
+    def _insert(self, table, values):
+        error = self._check(table, values)
+        if error is not None:
+            return struct.pack("!i", error)
+        pk = self._next
+        self._next += 1
+        self.rows[table][pk] = [1, [value for type_val, value in values]]
+        return struct.pack("!iqq", OK, pk, 1)
+
+    def _update(self, table, pk, version, values):
+        error = self._check(table, values)
+        if error is not None:
+            return struct.pack("!i", error)
+        row = self.rows[table].get(pk)
+        if row is None:
+            return struct.pack("!i", NOT_FOUND)
+        if version != 0 and version != row[0]:
+            return struct.pack("!i", TXN_ABORT)
+        row[0] += 1
+        row[1] = [value for type_val, value in values]
+        return struct.pack("!iq", OK, row[0])
+
+    def _cascade(self, table, pk):
+        if self.rows[table].pop(pk, None) is None:
+            return
+        for other, (name, columns) in enumerate(self.tables):
+            refs = [i for i, column in enumerate(columns)
+                    if column[1] == FOREIGN and column[2] == table]
+            if refs:
+                for child, row in list(self.rows[other].items()):
+                    if any(row[1][i] == pk for i in refs):
+                        self._cascade(other, child)
+
+    def _scan(self, table, column, op, value):
+        type_val, value = value
+        columns = self.tables[table][1]
+        if op == AL:
+            if column != 0:
+                return struct.pack("!i", BAD_QUERY)
+            ids = list(self.rows[table])
+        else:
+            if op not in COMPARE or not 0 <= column <= len(columns):
+                return struct.pack("!i", BAD_QUERY)
+            column_type = INTEGER if column == 0 else columns[column - 1][1]
+            if type_val != column_type:
+                return struct.pack("!i", BAD_QUERY)
+            keyed = column == 0 or column_type == FOREIGN
+            if self.strict and keyed and op not in (EQ, NE):
+                return struct.pack("!i", BAD_QUERY)
+            compare = COMPARE[op]
+            ids = [pk for pk, row in self.rows[table].items()
+                   if compare(pk if column == 0 else row[1][column - 1], value)]
+        # the asst3 server walks a hash map, so no order can be relied on
+        self._random.shuffle(ids)
+        return struct.pack("!ii%dq" % len(ids), OK, len(ids), *ids)
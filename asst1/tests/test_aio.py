@@ -0,0 +1,105 @@
+#!/usr/bin/python3
+#
+# test_aio.py
+#
+# Tests for the asyncio-native AsyncDatabase
+#
+
+import asyncio
+import struct
+import pytest
+import easydb
+from easydb import packet
+from easydb.aio import READ_SIZE
+from easydb.buffer import FeedBuffer, IncompleteResponse
+from fakeserver import FakeServer, TABLES, OK
+
+
+def run(server, body):
+    async def main():
+        async with easydb.AsyncDatabase(TABLES) as db:
+            assert await db.connect("localhost", server.port)
+            return await body(db)
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_resolve_in_order():
+    with FakeServer(TABLES, chunky=True) as srv:
+        async def body(db):
+            keys = await asyncio.gather(*(db.insert("User", ["u%d" % i, "l", 1.0, i])
+                                          for i in range(50)))
+            rows = await asyncio.gather(*(db.get("User", pk) for pk, version in keys))
+            ids = await db.scan("User", easydb.operator.EQ, "age", 7)
+            return keys, rows, ids
+        keys, rows, ids = run(srv, body)
+    assert [values[3] for values, version in rows] == list(range(50))
+    assert ids == [keys[7][0]]
+
+
+def test_errors_resolve_their_own_future(server):
+    async def body(db):
+        pk = (await db.insert("User", ["a", "b", 1.0, 1]))[0]
+        results = await asyncio.gather(db.get("User", 10 ** 6),
+                                       db.update("User", pk, ["a", "b", 1.0, 2], 7),
+                                       db.update("User", pk, ["a", "b", 1.0, 2]),
+                                       return_exceptions=True)
+        with pytest.raises(easydb.PacketError):
+            await db.insert("User", ["a"])
+        await db.drop("User", pk)
+        return results
+    missing, stale, version = run(server, body)
+    assert isinstance(missing, easydb.ObjectDoesNotExist)
+    assert isinstance(stale, easydb.TransactionAbort)
+    assert version == 2
+
+
+def test_busy_server():
+    with FakeServer(TABLES, max_clients=0) as srv:
+        async def main():
+            return await easydb.AsyncDatabase(TABLES).connect("localhost", srv.port)
+        assert asyncio.run(main()) is False
+
+
+def test_lost_connection_fails_pending_requests(server):
+    async def body(db):
+        await db.insert("User", ["a", "b", 1.0, 1])
+        server.close()
+        with pytest.raises(ConnectionError):
+            await db.get("User", 1)
+    run(server, body)
+
+
+def test_partial_scan_allocates_once(monkeypatch):
+    allocated = []
+    array = packet.array
+
+    def counted(typecode, data):
+        allocated.append(len(data))
+        return array(typecode, data)
+
+    monkeypatch.setattr(packet, "array", counted)
+    count = 100000
+    data = struct.pack("!ii", OK, count) + struct.pack("!%dq" % count, *range(count))
+    rbuf = FeedBuffer()
+    for start in range(0, len(data), READ_SIZE):
+        rbuf.feed(data[start:start + READ_SIZE])
+        position = rbuf.mark()
+        try:
+            ids = packet.response_scan(rbuf, "array")
+        except IncompleteResponse:
+            rbuf.rewind(position)
+    # the id block is allocated once, after all of it has arrived
+    assert allocated == [8 * count]
+    assert list(ids) == list(range(count)) and len(rbuf) == 0
+
+
+def test_wide_scan_through_the_stream():
+    with FakeServer(TABLES, chunky=True) as srv:
+        db = easydb.Database(TABLES)
+        db.connect("localhost", srv.port)
+        pks = list(db.insert_many("User", [["u", "l", 1.0, i] for i in range(20000)]).pks)
+        db.close()
+
+        async def body(db):
+            return await db.scan("User", easydb.operator.AL, container="array")
+        assert sorted(run(srv, body)) == pks
@@ -0,0 +1,84 @@
+#!/usr/bin/python3
+#
+# test_buffer.py
+#
+# Tests for the buffered, short-read-safe response reader
+#
+
+import struct
+import pytest
+import easydb
+from easydb.buffer import ReceiveBuffer, FeedBuffer, IncompleteResponse
+from fakeserver import FakeServer, TABLES
+
+
+# socket stand-in handing out at most step bytes per recv
+class Trickle:
+    def __init__(self, data, step):
+        self.data = data
+        self.step = step
+
+    def recv_into(self, view):
+        n = min(self.step, len(view), len(self.data))
+        view[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def test_unpack_across_short_reads():
+    rbuf = ReceiveBuffer(Trickle(struct.pack("!iqq", 1, 7, 3), 1), size=8)
+    assert rbuf.unpack(struct.Struct("!i")) == (1,)
+    assert rbuf.peek(struct.Struct("!q")) == (7,)
+    assert rbuf.unpack(struct.Struct("!q")) == (7,)
+    assert rbuf.read(8) == struct.pack("!q", 3)
+    assert len(rbuf) == 0
+
+
+def test_grows_for_wide_responses_and_clear_shrinks():
+    data = bytes(range(256)) * 10
+    rbuf = ReceiveBuffer(Trickle(data, 100), size=16)
+    assert rbuf.read(len(data)) == data
+    rbuf.clear()
+    assert len(rbuf._buf) == 16
+
+
+def test_read_into_bypasses_buffer():
+    data = bytes(range(200))
+    rbuf = ReceiveBuffer(Trickle(data, 3), size=16)
+    assert rbuf.read(5) == data[:5]
+    out = bytearray(195)
+    rbuf.read_into(memoryview(out))
+    assert bytes(out) == data[5:]
+    assert len(rbuf._buf) == 16
+
+
+def test_closed_connection_raises():
+    rbuf = ReceiveBuffer(Trickle(b"\x00\x00", 1))
+    with pytest.raises(ConnectionError):
+        rbuf.unpack(struct.Struct("!i"))
+
+
+def test_feed_buffer_rewinds_incomplete_responses():
+    fbuf = FeedBuffer(size=8)
+    fbuf.feed(struct.pack("!i", 1) + b"\x00\x00")
+    mark = fbuf.mark()
+    assert fbuf.unpack(struct.Struct("!i")) == (1,)
+    with pytest.raises(IncompleteResponse):
+        fbuf.unpack(struct.Struct("!q"))
+    fbuf.rewind(mark)
+    fbuf.feed(b"\x00" * 5 + b"\x09")
+    assert fbuf.unpack(struct.Struct("!iq")) == (1, 9)
+
+
+def test_client_over_chunked_responses():
+    with FakeServer(TABLES, chunky=True) as srv:
+        db = easydb.Database(TABLES)
+        db.connect("localhost", srv.port)
+        pks = [db.insert("User", ["name%d" % i, "x" * i, 1.0 * i, i])[0] for i in range(40)]
+        assert db.get("User", pks[7]) == (["name7", "x" * 7, 7.0, 7], 1)
+        assert sorted(db.scan("User", easydb.operator.AL)) == pks
+        assert db.update("User", pks[3], ["a", "b", 0.5, 1]) == 2
+        db.drop("User", pks[3])
+        with pytest.raises(easydb.ObjectDoesNotExist):
+            db.get("User", pks[3])
+        db.close()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+#
+# test_bulk.py
+#
+# Tests for insert_many, update_many and drop_many
+#
+
+import pytest
+import easydb
+from fakeserver import INSERT, UPDATE
+
+
+def rows(n):
+    return [["f%d" % i, "l", 1.0 * i, i] for i in range(n)]
+
+
+def test_insert_many_in_chunks(db, server):
+    result = db.insert_many("User", rows(50), chunk_size=7)
+    assert result.errors == []
+    assert len(set(result.pks)) == 50 and list(result.versions) == [1] * 50
+    assert [db.get("User", pk)[0][3] for pk in result.pks] == list(range(50))
+    assert server.count(INSERT) == 50
+    with pytest.raises(ValueError):
+        db.insert_many("User", rows(1), chunk_size=0)
+    with pytest.raises(easydb.PacketError):
+        db.insert_many("Nope", rows(1))
+
+
+def test_insert_many_records_errors_in_place(db, users):
+    batch = [["a", "b", 1.0, 1], ["a", "b", "bad", 1], ["a", "b", 2.0, 2]]
+    result = db.insert_many("User", batch)
+    assert [i for i, error in result.errors] == [1]
+    assert isinstance(result.errors[0][1], easydb.PacketError)
+    assert result.pks[1] == 0 and result.pks[0] and result.pks[2]
+    refs = db.insert_many("Account", [[users[0], "t", 1.0], [10 ** 6, "t", 1.0]])
+    assert [(i, type(error)) for i, error in refs.errors] == [(1, easydb.InvalidReference)]
+
+
+def test_update_many(db, users, server):
+    items = [(users[0], ["a", "b", 1.0, 1], None),
+             (users[1], ["a", "b", 1.0, 1], 1),
+             (users[2], ["a", "b", 1.0, 1], 5),
+             (10 ** 6, ["a", "b", 1.0, 1], None)]
+    result = db.update_many("User", items)
+    assert list(result.versions[:2]) == [2, 2]
+    assert [(i, type(error)) for i, error in result.errors] == \
+        [(2, easydb.TransactionAbort), (3, easydb.ObjectDoesNotExist)]
+    assert list(result.pks) == [users[0], users[1], users[2], 10 ** 6]
+
+
+def test_update_many_malformed_items(db, users, server):
+    items = [(users[0], ["a", "b", 1.0, 1], None),
+             (users[1], ["a", "b", 1.0, 1]),
+             None,
+             "abc",
+             (users[2], ["a", "b", 1.0, 1], None)]
+    result = db.update_many("User", items)
+    assert [(i, type(error)) for i, error in result.errors] == \
+        [(1, easydb.PacketError), (2, easydb.PacketError), (3, easydb.PacketError)]
+    assert result.versions[0] == 2 and result.versions[4] == 2
+    assert server.count(UPDATE) == 2
+
+
+def test_drop_many(db, users):
+    account = db.insert("Account", [users[0], "t", 1.0])[0]
+    result = db.drop_many("User", [users[0], users[0], "x", users[1]])
+    assert result.versions is None
+    assert list(result.pks) == [users[0], users[0], 0, users[1]]
+    assert [(i, type(error)) for i, error in result.errors] == \
+        [(1, easydb.ObjectDoesNotExist), (2, easydb.PacketError)]
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        db.get("Account", account)
+    assert sorted(db.scan("User", easydb.operator.AL)) == users[2:]
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+#
+# test_cache.py
+#
+# Tests for the version-aware client-side row cache
+#
+
+import pytest
+import easydb
+from fakeserver import FakeServer, GET, TABLES
+
+
+def test_reads_are_cached_and_writes_refresh_them(db, users, server):
+    cache = db.use_cache()
+    assert db.get("User", users[0])[0][0] == "first0"
+    gets = server.count(GET)
+    values, version = db.get("User", users[0])
+    values[0] = "changed locally"
+    assert db.get("User", users[0]) == (["first0", "last", 1.5, 0], 1)
+    version = db.update("User", users[0], ["new", "last", 1.5, 0], version)
+    assert db.get("User", users[0]) == (["new", "last", 1.5, 0], version)
+    assert server.count(GET) == gets
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+
+def test_aborted_update_invalidates(db, users):
+    other = db._clone()
+    cache = db.use_cache()
+    db.get("User", users[0])
+    other.connect("localhost", db._socket.getpeername()[1])
+    other.update("User", users[0], ["theirs", "last", 1.5, 0])
+    # writes of other clients are not seen until a conflict shows them
+    assert db.get("User", users[0])[0][0] == "first0"
+    with pytest.raises(easydb.TransactionAbort):
+        db.update("User", users[0], ["mine", "last", 1.5, 0], 1)
+    assert len(cache) == 0
+    assert db.get("User", users[0]) == (["theirs", "last", 1.5, 0], 2)
+    other.close()
+
+
+def test_drop_evicts_the_cascade(db, users):
+    cache = db.use_cache()
+    account = db.insert("Account", [users[0], "t", 1.0])[0]
+    db.get("User", users[0])
+    db.get("Account", account)
+    db.get("User", users[1])
+    db.drop("User", users[0])
+    assert cache.lookup("Account", account) is None
+    assert cache.lookup("User", users[1]) is not None
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        db.get("Account", account)
+
+
+def test_lru_budgets(db, users):
+    cache = db.use_cache(max_entries=2)
+    for pk in users[:3]:
+        db.get("User", pk)
+    assert len(cache) == 2 and cache.lookup("User", users[0]) is None
+    assert cache.stats()["evictions"] == 1
+    small = db.use_cache(max_entries=None, max_bytes=100)
+    db.get("User", users[0])
+    db.get("User", users[1])
+    assert len(small) == 1 and small.stats()["bytes"] <= 100
+    assert db.use_cache(None, None) is None and db.cache is None
+    with pytest.raises(ValueError):
+        db.use_cache(max_entries=0)
+
+
+def test_bulk_and_pipeline_paths(db, users, server):
+    cache = db.use_cache()
+    rows = db.get_many("User", users)
+    gets = server.count(GET)
+    assert db.get_many("User", users) == rows
+    with db.pipeline() as pipe:
+        reply = pipe.get("User", users[1])
+    assert reply.result() == rows[1] and server.count(GET) == gets
+    db.update_many("User", [(users[2], ["x", "y", 1.0, 1], None)])
+    assert db.get("User", users[2]) == (["x", "y", 1.0, 1], 2)
+    db.drop_many("User", users[3:])
+    assert len(cache) == 3
@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+#
+# test_codec.py
+#
+# Tests for the precompiled per-table row codecs
+#
+
+import struct
+import pytest
+import easydb
+from easydb.codec import RowCodec
+from easydb.packet import INSERT, UPDATE, SCAN, INTEGER, FLOAT, STRING, FOREIGN, operator, \
+    encode_scan
+from fakeserver import FakeServer
+
+MIXED = (
+    ("Parent", (("n", int),)),
+    ("Row", (
+        ("a", int),
+        ("name", str),
+        ("b", float),
+        ("parent", "Parent"),
+        ("tag", str),
+    )),
+)
+
+
+# the request as a straightforward value-by-value encoder would write it
+def reference_body(types, values):
+    data = b""
+    for type_val, value in zip(types, values):
+        if type_val == STRING:
+            raw = value.encode("ascii")
+            raw += b"\x00" * (-len(raw) % 4)
+            data += struct.pack("!ii", STRING, len(raw)) + raw
+        elif type_val == FLOAT:
+            data += struct.pack("!iid", FLOAT, 8, value)
+        else:
+            data += struct.pack("!iiq", type_val, 8, value)
+    return data
+
+
+@pytest.mark.parametrize("types, values", [
+    ((INTEGER, FLOAT, FOREIGN), [3, 2.5, 9]),
+    ((INTEGER, STRING, FLOAT, FOREIGN, STRING), [1, "abc", 0.25, 4, ""]),
+    ((STRING,), ["four"]),
+])
+def test_encode_matches_reference(types, values):
+    codec = RowCodec(2, types)
+    body = reference_body(types, values)
+    assert bytes(codec.encode_insert(values)) == struct.pack("!iii", INSERT, 2, len(types)) + body
+    assert bytes(codec.encode_update(5, None, values)) == \
+        struct.pack("!iiqqi", UPDATE, 2, 5, 0, len(types)) + body
+    assert codec.insert_size(values) == 12 + len(body)
+    assert codec.update_size(values) == 28 + len(body)
+
+
+def test_validate_messages():
+    codec = RowCodec(1, (INTEGER, FOREIGN))
+    codec.validate([1, 2], "insert")
+    with pytest.raises(easydb.PacketError, match="number mismatch during insert"):
+        codec.validate([1], "insert")
+    with pytest.raises(easydb.PacketError, match="update\\(\\): foreign"):
+        codec.validate([1, "2"], "update")
+    with pytest.raises(easydb.PacketError, match="mismatch during insert\\(\\)$"):
+        codec.validate([1.0, 2], "insert")
+
+
+def test_round_trip_through_server():
+    with FakeServer(MIXED) as srv:
+        db = easydb.Database(MIXED)
+        db.connect("localhost", srv.port)
+        parent = db.insert("Parent", [4])[0]
+        assert db.get("Parent", parent) == ([4], 1)
+        row = [7, "hello", -1.5, parent, "abcd"]
+        pk, version = db.insert("Row", row)
+        assert db.get("Row", pk) == (row, version)
+        assert db.update("Row", pk, [8, "", 2.0, parent, "x"], version) == 2
+        assert db.get("Row", pk) == ([8, "", 2.0, parent, "x"], 2)
+        with pytest.raises(easydb.PacketError):
+            db.insert("Row", [7, 1, -1.5, parent, "abcd"])
+        with pytest.raises(easydb.InvalidReference):
+            db.insert("Row", [7, "a", -1.5, parent + 100, "b"])
+        db.close()
+
+
+@pytest.mark.parametrize("value", ["", "a", "abc", "four", "fives"])
+def test_scan_strings_pad_like_rows(value):
+    # the scan operand is one value of the row body
+    codec = RowCodec(2, (STRING,))
+    body = bytes(codec.encode_insert([value]))[12:]
+    assert encode_scan(2, operator.EQ, 1, value, STRING) == \
+        struct.pack("!iiii", SCAN, 2, 1, operator.EQ) + body
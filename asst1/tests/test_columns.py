@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+#
+# test_columns.py
+#
+# Tests for fetch_columns, the columnar fetch
+#
+
+from array import array
+import pytest
+import easydb
+from easydb.columns import StringColumn
+from fakeserver import GET
+
+
+@pytest.fixture
+def accounts(db, users):
+    rows = [[users[i % 5], "type%d" % (i % 3), 0.5 * i] for i in range(2000)]
+    return list(db.insert_many("Account", rows).pks)
+
+
+def test_array_columns(db, users, accounts, server):
+    gets = server.count(GET)
+    result = db.fetch_columns("Account", accounts, ["balance", "user", "type"])
+    assert server.count(GET) - gets == len(accounts)
+    assert type(result["balance"]) is array and result["balance"].typecode == "d"
+    assert type(result["user"]) is array and result["user"].typecode == "q"
+    assert list(result["id"]) == accounts
+    assert list(result["balance"]) == [0.5 * i for i in range(2000)]
+    assert list(result["user"]) == [users[i % 5] for i in range(2000)]
+    types = result["type"]
+    assert type(types) is StringColumn and len(types.data) == len("type0") * 2000
+    assert types[4] == "type1" and types[-1] == "type%d" % (1999 % 3)
+
+
+def test_list_container_and_order(db, users):
+    pks = list(reversed(users))
+    result = db.fetch_columns("User", pks, ["age", "firstName", "height"], "list")
+    assert result == {"id": pks, "age": [4, 3, 2, 1, 0],
+                      "firstName": ["first%d" % i for i in (4, 3, 2, 1, 0)],
+                      "height": [5.5, 4.5, 3.5, 2.5, 1.5]}
+
+
+def test_numpy_container(db, users, accounts):
+    numpy = pytest.importorskip("numpy")
+    result = db.fetch_columns("Account", accounts[::10], ["balance", "type"], "numpy")
+    assert result["balance"].dtype == numpy.float64 and result["id"].dtype == numpy.int64
+    assert result["balance"].sum() == sum(0.5 * i for i in range(0, 2000, 10))
+    assert isinstance(result["type"].offsets, numpy.ndarray)
+    assert list(result["type"])[:3] == ["type0", "type1", "type2"]
+
+
+def test_missing_rows(db, users):
+    pks = [users[0], 10 ** 6, users[2]]
+    assert db.fetch_columns("User", pks, ["age"], "list") == {"id": [users[0], users[2]],
+                                                             "age": [0, 2]}
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        db.fetch_columns("User", pks, ["age"], missing="raise")
+    assert db.fetch_columns("User", [], ["age"], "list") == {"id": [], "age": []}
+
+
+def test_bad_arguments(db, users):
+    with pytest.raises(easydb.PacketError):
+        db.fetch_columns("Nope", users, ["age"])
+    with pytest.raises(easydb.PacketError):
+        db.fetch_columns("User", users, ["weight"])
+    with pytest.raises(easydb.PacketError):
+        db.fetch_columns("User", ["1"], ["age"])
+    with pytest.raises(ValueError):
+        db.fetch_columns("User", users, ["age"], container="tuple")
+    with pytest.raises(ValueError):
+        db.fetch_columns("User", users, ["age"], missing="ignore")
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+#
+# test_get_many.py
+#
+# Tests for get_many
+#
+
+import pytest
+import easydb
+from fakeserver import FakeServer, GET, TABLES
+
+
+def test_rows_in_input_order(db, users, server):
+    pks = users[::-1] + [users[2]]
+    rows = db.get_many("User", pks, chunk_size=2)
+    assert [values[0] for values, version in rows] == \
+        ["first4", "first3", "first2", "first1", "first0", "first2"]
+    assert server.count(GET) == 6
+    assert db.get_many("User", []) == []
+
+
+def test_missing_policies(db, users):
+    pks = [users[0], 10 ** 6, users[1]]
+    assert [row[0][0] for row in db.get_many("User", pks)] == ["first0", "first1"]
+    rows = db.get_many("User", pks, missing="none")
+    assert rows[1] is None and rows[2][0][0] == "first1"
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        db.get_many("User", pks, missing="raise")
+    # every response was read, the connection is still usable
+    assert db.get("User", users[3])[0][0] == "first3"
+    with pytest.raises(ValueError):
+        db.get_many("User", pks, missing="ignore")
+    with pytest.raises(easydb.PacketError):
+        db.get_many("User", [users[0], "1"])
+
+
+def test_fixed_width_rows_over_chunked_responses():
+    with FakeServer(TABLES, chunky=True) as srv:
+        db = easydb.Database(TABLES)
+        db.connect("localhost", srv.port)
+        pks = db.insert_many("Pt", [[0.5 * i, -1.0 * i, i] for i in range(300)]).pks
+        rows = db.get_many("Pt", list(pks), chunk_size=64)
+        assert [values for values, version in rows] == \
+            [[0.5 * i, -1.0 * i, i] for i in range(300)]
+        assert srv.count(GET) == 300
+        db.close()
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+#
+# test_pipeline.py
+#
+# Tests for request pipelining on Database
+#
+
+import pytest
+import easydb
+from easydb.packet import operator
+from fakeserver import GET, INSERT
+
+
+def test_replies_in_order(db, server):
+    with db.pipeline() as pipe:
+        inserts = [pipe.insert("User", ["u%d" % i, "l", 1.0, i]) for i in range(300)]
+    pks = [reply.result()[0] for reply in inserts]
+    assert pks == sorted(pks) and len(set(pks)) == 300
+    with db.pipeline(max_in_flight=64) as pipe:
+        gets = [pipe.get("User", pk) for pk in pks]
+    assert [reply.result()[0][3] for reply in gets] == list(range(300))
+    assert server.count(INSERT) == 300 and server.count(GET) == 300
+
+
+def test_request_errors_stay_on_their_reply(db, users):
+    pipe = db.pipeline()
+    first = pipe.get("User", users[0])
+    missing = pipe.get("User", 10 ** 6)
+    stale = pipe.update("User", users[1], ["a", "b", 1.0, 1], version=9)
+    bad_ref = pipe.insert("Account", [10 ** 6, "t", 1.0])
+    last = pipe.get("User", users[2])
+    assert not last.done()
+    pipe.flush()
+    assert first.result()[0][0] == "first0"
+    assert isinstance(missing.exception(), easydb.ObjectDoesNotExist)
+    with pytest.raises(easydb.TransactionAbort):
+        stale.result()
+    assert isinstance(bad_ref.exception(), easydb.InvalidReference)
+    assert last.result()[0][0] == "first2"
+    # the connection is still in step with the server
+    assert db.get("User", users[3])[0][0] == "first3"
+
+
+def test_window_and_scan_flush(db, users):
+    pipe = db.pipeline(max_in_flight=2)
+    a = pipe.get("User", users[0])
+    assert not a.done() and len(pipe) == 1
+    b = pipe.get("User", users[1])
+    assert a.done() and b.done() and len(pipe) == 0
+    c = pipe.get("User", users[2])
+    ids = pipe.scan("User", operator.AL)
+    assert c.done() and sorted(ids.result()) == users
+    assert type(ids.result()) is list
+
+
+def test_result_flushes_and_discard(db, users, server):
+    pipe = db.pipeline()
+    reply = pipe.get("User", users[0])
+    assert reply.result()[0][0] == "first0"
+    dropped = pipe.drop("User", users[1])
+    pipe.discard()
+    with pytest.raises(RuntimeError):
+        dropped.result()
+    assert db.get("User", users[1])[0][0] == "first1"
+    with pytest.raises(ValueError):
+        db.pipeline(max_in_flight=0)
+
+
+def test_exception_in_block_discards(db, users):
+    with pytest.raises(KeyError):
+        with db.pipeline() as pipe:
+            pipe.drop("User", users[0])
+            raise KeyError
+    assert db.get("User", users[0])[1] == 1
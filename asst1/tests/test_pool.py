@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+#
+# test_pool.py
+#
+# Tests for the thread-safe connection pool
+#
+
+import socket
+import threading
+import time
+import pytest
+import easydb
+from fakeserver import FakeServer, TABLES
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_warm_up_and_reuse(server):
+    with easydb.ConnectionPool(TABLES, "localhost", server.port, min_idle=2) as pool:
+        assert pool.stats()["idle"] == 2 and server.connections == 2
+        with pool.connection() as db:
+            pk = db.insert("User", ["a", "b", 1.0, 1])[0]
+        with pool.connection() as db:
+            assert db.get("User", pk)[0][0] == "a"
+        stats = pool.stats()
+        assert stats["opened"] == 2 and stats["checkouts"] == 2 and stats["in_use"] == 0
+    wait_for(lambda: server.clients == 0)
+
+
+def test_request_errors_keep_the_connection(server):
+    with easydb.ConnectionPool(TABLES, "localhost", server.port) as pool:
+        with pytest.raises(easydb.ObjectDoesNotExist):
+            with pool.connection() as db:
+                db.get("User", 10 ** 6)
+        assert pool.stats()["closed"] == 0
+        with pytest.raises(KeyError):
+            with pool.connection() as db:
+                raise KeyError
+        # the broken connection is replaced to keep min_idle ready
+        stats = pool.stats()
+        assert stats["closed"] == 1 and stats["size"] == 1 and stats["idle"] == 1
+
+
+def test_checkout_waits_for_max_size(server):
+    pool = easydb.ConnectionPool(TABLES, "localhost", server.port, min_idle=0, max_idle=1,
+                                 max_size=1)
+    db = pool.checkout()
+    with pytest.raises(TimeoutError):
+        pool.checkout(timeout=0.05)
+    threading.Timer(0.05, pool.checkin, (db,)).start()
+    assert pool.checkout(timeout=5) is db
+    # the checkout that timed out is not counted
+    assert pool.stats()["waits"] == 1
+    pool.close()
+
+
+def test_many_threads_share_few_connections(server):
+    pool = easydb.ConnectionPool(TABLES, "localhost", server.port, max_idle=3,
+                                 max_size=3)
+    with pool.connection() as db:
+        pk = db.insert("User", ["a", "b", 1.0, 1])[0]
+    errors = []
+
+    def work():
+        try:
+            for i in range(20):
+                with pool.connection() as db:
+                    assert db.get("User", pk)[0][0] == "a"
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=work) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == [] and server.connections <= 3
+    pool.close()
+
+
+def test_server_busy_backoff():
+    with FakeServer(TABLES, max_clients=1) as srv:
+        pool = easydb.ConnectionPool(TABLES, "localhost", srv.port, max_idle=2,
+                                     max_size=2, retries=2, backoff=0.001)
+        held = pool.checkout()
+        with pytest.raises(easydb.ServerBusy):
+            pool.checkout()
+        assert pool.stats()["busy_retries"] == 2 and pool.stats()["size"] == 1
+        pool.checkin(held)
+        pool.close()
+
+
+def test_failed_warm_up_closes_what_it_opened():
+    with FakeServer(TABLES, max_clients=2) as srv:
+        with pytest.raises(easydb.ServerBusy):
+            easydb.ConnectionPool(TABLES, "localhost", srv.port, min_idle=3, max_idle=3,
+                                  retries=0)
+        assert srv.connections == 2
+        wait_for(lambda: srv.clients == 0)
+
+
+def test_stale_idle_connection_is_replaced(server):
+    pool = easydb.ConnectionPool(TABLES, "localhost", server.port, idle_timeout=0)
+    wait_for(lambda: server.clients == 1)
+    server._open[0].shutdown(socket.SHUT_RDWR)
+    wait_for(lambda: server.clients == 0)
+    with pool.connection() as db:
+        assert db.scan("User", easydb.operator.AL) == []
+    # one replaces the stale connection, one refills the idle ones
+    assert pool.stats()["stale"] == 1 and server.connections == 3
+    assert pool.stats()["idle"] == 2
+    pool.close()
+
+
+def test_broken_connections_are_refilled(server):
+    pool = easydb.ConnectionPool(TABLES, "localhost", server.port, min_idle=2, max_idle=3)
+    held = [pool.checkout() for i in range(3)]
+    assert pool.stats()["idle"] == 0
+    pool.checkin(held[0], broken=True)
+    pool.checkin(held[1], broken=True)
+    stats = pool.stats()
+    assert stats["idle"] == 2 and stats["size"] == 3 and stats["closed"] == 2
+    # a healthy checkin goes back to the idle ones without opening more
+    pool.checkin(held[2])
+    assert pool.stats()["opened"] == 5 and pool.stats()["idle"] == 3
+    pool.close()
+    wait_for(lambda: server.clients == 0)
+
+
+def test_refill_gives_up_on_an_unreachable_server(server):
+    pool = easydb.ConnectionPool(TABLES, "localhost", server.port, retries=3, backoff=1.0)
+    db = pool.checkout()
+    # a port nothing listens on
+    free = socket.socket()
+    free.bind(("localhost", 0))
+    pool.port = free.getsockname()[1]
+    free.close()
+    start = time.monotonic()
+    # the failed refill neither waits nor raises into checkin
+    pool.checkin(db, broken=True)
+    assert time.monotonic() - start < 1.0
+    stats = pool.stats()
+    assert stats["size"] == 0 and stats["idle"] == 0 and stats["busy_retries"] == 0
+    pool.close()
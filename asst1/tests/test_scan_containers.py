@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+#
+# test_scan_containers.py
+#
+# Tests for the list, array and numpy containers of scan results
+#
+
+from array import array
+import pytest
+import easydb
+from easydb import packet
+from easydb.packet import operator
+
+
+@pytest.fixture
+def points(db):
+    # wider than the receive buffer, so the id block is read around it
+    return list(db.insert_many("Pt", [[1.0, 2.0, i % 3] for i in range(9000)]).pks)
+
+
+def test_list_is_the_default(db, points):
+    ids = db.scan("Pt", operator.AL)
+    assert type(ids) is list and sorted(ids) == points
+    assert db.scan("Pt", operator.EQ, "n", 7) == []
+
+
+def test_array_container(db, points):
+    ids = db.scan("Pt", operator.EQ, "n", 1, container="array")
+    assert type(ids) is array and ids.typecode == "q"
+    assert sorted(ids) == points[1::3]
+    with db.pipeline() as pipe:
+        reply = pipe.scan("Pt", operator.EQ, "n", 2, container="array")
+    assert sorted(reply.result()) == points[2::3]
+    assert [sorted(ids) for ids in db.scan_many("Pt", operator.EQ, "n", [0, 5], "array")] == \
+        [points[0::3], []]
+
+
+def test_bad_container(db):
+    with pytest.raises(ValueError):
+        db.scan("Pt", operator.AL, container="tuple")
+
+
+def test_numpy_without_numpy(db, monkeypatch):
+    monkeypatch.setattr(packet, "numpy", None)
+    with pytest.raises(ImportError):
+        db.scan("Pt", operator.AL, container="numpy")
+    # nothing was sent, the connection is still in step
+    assert db.scan("Pt", operator.AL) == []
+
+
+def test_numpy_container(db, points):
+    numpy = pytest.importorskip("numpy")
+    ids = db.scan("Pt", operator.AL, container="numpy")
+    assert isinstance(ids, numpy.ndarray) and ids.dtype == numpy.int64
+    assert sorted(ids.tolist()) == points
+    empty = db.scan("Pt", operator.EQ, "n", 9, container="numpy")
+    assert empty.shape == (0,)
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+#
+# test_scan_iter.py
+#
+# Tests for scan_iter, the streaming scan iterator
+#
+
+import gc
+import pytest
+import easydb
+from easydb.packet import operator
+
+
+@pytest.fixture
+def points(db):
+    return list(db.insert_many("Pt", [[0.0, 0.0, i % 2] for i in range(1000)]).pks)
+
+
+def test_batches_cover_the_scan(db, points):
+    with db.scan_iter("Pt", operator.AL, chunk_size=300) as stream:
+        assert stream.count == 1000
+        batches = list(stream)
+    assert [len(batch) for batch in batches] == [300, 300, 300, 100]
+    assert type(batches[0]) is list
+    assert sorted(pk for batch in batches for pk in batch) == points
+    assert db._stream is None
+
+
+def test_other_requests_spill_the_rest(db, points):
+    stream = db.scan_iter("Pt", operator.EQ, "n", 0, chunk_size=100, container="array")
+    first = next(stream)
+    # the get reads the unread ids into memory before it is sent
+    assert db.get("Pt", points[0]) == ([0.0, 0.0, 0], 1)
+    rest = [pk for batch in stream for pk in batch]
+    assert stream.left() == 0
+    assert sorted(list(first) + rest) == points[0::2]
+
+
+def test_close_and_abandon_skip_the_rest(db, points):
+    stream = db.scan_iter("Pt", operator.AL, chunk_size=10)
+    next(stream)
+    stream.close()
+    assert stream.left() == 0
+    assert db.get("Pt", points[1])[0][2] == 1
+    stream = db.scan_iter("Pt", operator.AL, chunk_size=10)
+    next(stream)
+    del stream
+    gc.collect()
+    assert db.get("Pt", points[2])[0][2] == 0
+    with db.scan_iter("Pt", operator.EQ, "n", 5) as stream:
+        assert list(stream) == [] and db._stream is None
+
+
+def test_bad_arguments(db):
+    with pytest.raises(ValueError):
+        db.scan_iter("Pt", operator.AL, chunk_size=0)
+    with pytest.raises(easydb.PacketError):
+        db.scan_iter("Pt", operator.GT, "id", 3)
+    assert db.scan("Pt", operator.AL) == []
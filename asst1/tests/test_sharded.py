@@ -0,0 +1,237 @@
+#!/usr/bin/python3
+#
+# test_sharded.py
+#
+# Tests for ShardedDatabase over several fake servers
+#
+
+import pytest
+import easydb
+from easydb.packet import operator
+from easydb.sharded import ShardedCache, shard_of, global_pk, LOCAL_MASK
+from fakeserver import FakeServer, TABLES, GET, SCAN, UPDATE, DROP
+
+# seconds the slow servers take per request
+DELAY = 0.2
+
+SHARDS = 3
+
+
+def connect(servers):
+    db = easydb.ShardedDatabase(TABLES)
+    for server in servers:
+        assert db.connect("localhost", server.port)
+    return db
+
+
+@pytest.fixture(params=[True], ids=["strict"])
+def servers(request):
+    servers = [FakeServer(TABLES, strict=request.param) for i in range(SHARDS)]
+    yield servers
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def sdb(servers):
+    db = connect(servers)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def people(sdb):
+    return [sdb.insert("User", ["first%d" % i, "last", 1.0, i])[0] for i in range(30)]
+
+
+def test_rows_spread_and_requests_go_to_the_owner(sdb, servers, people):
+    assert len(set(shard_of(pk) for pk in people)) == SHARDS
+    pk = people[7]
+    owner = servers[shard_of(pk)]
+    before = [(server.count(GET), server.count(UPDATE)) for server in servers]
+    values, version = sdb.get("User", pk)
+    assert values == ["first7", "last", 1.0, 7] and version == 1
+    assert sdb.update("User", pk, ["renamed", "last", 1.0, 7], version) == 2
+    after = [(server.count(GET), server.count(UPDATE)) for server in servers]
+    assert [a != b for a, b in zip(before, after)] == [server is owner for server in servers]
+    sdb.drop("User", pk)
+    assert owner.count(DROP) == 1 and sum(server.count(DROP) for server in servers) == 1
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        sdb.get("User", pk)
+    with pytest.raises(easydb.ObjectDoesNotExist):
+        sdb.get("User", global_pk(SHARDS, 1))
+
+
+def test_the_ring_is_stable(servers, people, sdb):
+    other = connect(servers)
+    try:
+        pk, version = other.insert("User", ["first3", "last", 1.0, 3])
+        assert shard_of(pk) == shard_of(people[3])
+    finally:
+        other.close()
+
+
+def test_accounts_follow_their_user(sdb, people):
+    for pk in people[:10]:
+        account, version = sdb.insert("Account", [pk, "Savings", 5.0])
+        assert shard_of(account) == shard_of(pk)
+        assert sdb.get("Account", account)[0] == [pk, "Savings", 5.0]
+    # moving an account to a user of another shard would break the key
+    account = sdb.insert("Account", [people[0], "Savings", 5.0])[0]
+    elsewhere = [pk for pk in people if shard_of(pk) != shard_of(people[0])][0]
+    with pytest.raises(easydb.InvalidReference):
+        sdb.update("Account", account, [elsewhere, "Savings", 5.0])
+    assert sdb.get("Account", account) == ([people[0], "Savings", 5.0], 1)
+
+
+def test_scans_merge_every_shard(sdb, servers, people):
+    assert sorted(sdb.scan("User", operator.AL)) == sorted(people)
+    assert sorted(sdb.scan("User", operator.GE, "age", 25, container="array")) == \
+        sorted(people[25:])
+    owner = shard_of(people[4])
+    for pk in people[:6]:
+        sdb.insert("Account", [pk, "Savings", 1.0])
+    scans = [server.count(SCAN) for server in servers]
+    matches = sdb.scan("Account", operator.EQ, "user", people[4])
+    assert len(matches) == 1 and shard_of(matches[0]) == owner
+    # no other shard can hold an account of that user
+    assert [server.count(SCAN) - n for server, n in zip(servers, scans)] == \
+        [int(i == owner) for i in range(SHARDS)]
+    assert sdb.scan("User", operator.EQ, "id", people[9]) == [people[9]]
+    assert sorted(sdb.scan("User", operator.NE, "id", people[9])) == \
+        sorted(people[:9] + people[10:])
+
+
+def test_null_foreign_keys(sdb, servers, people):
+    orphans = [sdb.insert("Account", [0, "Orphan%d" % i, 1.0])[0] for i in range(12)]
+    assert len(set(shard_of(pk) for pk in orphans)) > 1
+    assert sdb.get("Account", orphans[0])[0][0] == 0
+    sdb.insert("Account", [people[0], "Savings", 1.0])
+    assert sorted(sdb.scan("Account", operator.EQ, "user", 0)) == sorted(orphans)
+    assert len(sdb.scan("Account", operator.NE, "user", 0)) == 1
+
+
+@pytest.mark.parametrize("servers", [False], ids=["loose"], indirect=True)
+def test_range_scans_on_keys(sdb, people):
+    accounts = dict((sdb.insert("Account", [pk, "Savings", 1.0])[0], pk) for pk in people)
+    orphan = sdb.insert("Account", [0, "Orphan", 1.0])[0]
+    accounts[orphan] = 0
+    for op in (operator.LT, operator.GT, operator.LE, operator.GE):
+        for key in (people[5], people[20]):
+            expected = sorted(pk for pk, user in accounts.items()
+                              if easydb.sharded.COMPARE[op](user, key))
+            assert sorted(sdb.scan("Account", op, "user", key)) == expected
+            ids = sorted(pk for pk in people if easydb.sharded.COMPARE[op](pk, key))
+            assert sorted(sdb.scan("User", op, "id", key)) == ids
+
+
+def test_bulk_calls_keep_input_order(sdb, people):
+    result = sdb.insert_many("User", [["bulk%d" % i, "l", 2.0, i] for i in range(20)] +
+                             [["bad"]])
+    pks = list(result.pks)
+    assert pks[-1] == 0 and [i for i, error in result.errors] == [20]
+    assert [row[0][3] for row in sdb.get_many("User", pks[:20])] == list(range(20))
+    mixed = [pks[5], global_pk(SHARDS, 1), pks[0], people[2]]
+    assert [row and row[0][0] for row in sdb.get_many("User", mixed, missing="none")] == \
+        ["bulk5", None, "bulk0", "first2"]
+    columns = sdb.fetch_columns("User", mixed, ["age", "firstName"], "list")
+    assert columns == {"id": [pks[5], pks[0], people[2]], "age": [5, 0, 2],
+                       "firstName": ["bulk5", "bulk0", "first2"]}
+    dropped = sdb.drop_many("User", pks[:4])
+    assert dropped.versions is None and not dropped.errors and list(dropped.pks) == pks[:4]
+    assert sdb.get_many("User", pks[:6], missing="none")[:4] == [None] * 4
+
+
+def test_pipeline_and_cache(sdb, servers, people):
+    with sdb.pipeline() as pipe:
+        gets = [pipe.get("User", pk) for pk in people[:9]]
+        inserted = pipe.insert("Account", [people[1], "Savings", 3.0])
+    assert [reply.result()[0][3] for reply in gets] == list(range(9))
+    assert shard_of(inserted.result()[0]) == shard_of(people[1])
+    cache = sdb.use_cache()
+    assert type(cache) is ShardedCache and sdb.cache is cache
+    sdb.get("User", people[4])
+    owner = servers[shard_of(people[4])]
+    reads = owner.count(GET)
+    assert sdb.get("User", people[4])[0][0] == "first4"
+    assert owner.count(GET) == reads
+    assert cache.lookup("User", people[4])[0][0] == "first4" and len(cache) == 1
+    assert sdb.use_cache(None, None) is None
+
+
+def test_null_foreign_keys_read_back_as_zero(sdb, people):
+    orphans = [sdb.insert("Account", [0, "Orphan%d" % i, 1.0])[0] for i in range(12)]
+    owned = sdb.insert("Account", [people[0], "Savings", 2.0])[0]
+    pks = [pk for pk in orphans if shard_of(pk) != 0][:2] + [owned]
+    assert len(pks) == 3
+    expected = [sdb.get("Account", pk)[0][0] for pk in pks]
+    assert expected == [0, 0, people[0]]
+    assert sdb.fetch_columns("Account", pks, ["user"], "list")["user"] == expected
+    assert list(sdb.fetch_columns("Account", pks, ["user"], "array")["user"]) == expected
+    try:
+        import numpy
+    except ImportError:
+        return
+    assert sdb.fetch_columns("Account", pks, ["user"], "numpy")["user"].tolist() == expected
+
+
+@pytest.fixture
+def slow(servers):
+    # the rows are written fast, then every request takes DELAY
+    db = connect(servers)
+    pks = [db.insert("User", ["first%d" % i, "last", 1.0, i])[0] for i in range(30)]
+    for server in servers:
+        server.delay = DELAY
+    yield db, pks
+    for server in servers:
+        server.delay = 0.0
+    db.close()
+
+
+def first_arrivals(servers, since):
+    return [next(t for t in server.arrivals[since[i]:]) for i, server in enumerate(servers)]
+
+
+def assert_overlapped(servers, since):
+    # every shard got its first request before any shard answered one
+    arrivals = first_arrivals(servers, since)
+    assert max(arrivals) - min(arrivals) < DELAY / 2
+
+
+def test_pipeline_writes_every_shard_first(slow, servers):
+    db, pks = slow
+    since = [len(server.arrivals) for server in servers]
+    per_shard = dict((shard_of(pk), pk) for pk in pks)
+    with db.pipeline() as pipe:
+        replies = [pipe.get("User", pk) for pk in per_shard.values()]
+    assert [reply.result()[0][0] for reply in replies] == \
+        [db.get("User", pk)[0][0] for pk in per_shard.values()]
+    assert_overlapped(servers, since)
+    since = [len(server.arrivals) for server in servers]
+    with db.pipeline() as pipe:
+        reply = pipe.scan("User", operator.GE, "age", 10)
+    assert sorted(reply.result()) == sorted(pks[10:])
+    assert_overlapped(servers, since)
+
+
+def test_scan_many_writes_every_shard_first(slow, servers):
+    db, pks = slow
+    since = [len(server.arrivals) for server in servers]
+    results = db.scan_many("User", operator.EQ, "age", [3, 4, 99, 17], container="array")
+    assert [list(ids) for ids in results] == [[pks[3]], [pks[4]], [], [pks[17]]]
+    assert_overlapped(servers, since)
+
+
+def test_scan_many_routes_keys(sdb, servers, people):
+    for pk in people[:6]:
+        sdb.insert("Account", [pk, "Savings", 1.0])
+    orphan = sdb.insert("Account", [0, "Orphan", 1.0])[0]
+    scans = [server.count(SCAN) for server in servers]
+    results = sdb.scan_many("Account", operator.EQ, "user", people[:3] + [0], chunk_size=1)
+    assert [len(ids) for ids in results[:3]] == [1, 1, 1]
+    assert [shard_of(ids[0]) for ids in results[:3]] == [shard_of(pk) for pk in people[:3]]
+    assert results[3] == [orphan]
+    # a user's accounts are looked for on its shard only, 0 on every shard
+    assert sum(server.count(SCAN) - n for server, n in zip(servers, scans)) == 3 + SHARDS
+    with pytest.raises(easydb.PacketError):
+        sdb.scan_many("Account", operator.EQ, "user", ["a"])
@@ -10,6 +10,9 @@ from .easydb import IntegrityError, InvalidReference, ObjectDoesNotExist, \
 from .table import Table
 from .field import Integer, Float, String, Foreign, DateTime, Coordinate
 from .orm import setup
+from .session import Session
+from .aggregate import Sum, Avg, Min, Max, Count
+from .geo import GridIndex
 
 
 def export(database_name, module):
@@ -0,0 +1,310 @@
+#!/usr/bin/python3
+#
+# aggregate.py
+#
+# Definition for the aggregates computed over the columns of a query
+#
+from array import array
+from datetime import datetime
+from .field import *
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# matching rows whose columns are fetched and reduced at a time
+AGGREGATE_CHUNK = 8192
+
+
+# Helper Function
+# Function 1: Group index of every key, returns the distinct keys and the indices
+#   Numeric keys are grouped by numpy in one step, other keys through a dict.
+def group_codes(keys):
+    if numpy is not None and type(keys) is numpy.ndarray:
+        distinct, codes = numpy.unique(keys, return_inverse=True)
+        return distinct.tolist(), codes
+    index = {}
+    codes = array("q", [index.setdefault(key, len(index)) for key in keys])
+    if numpy is not None:
+        codes = numpy.frombuffer(codes, dtype=numpy.int64)
+    return list(index), codes
+
+
+# Function 2: True if the values add up in int64 without wrapping
+#   Integer columns whose total could pass 2^63 are summed as Python ints.
+def fits_int64(values):
+    if values.dtype.kind != "i" or not len(values):
+        return True
+    bound = max(abs(int(values.min())), abs(int(values.max())))
+    return bound * len(values) < 2 ** 63
+
+
+# Function 3: Sums of the values per group index in codes, exact for ints
+def grouped_sums(values, codes, count):
+    if not fits_int64(values):
+        values = values.astype(object)
+    sums = numpy.zeros(count, dtype=values.dtype)
+    numpy.add.at(sums, codes, values)
+    return sums.tolist()
+
+
+# Function 4: Reduce the matching rows of a table
+#   The columns the aggregates need are fetched AGGREGATE_CHUNK rows at a
+#   time and folded into running states, so memory stays bounded by one
+#   chunk. Returns {key: value}, or {group: {key: value}} with group_by.
+#   Rows dropped after the scan are left out of every aggregate, Count()
+#   included, as soon as any column is fetched. Count() alone fetches
+#   nothing and counts the ids of the scan.
+def aggregate(model, db, ids, aggregates, group_by=None):
+    fields = dict(model._fields)
+    columns = []
+    sources = []
+    for agg in aggregates:
+        if not isinstance(agg, Aggregate):
+            raise TypeError("%r is not an aggregate" % (agg,))
+        agg.check(model)
+        # a field is read through its first column, "_lat" for a Coordinate
+        source = "id" if agg.field is None else model._columns([agg.field])[0]
+        sources.append(source)
+        if source != "id" and source not in columns:
+            columns.append(source)
+    if group_by is not None:
+        if type(fields.get(group_by)) in (type(None), Coordinate):
+            raise AttributeError("%s cannot be grouped by %s" % (model.__name__, group_by))
+        if group_by not in columns:
+            columns.append(group_by)
+
+    # counting rows needs no column at all, the scan is the snapshot counted
+    if group_by is None and not columns:
+        return dict((agg.key, len(ids)) for agg in aggregates)
+
+    container = "array" if numpy is None else "numpy"
+    states = [agg.empty() for agg in aggregates]
+    groups = {}
+    for start in range(0, len(ids), AGGREGATE_CHUNK):
+        result = db.fetch_columns(model.__name__, ids[start:start + AGGREGATE_CHUNK],
+                                  columns, container)
+        if not len(result["id"]):
+            continue
+        values = [result[source] for source in sources]
+        if group_by is None:
+            states = [agg.merge(state, agg.reduce(column))
+                      for agg, state, column in zip(aggregates, states, values)]
+            continue
+        keys, codes = group_codes(result[group_by])
+        parts = [agg.grouped(column, codes, len(keys))
+                 for agg, column in zip(aggregates, values)]
+        for i, key in enumerate(keys):
+            held = groups.get(key)
+            if held is None:
+                held = [agg.empty() for agg in aggregates]
+            groups[key] = [agg.merge(state, part[i])
+                           for agg, state, part in zip(aggregates, held, parts)]
+
+    if group_by is None:
+        return dict((agg.key, agg.result(state, fields))
+                    for agg, state in zip(aggregates, states))
+    ret = {}
+    for key, held in groups.items():
+        if type(fields[group_by]) is DateTime:
+            key = datetime.fromtimestamp(key)
+        ret[key] = dict((agg.key, agg.result(state, fields))
+                        for agg, state in zip(aggregates, held))
+    return ret
+
+
+# Aggregate Class: one reduction over a field of the matching rows
+#   A state is folded chunk by chunk: reduce() gives the state of a whole
+#   column, grouped() one state per group, merge() combines two states.
+#   With numpy the columns are reduced by numpy, without it by builtins.
+class Aggregate:
+    # Data member 1: Name used in the result keys "name"
+    name = None
+
+    # Data member 2: Field types the aggregate accepts "kinds"
+    kinds = (Integer, Float, DateTime)
+
+    # Function 1: Initializer
+    def __init__(self, field):
+        self.field = field
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "%s(%r)" % (type(self).__name__, self.field)
+
+    # Function 3: Key of the value in the result, "balance__sum"
+    @property
+    def key(self):
+        return "%s__%s" % (self.field, self.name)
+
+    # Function 4: Check the field against the table
+    def check(self, model):
+        field = dict(model._fields).get(self.field)
+        if field is None:
+            raise AttributeError("%s has no field %s" % (model.__name__, self.field))
+        if type(field) not in self.kinds:
+            raise TypeError("%s of a %s field" % (type(self).__name__, type(field).__name__))
+
+    # Function 5: State of one group per group index in codes
+    def grouped(self, values, codes, count):
+        if numpy is not None:
+            return self.vector_grouped(values, codes, count)
+        parts = [self.empty() for i in range(count)]
+        for code, value in zip(codes, values):
+            parts[code] = self.merge(parts[code], self.single(value))
+        return parts
+
+    # Function 6: Final value of a state, DateTime fields give datetimes
+    def result(self, state, fields):
+        value = self.value(state)
+        if value is not None and type(fields.get(self.field)) is DateTime:
+            return datetime.fromtimestamp(value)
+        return value
+
+    def value(self, state):
+        return state
+
+
+# Sum Class: total of a numeric field
+class Sum(Aggregate):
+    name = "sum"
+    kinds = (Integer, Float)
+
+    def empty(self):
+        return 0
+
+    def single(self, value):
+        return value
+
+    def reduce(self, values):
+        if numpy is not None:
+            if fits_int64(values):
+                return values.sum().item()
+            return sum(values.tolist())
+        return sum(values)
+
+    def vector_grouped(self, values, codes, count):
+        return grouped_sums(values, codes, count)
+
+    def merge(self, state, part):
+        return state + part
+
+
+# Count Class: number of matching rows, Count() needs no column
+class Count(Aggregate):
+    name = "count"
+
+    def __init__(self, field=None):
+        super().__init__(field)
+
+    @property
+    def key(self):
+        if self.field is None:
+            return "count"
+        return super().key
+
+    def check(self, model):
+        if self.field is not None and self.field not in dict(model._fields):
+            raise AttributeError("%s has no field %s" % (model.__name__, self.field))
+
+    def empty(self):
+        return 0
+
+    def single(self, value):
+        return 1
+
+    def reduce(self, values):
+        return len(values)
+
+    def vector_grouped(self, values, codes, count):
+        return numpy.bincount(codes, minlength=count).tolist()
+
+    def merge(self, state, part):
+        return state + part
+
+    def result(self, state, fields):
+        return state
+
+
+# Avg Class: mean of a numeric or datetime field, None for no rows
+class Avg(Aggregate):
+    name = "avg"
+
+    def empty(self):
+        return 0, 0
+
+    def single(self, value):
+        return value, 1
+
+    def reduce(self, values):
+        if numpy is not None:
+            if fits_int64(values):
+                return values.sum().item(), len(values)
+            return sum(values.tolist()), len(values)
+        return sum(values), len(values)
+
+    def vector_grouped(self, values, codes, count):
+        return list(zip(grouped_sums(values, codes, count),
+                        numpy.bincount(codes, minlength=count).tolist()))
+
+    def merge(self, state, part):
+        return state[0] + part[0], state[1] + part[1]
+
+    def value(self, state):
+        total, count = state
+        if count == 0:
+            return None
+        return total / count
+
+
+# Min Class: smallest value of a numeric or datetime field, None for no rows
+class Min(Aggregate):
+    name = "min"
+
+    def empty(self):
+        return None
+
+    def single(self, value):
+        return value
+
+    def reduce(self, values):
+        if numpy is not None:
+            return values.min().item()
+        return min(values)
+
+    def vector_grouped(self, values, codes, count):
+        mins = numpy.full(count, values.max(), dtype=values.dtype)
+        numpy.minimum.at(mins, codes, values)
+        return mins.tolist()
+
+    def merge(self, state, part):
+        if state is None or part is not None and part < state:
+            return part
+        return state
+
+
+# Max Class: largest value of a numeric or datetime field, None for no rows
+class Max(Aggregate):
+    name = "max"
+
+    def empty(self):
+        return None
+
+    def single(self, value):
+        return value
+
+    def reduce(self, values):
+        if numpy is not None:
+            return values.max().item()
+        return max(values)
+
+    def vector_grouped(self, values, codes, count):
+        maxs = numpy.full(count, values.min(), dtype=values.dtype)
+        numpy.maximum.at(maxs, codes, values)
+        return maxs.tolist()
+
+    def merge(self, state, part):
+        if state is None or part is not None and part > state:
+            return part
+        return state
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+#
+# codegen.py
+#
+# Definition for the per-table functions generated from the fields
+#
+from .field import *
+from . import session
+
+
+# Helper Function
+# Function 1: Compile the source of one function, return the function
+def compile_function(source, name, namespace):
+    exec(compile(source, "<orm %s>" % name, "exec"), namespace)
+    return namespace[name]
+
+
+# Function 2: Trusted setter of a row fetched from the server
+#   set_row(obj, values, version) stores every value straight into its
+#   slot. The server only hands back values that passed the checks on
+#   insert and update, so the type, blank and choice checks are skipped.
+#   DateTime values stay timestamps until first read, foreign keys become
+#   deferred rows. The values are kept as the snapshot save() compares
+#   against, the object starts clean.
+def build_set_row(cls):
+    lines = ["def set_row(obj, values, version):",
+             "    obj.version = version",
+             "    obj._deferred = False",
+             "    obj._loaded = values",
+             "    obj._dirty = None"]
+    namespace = {}
+    value_index = 0
+    for field_name, obj in cls._fields:
+        slot = obj.slot
+        if type(obj) is Coordinate:
+            lines.append("    obj.%s = (values[%d], values[%d])" % (slot, value_index, value_index + 1))
+            value_index += 2
+            continue
+        if type(obj) is Foreign:
+            deferred = "deferred_%s" % field_name
+            namespace[deferred] = obj.table._deferred_row
+            lines.append("    value = values[%d]" % value_index)
+            lines.append("    obj.%s = None if value is None else %s(obj.db, value)" % (slot, deferred))
+        else:
+            lines.append("    obj.%s = values[%d]" % (slot, value_index))
+        value_index += 1
+    return compile_function("\n".join(lines) + "\n", "set_row", namespace)
+
+
+# Function 3: Constructor of an object for a row fetched from the server
+#   from_row(db, pk, values, version) skips Table.__init__ entirely. While
+#   a session is active the object it holds for the row is refreshed and
+#   returned instead, a new object is added to it.
+def build_from_row(cls):
+    lines = ["def from_row(db, pk, values, version):",
+             "    active = current(db) if sessions else None",
+             "    if active is not None:",
+             "        obj = active._objects.get((%r, pk))" % cls.__name__,
+             "        if obj is not None:",
+             "            return active._merge(obj, values, version)",
+             "    obj = new(cls)",
+             "    obj.pk = pk",
+             "    obj.db = db",
+             "    obj._prefetched = None",
+             "    set_row(obj, values, version)",
+             "    if active is not None:",
+             "        active._add(obj)",
+             "    return obj"]
+    namespace = {"new": object.__new__, "cls": cls, "set_row": cls._set_row,
+                 "sessions": session._active, "current": session.current}
+    return compile_function("\n".join(lines) + "\n", "from_row", namespace)
+
+
+# Function 4: Serializer of an object into the values sent to the server
+#   to_row(obj) returns the flat value list in column order in one pass:
+#   foreign keys become their pk, datetimes their POSIX timestamp and a
+#   coordinate its "_lat" and "_lon" columns. A deferred row is fetched
+#   first.
+def build_to_row(cls):
+    lines = ["def to_row(obj):",
+             "    if obj._deferred:",
+             "        obj._load()"]
+    columns = []
+    for i, (field_name, obj) in enumerate(cls._fields):
+        value = "v%d" % i
+        lines.append("    %s = obj.%s" % (value, obj.slot))
+        if type(obj) is Coordinate:
+            lines.append("    if %s is None:" % value)
+            lines.append("        %s = (None, None)" % value)
+            columns.append("%s[0]" % value)
+            columns.append("%s[1]" % value)
+            continue
+        if type(obj) is Foreign:
+            lines.append("    if %s is not None:" % value)
+            lines.append("        %s = %s.pk" % (value, value))
+        elif type(obj) is DateTime:
+            # fetched values stay timestamps until first read
+            lines.append("    if %s is not None and type(%s) is not float:" % (value, value))
+            lines.append("        %s = %s.timestamp()" % (value, value))
+        columns.append(value)
+    lines.append("    return [%s]" % ", ".join(columns))
+    return compile_function("\n".join(lines) + "\n", "to_row", {})
@@ -7,10 +7,16 @@
 from datetime import datetime
 
 
+# Helper Function
+# Function 1: Name of the instance slot holding the value of a field
+def slot_name(name):
+    return "_%s_value" % name
+
+
 # Super field of all the other ones
+#   The value of a field lives on the instance, in the slot named by
+#   "slot" that MetaTable generates for every field of a table.
 class Field:
-    _values = {}
-
     def __init__(self, blank=True, default=None, choices=()):
         if default is not None:
             if callable(default):
@@ -21,14 +27,31 @@ class Field:
         self.blank = blank
         self.default = default
         self.choices = choices
-        Field._values[self] = {}
+        self.name = None
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = slot_name(name)
 
     def __get__(self, obj, obj_type=None):
-        return Field._values[self][obj]
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            # a row referenced by a foreign key is fetched on first access
+            if not getattr(obj, "_deferred", False):
+                raise AttributeError(self.name) from None
+        obj._load()
+        return getattr(obj, self.slot)
 
     def __set__(self, obj, value):
+        # a deferred row is fetched first so the change is not overwritten
+        if obj._deferred:
+            obj._load()
         if value is None:
-            if obj in Field._values[self]:
+            if hasattr(obj, self.slot):
                 raise AttributeError
             else:
                 value = self.default
@@ -36,7 +59,13 @@ class Field:
         self.type_error_checking(value)
         if self.choices and value not in self.choices:
             raise ValueError
-        Field._values[self][obj] = value
+        setattr(obj, self.slot, value)
+        # fields assigned since the row was read, see Table._changes
+        if obj._loaded is not None:
+            if obj._dirty is None:
+                obj._dirty = {self.name}
+            else:
+                obj._dirty.add(self.name)
 
     def type_error_checking(self, value):
         pass
@@ -97,6 +126,14 @@ class DateTime(Field):
         default = datetime.fromtimestamp(0)
         super().__init__(blank, default, choices)
 
+    def __get__(self, obj, obj_type=None):
+        value = Field.__get__(self, obj, obj_type)
+        if type(value) is float:
+            # rows from the server hold the timestamp until the first read
+            value = datetime.fromtimestamp(value)
+            setattr(obj, self.slot, value)
+        return value
+
     def type_error_checking(self, value):
         if value is not None and type(value) is not datetime:
             raise TypeError
@@ -0,0 +1,305 @@
+#!/usr/bin/python3
+#
+# geo.py
+#
+# Definition for the bounding-box and radius filters on Coordinate fields
+#
+import math
+from array import array
+from weakref import WeakKeyDictionary
+from .field import Coordinate
+from .planner import Predicate, OP_GE, OP_LE
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# mean earth radius used by the haversine distance
+EARTH_RADIUS_KM = 6371.0088
+
+# default edge of a grid index cell, in degrees
+GRID_CELL = 1.0
+
+# grid indexes of every database, {(table name, field name): GridIndex}
+_indexes = WeakKeyDictionary()
+
+
+# Helper Function
+# Function 1: Haversine distances in km from one point to many
+#   lats and lons are numpy arrays, or any sequences without numpy.
+def haversine_km(lat, lon, lats, lons):
+    lat, lon = math.radians(lat), math.radians(lon)
+    if numpy is not None:
+        lats, lons = numpy.radians(lats), numpy.radians(lons)
+        a = numpy.sin((lats - lat) / 2) ** 2 + \
+            math.cos(lat) * numpy.cos(lats) * numpy.sin((lons - lon) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    ret = []
+    for other_lat, other_lon in zip(lats, lons):
+        other_lat, other_lon = math.radians(other_lat), math.radians(other_lon)
+        a = math.sin((other_lat - lat) / 2) ** 2 + \
+            math.cos(lat) * math.cos(other_lat) * math.sin((other_lon - lon) / 2) ** 2
+        ret.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(a, 1.0))))
+    return ret
+
+
+# Function 2: Check a (lat, lon) pair
+def check_point(point):
+    if type(point) not in (tuple, list) or len(point) != 2:
+        raise TypeError("A point is a (lat, lon) pair")
+    lat, lon = point
+    if type(lat) not in (int, float) or type(lon) not in (int, float):
+        raise TypeError("A point is a (lat, lon) pair")
+    if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+        raise ValueError("A point is at most 90 degrees of latitude and 180 of longitude")
+    return float(lat), float(lon)
+
+
+# Function 3: Grid index of a table field on a database, or None
+def find_index(db, table_name, field_name):
+    if not _indexes:
+        return None
+    return _indexes.get(db, {}).get((table_name, field_name))
+
+
+# Function 4: Keep the grid indexes of the object's table in step with a save
+def track(obj):
+    if not _indexes:
+        return
+    for (table_name, field_name), index in _indexes.get(obj.db, {}).items():
+        if table_name == obj._table_name:
+            index.add(obj.pk, getattr(obj, field_name))
+
+
+# Function 5: Remove a dropped object from the grid indexes of its table
+def untrack(obj):
+    if not _indexes:
+        return
+    for (table_name, field_name), index in _indexes.get(obj.db, {}).items():
+        if table_name == obj._table_name:
+            index.discard(obj.pk)
+
+
+# Geo Filter Class: rows of a Coordinate field inside an area
+#   The area is planned as range scans on the "_lat" and "_lon" columns of
+#   its bounding box. Whatever the box does not decide exactly, a circle or
+#   a box across the antimeridian, is refined on the fetched coordinates.
+class GeoFilter:
+    # Data member 1: Coordinate field name "field"
+
+    # Data member 2: Bounding box "south", "north", "west" and "east"
+    #                west and east are None when longitude is not bounded
+
+    # Function 1: Initializer
+    def __init__(self, field, south, north, west, east):
+        self.field = field
+        self.south = south
+        self.north = north
+        self.west = west
+        self.east = east
+
+    # Function 2: Scans of the bounding box, the expected share of every
+    #   scan assumes points spread evenly, so the tighter side goes first
+    def predicates(self):
+        ret = []
+        if self.south > -90:
+            ret.append(Predicate(self.field + "_lat", OP_GE, self.south, (90 - self.south) / 180))
+        if self.north < 90:
+            ret.append(Predicate(self.field + "_lat", OP_LE, self.north, (self.north + 90) / 180))
+        if self.west is not None and self.west <= self.east:
+            if self.west > -180:
+                ret.append(Predicate(self.field + "_lon", OP_GE, self.west, (180 - self.west) / 360))
+            if self.east < 180:
+                ret.append(Predicate(self.field + "_lon", OP_LE, self.east, (self.east + 180) / 360))
+        return ret
+
+    # Function 3: True if the scans alone do not decide every row
+    def needs_refine(self):
+        return self.west is None or self.west > self.east
+
+    # Function 4: Grid index open on the field, or None
+    def index(self, db, table_name):
+        return find_index(db, table_name, self.field)
+
+    # Function 5: Which of the points are inside, a mask or a list of bools
+    def contains(self, lats, lons):
+        if numpy is not None:
+            lats, lons = numpy.asarray(lats), numpy.asarray(lons)
+            keep = (lats >= self.south) & (lats <= self.north)
+            if self.west is not None:
+                if self.west <= self.east:
+                    keep &= (lons >= self.west) & (lons <= self.east)
+                else:
+                    keep &= (lons >= self.west) | (lons <= self.east)
+            return keep
+        keep = []
+        for lat, lon in zip(lats, lons):
+            inside = self.south <= lat <= self.north
+            if inside and self.west is not None:
+                if self.west <= self.east:
+                    inside = self.west <= lon <= self.east
+                else:
+                    inside = lon >= self.west or lon <= self.east
+            keep.append(inside)
+        return keep
+
+
+# Box Class: location__within_box=((south, west), (north, east))
+#   west greater than east is a box across the antimeridian.
+class Box(GeoFilter):
+    def __init__(self, field, value):
+        if type(value) not in (tuple, list) or len(value) != 2:
+            raise TypeError("within_box takes ((south, west), (north, east))")
+        (south, west), (north, east) = check_point(value[0]), check_point(value[1])
+        if south > north:
+            raise ValueError("within_box south is above north")
+        super().__init__(field, south, north, west, east)
+
+    def __repr__(self):
+        return "%s__within_box=((%r, %r), (%r, %r))" % (
+            self.field, self.south, self.west, self.north, self.east)
+
+
+# Radius Class: location__within_km=((lat, lon), km)
+class Radius(GeoFilter):
+    def __init__(self, field, value):
+        if type(value) not in (tuple, list) or len(value) != 2:
+            raise TypeError("within_km takes ((lat, lon), km)")
+        (lat, lon), km = check_point(value[0]), value[1]
+        if type(km) not in (int, float):
+            raise TypeError("within_km takes ((lat, lon), km)")
+        if km < 0:
+            raise ValueError("within_km radius is negative")
+        self.lat, self.lon, self.km = lat, lon, km
+        angle = km / EARTH_RADIUS_KM
+        south = max(-90.0, lat - math.degrees(angle))
+        north = min(90.0, lat + math.degrees(angle))
+        west = east = None
+        # longitude is bounded unless the circle reaches a pole
+        if south > -90 and north < 90:
+            spread = math.sin(angle) / math.cos(math.radians(lat))
+            if spread < 1:
+                width = math.degrees(math.asin(spread))
+                west, east = lon - width, lon + width
+                # a circle across the antimeridian wraps around
+                if west < -180:
+                    west += 360
+                if east > 180:
+                    east -= 360
+        super().__init__(field, south, north, west, east)
+
+    def __repr__(self):
+        return "%s__within_km=((%r, %r), %r)" % (self.field, self.lat, self.lon, self.km)
+
+    def needs_refine(self):
+        return True
+
+    def contains(self, lats, lons):
+        distances = haversine_km(self.lat, self.lon, lats, lons)
+        if numpy is not None:
+            return distances <= self.km
+        return [distance <= self.km for distance in distances]
+
+
+# geo lookups accepted after "__" on a Coordinate field
+GEO_LOOKUPS = {"within_box": Box, "within_km": Radius}
+
+
+# Grid Index Class: client-side index of a Coordinate field
+#   Points are bucketed into cells of "cell" degrees. While the index is
+#   open, geo filters on the field are answered from it without a scan,
+#   and saves and deletes through the ORM of this client keep it current.
+#   Rows written by other clients are only seen after rebuild().
+class GridIndex:
+    # Data member 1: Database, table class and field name "db", "model", "field"
+
+    # Data member 2: Cell edge in degrees "cell"
+
+    # Data member 3: Pks of every cell "_cells"
+    #                <dict> -> (<int>, <int>) : <set> of <int>
+
+    # Data member 4: Coordinates of every pk "_points"
+    #                <dict> -> <int> : (<float>, <float>)
+
+    # Function 1: Initializer, reads the whole field and opens the index
+    def __init__(self, db, model, field, cell=GRID_CELL):
+        if type(dict(model._fields).get(field)) is not Coordinate:
+            raise AttributeError("%s has no Coordinate field %s" % (model.__name__, field))
+        if cell <= 0:
+            raise ValueError("cell must be positive")
+        self.db = db
+        self.model = model
+        self.field = field
+        self.cell = cell
+        self._cells = dict()
+        self._points = dict()
+        self.rebuild()
+        _indexes.setdefault(db, {})[(model.__name__, field)] = self
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<ORM GridIndex of %s.%s, %d points>" % (self.model.__name__, self.field, len(self))
+
+    # Function 3: Number of points held
+    def __len__(self):
+        return len(self._points)
+
+    # Function 4: Read every point of the table again
+    def rebuild(self):
+        self._cells.clear()
+        self._points.clear()
+        ids = self.model.filter(self.db).ids()
+        columns = [self.field + "_lat", self.field + "_lon"]
+        result = self.db.fetch_columns(self.model.__name__, ids, columns, "list")
+        for pk, lat, lon in zip(result["id"], result[columns[0]], result[columns[1]]):
+            self.add(pk, (lat, lon))
+
+    # Function 5: Add or move the point of a row
+    def add(self, pk, point):
+        self.discard(pk)
+        if point is None:
+            return
+        lat, lon = point
+        self._points[pk] = (lat, lon)
+        self._cells.setdefault(self._cell_of(lat, lon), set()).add(pk)
+
+    # Function 6: Remove the point of a row
+    def discard(self, pk):
+        point = self._points.pop(pk, None)
+        if point is not None:
+            key = self._cell_of(*point)
+            self._cells[key].discard(pk)
+            if not self._cells[key]:
+                del self._cells[key]
+
+    # Function 7: Sorted pks of the points inside a geo filter
+    def search(self, geo):
+        rows = self._cell_of(geo.south, 0)[0], self._cell_of(geo.north, 0)[0]
+        if geo.west is None or geo.west > geo.east:
+            # longitude is not one range, every cell of the rows is a candidate
+            keys = [key for key in self._cells if rows[0] <= key[0] <= rows[1]]
+        else:
+            cols = self._cell_of(0, geo.west)[1], self._cell_of(0, geo.east)[1]
+            count = (rows[1] - rows[0] + 1) * (cols[1] - cols[0] + 1)
+            if count > len(self._cells):
+                keys = [key for key in self._cells
+                        if rows[0] <= key[0] <= rows[1] and cols[0] <= key[1] <= cols[1]]
+            else:
+                keys = [(i, j) for i in range(rows[0], rows[1] + 1)
+                        for j in range(cols[0], cols[1] + 1) if (i, j) in self._cells]
+        pks = sorted(pk for key in keys for pk in self._cells[key])
+        lats = [self._points[pk][0] for pk in pks]
+        lons = [self._points[pk][1] for pk in pks]
+        return array("q", [pk for pk, inside in zip(pks, geo.contains(lats, lons)) if inside])
+
+    # Function 8: Stop answering queries, the index is dropped
+    def close(self):
+        indexes = _indexes.get(self.db, {})
+        if indexes.get((self.model.__name__, self.field)) is self:
+            del indexes[(self.model.__name__, self.field)]
+            if not indexes:
+                del _indexes[self.db]
+
+    def _cell_of(self, lat, lon):
+        return int(math.floor(lat / self.cell)), int(math.floor(lon / self.cell))
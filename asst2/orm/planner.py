@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+#
+# planner.py
+#
+# Definition for the query planner that turns filters into scans
+#
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# EasyDB query operators
+OP_AL = 1  # all
+OP_EQ = 2  # equal
+OP_NE = 3  # not equal
+OP_LT = 4  # less than
+OP_GT = 5  # greater than
+OP_LE = 6  # less than or equal
+OP_GE = 7  # greater than or equal
+
+# filter suffixes accepted after "__"
+LOOKUPS = {"al": OP_AL, "eq": OP_EQ, "ne": OP_NE, "lt": OP_LT,
+           "gt": OP_GT, "le": OP_LE, "ge": OP_GE}
+OP_NAMES = dict((op, name) for name, op in LOOKUPS.items())
+
+# share of a table expected to match an operator before anything is observed
+PRIOR = {OP_AL: 1.0, OP_EQ: 0.05, OP_NE: 0.95, OP_LT: 0.33,
+         OP_GT: 0.33, OP_LE: 0.33, OP_GE: 0.33}
+
+# table size assumed before a scan of the table has been seen
+DEFAULT_ROWS = 1000
+
+# weight of the newest observation in the running match estimates
+SMOOTHING = 0.5
+
+# candidates whose coordinates are fetched at a time by a geo refinement
+REFINE_CHUNK = 8192
+
+# one scan of a plan: column and value are what the server compares,
+# share is the expected fraction of the table it returns when the filter
+# knows better than the observed statistics, or None
+Predicate = namedtuple("Predicate", ["column", "op", "value", "share"], defaults=(None,))
+
+
+# Helper Function
+# Function 1: Intersection of two sorted id arrays, sorted
+#   With numpy both sides are intersected in C and a numpy array comes
+#   back, the loops below are the fallback without it.
+def intersect_sorted(a, b):
+    if numpy is not None:
+        return numpy.intersect1d(as_numpy(a), as_numpy(b), assume_unique=True)
+    if len(a) > len(b):
+        a, b = b, a
+    result = array("q")
+    if len(a) * 8 < len(b):
+        # few ids against many, binary search each one
+        lo = 0
+        for x in a:
+            lo = bisect_left(b, x, lo)
+            if lo == len(b):
+                break
+            if b[lo] == x:
+                result.append(x)
+        return result
+    # similar sizes, walk both at once
+    i = j = 0
+    while i < len(a) and j < len(b):
+        x, y = a[i], b[j]
+        if x == y:
+            result.append(x)
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+# Function 2: Ids of a scan in ascending order, without boxing them when
+#   numpy is there
+def sort_ids(ids):
+    if numpy is not None:
+        return numpy.sort(as_numpy(ids))
+    return array("q", sorted(ids))
+
+
+# Function 3: An id array('q') or numpy array as a numpy int64 array
+def as_numpy(ids):
+    if type(ids) is numpy.ndarray:
+        return ids
+    return numpy.frombuffer(ids, dtype=numpy.int64)
+
+
+# Function 4: Ids as the array('q') the rest of the ORM works with
+def as_array(ids):
+    if numpy is not None and type(ids) is numpy.ndarray:
+        ret = array("q")
+        ret.frombytes(ids.astype(numpy.int64, copy=False).tobytes())
+        return ret
+    return ids
+
+
+# Function 5: Ids whose coordinates are inside a geo filter
+#   The coordinates of the candidates are fetched REFINE_CHUNK at a time
+#   and checked at once, haversine for a radius.
+def refine(db, table_name, ids, geo):
+    columns = [geo.field + "_lat", geo.field + "_lon"]
+    container = "array" if numpy is None else "numpy"
+    ret = array("q")
+    for start in range(0, len(ids), REFINE_CHUNK):
+        result = db.fetch_columns(table_name, ids[start:start + REFINE_CHUNK], columns, container)
+        keep = geo.contains(result[columns[0]], result[columns[1]])
+        if numpy is not None:
+            ret.frombytes(result["id"][keep].tobytes())
+        else:
+            ret.extend(pk for pk, inside in zip(result["id"], keep) if inside)
+    return ret
+
+
+# Statistics Class: observed scan cardinalities per column and operator
+class Statistics:
+    # Data member 1: Rows counted by the last full scan of a table "rows"
+    #                <dict> -> <str> : <int>
+
+    # Data member 2: Running match estimate of a predicate "matches"
+    #                <dict> -> (<str>, <str>, <int>) : <float>
+
+    # Function 1: Initializer
+    def __init__(self):
+        self.rows = dict()
+        self.matches = dict()
+
+    # Function 2: Expected number of ids a scan returns
+    def estimate(self, table_name, predicate):
+        if predicate.column == "id" and predicate.op == OP_EQ:
+            return 1.0
+        if predicate.share is not None:
+            return self.rows.get(table_name, DEFAULT_ROWS) * predicate.share
+        key = (table_name, predicate.column, predicate.op)
+        if key in self.matches:
+            return self.matches[key]
+        return self.rows.get(table_name, DEFAULT_ROWS) * PRIOR[predicate.op]
+
+    # Function 3: Record the number of ids a scan returned
+    def observe(self, table_name, predicate, count):
+        if predicate.op == OP_AL:
+            self.rows[table_name] = count
+            return
+        if predicate.share is not None:
+            return
+        key = (table_name, predicate.column, predicate.op)
+        if key in self.matches:
+            count = (1 - SMOOTHING) * self.matches[key] + SMOOTHING * count
+        self.matches[key] = count
+
+    # Function 4: Forget everything
+    def clear(self):
+        self.rows.clear()
+        self.matches.clear()
+
+
+# statistics shared by every plan
+STATISTICS = Statistics()
+
+
+# Plan Class: scans ordered by expected size, intersected as sorted arrays
+#   Every predicate has to be scanned because the server cannot restrict a
+#   scan to given ids, but scanning the smallest first lets the plan stop
+#   as soon as the intersection is empty. Geo filters are answered by a
+#   grid index when one is open, else scanned as their bounding box and
+#   refined on the fetched coordinates of what is left.
+class Plan:
+    # Data member 1: Table name and database "table_name" and "db"
+
+    # Data member 2: Scans in the order they run "steps"
+    #                <list> of [<Predicate>, estimate, observed, remaining]
+
+    # Data member 3: Geo filters answered by an index "indexed" and geo
+    #                filters refined after the scans "refined"
+    #                <list> of [<GeoFilter>, <GridIndex> or None, before, after]
+
+    # Function 1: Initializer, orders the predicates
+    def __init__(self, db, table_name, predicates, statistics=STATISTICS, geos=()):
+        self.db = db
+        self.table_name = table_name
+        self.statistics = statistics
+        self.indexed = []
+        self.refined = []
+        predicates = list(predicates)
+        for geo in geos:
+            index = geo.index(db, table_name)
+            if index is not None:
+                self.indexed.append([geo, index, None, None])
+                continue
+            predicates += geo.predicates()
+            if geo.needs_refine():
+                self.refined.append([geo, None, None, None])
+        if not predicates and not self.indexed:
+            predicates = [Predicate(None, OP_AL, None)]
+        # sorted() is stable, ties keep the order they were written in
+        estimates = [statistics.estimate(table_name, p) for p in predicates]
+        order = sorted(range(len(predicates)), key=lambda i: estimates[i])
+        self.steps = [[predicates[i], estimates[i], None, None] for i in order]
+        self.executed = False
+        # every scan is checked before any is sent
+        for predicate, estimate, observed, remaining in self.steps:
+            db._scan_request(table_name, predicate.op, predicate.column, predicate.value)
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<ORM Plan for %s, %d scans>" % (self.table_name, len(self.steps))
+
+    # Function 3: Run the scans, returns the matching ids in ascending order
+    def execute(self):
+        ids = None
+        # while the scans run the ids may be a numpy array, see intersect_sorted
+        for step in self.indexed:
+            found = step[1].search(step[0])
+            step[2] = len(found)
+            ids = found if ids is None else intersect_sorted(ids, found)
+            step[3] = len(ids)
+        for step in self.steps:
+            # nothing can match once ids is empty, the other scans are skipped
+            if ids is not None and len(ids) == 0:
+                break
+            predicate = step[0]
+            found = self.db.scan(self.table_name, predicate.op, predicate.column, predicate.value,
+                                 "array")
+            step[2] = len(found)
+            self.statistics.observe(self.table_name, predicate, len(found))
+            found = sort_ids(found)
+            ids = found if ids is None else intersect_sorted(ids, found)
+            step[3] = len(ids)
+        ids = as_array(ids)
+        for step in self.refined:
+            if not ids:
+                break
+            step[2] = len(ids)
+            ids = refine(self.db, self.table_name, ids, step[0])
+            step[3] = len(ids)
+        self.executed = True
+        return ids
+
+    # Function 4: Plan and observed cardinalities as text
+    def explain(self):
+        lines = ["Plan for %s:" % self.table_name]
+        for i, (predicate, estimate, observed, remaining) in enumerate(self.steps):
+            if predicate.op == OP_AL:
+                label = "all rows"
+            else:
+                label = "%s__%s=%r" % (predicate.column, OP_NAMES[predicate.op], predicate.value)
+            if observed is None:
+                result = "skipped" if self.executed else "not run"
+            else:
+                result = "scanned %d, %d left" % (observed, remaining)
+            lines.append("  %d. scan %s  (estimated %.0f, %s)" % (i + 1, label, estimate, result))
+        for kind, steps in (("index", self.indexed), ("refine", self.refined)):
+            for geo, index, before, after in steps:
+                if before is None:
+                    result = "skipped" if self.executed else "not run"
+                elif kind == "index":
+                    result = "found %d, %d left" % (before, after)
+                else:
+                    result = "%d in, %d left" % (before, after)
+                lines.append("  %s %r  (%s)" % (kind, geo, result))
+        return "\n".join(lines)
@@ -0,0 +1,451 @@
+#!/usr/bin/python3
+#
+# query.py
+#
+# Definition for the lazy query set returned by filter
+#
+import heapq
+from array import array
+from datetime import datetime
+from itertools import chain
+from .field import Foreign, Coordinate, slot_name
+from .planner import OP_EQ
+from .aggregate import aggregate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# number of rows fetched by one pipelined multi-get while iterating
+FETCH_BATCH = 256
+
+# candidate rows whose sort column is fetched at a time by order_by
+ORDER_CHUNK = 8192
+
+
+# Helper Function
+# Function 1: Fetch the rows the objects reference through a foreign key
+#   path is a Foreign field name, "a__b" follows a then b. The referenced
+#   pks are deduplicated and fetched with one multi-get per table.
+def load_related(objects, path):
+    name, _, rest = path.partition("__")
+    deferred = {}
+    targets = []
+    table = None
+    for obj in objects:
+        field = dict(type(obj)._fields).get(name)
+        if type(field) is not Foreign:
+            raise AttributeError("%s has no foreign key %s" % (type(obj).__name__, name))
+        table = field.table
+        target = getattr(obj, name)
+        if target is None:
+            continue
+        targets.append(target)
+        if target._deferred:
+            deferred.setdefault(target.pk, []).append(target)
+    if deferred:
+        pks = list(deferred)
+        rows = objects[0].db.get_many(table.__name__, pks, missing="none")
+        for pk, row in zip(pks, rows):
+            # a row dropped since is left deferred, reading it raises
+            if row is not None:
+                for target in deferred[pk]:
+                    target._fill(*row)
+    if rest and targets:
+        load_related(targets, rest)
+
+
+# Function 2: Fetch the rows referencing the objects through a reverse accessor
+#   One equality scan per parent on the foreign key, all pipelined together,
+#   the server takes no range scan on a foreign key. The children are
+#   fetched with one multi-get and grouped by parent.
+def prefetch_reverse(parents, name):
+    relation = getattr(type(parents[0]), name, None)
+    if not isinstance(relation, ReverseSet):
+        raise AttributeError("%s has no reverse accessor %s" % (type(parents[0]).__name__, name))
+    model, field_name = relation.model, relation.field_name
+    db = parents[0].db
+    by_pk = {}
+    for parent in parents:
+        by_pk.setdefault(parent.pk, parent)
+    by_pk.pop(None, None)
+    pks = sorted(by_pk)
+    groups = dict((pk, []) for pk in pks)
+
+    ids = array("q", sorted(set().union(*db.scan_many(model.__name__, OP_EQ, field_name, pks))))
+
+    index = model._value_index(field_name)
+    rows = db.get_many(model.__name__, ids, missing="none")
+    for obj_id, row in zip(ids, rows):
+        # a row dropped or moved to another parent since the scan is left out
+        if row is None or row[0][index] not in groups:
+            continue
+        child = model._from_row(db, obj_id, *row)
+        parent = by_pk[row[0][index]]
+        # the foreign key points at the parent already in hand, the row
+        # itself is unchanged
+        setattr(child, slot_name(field_name), parent)
+        groups[parent.pk].append(child)
+
+    for parent in parents:
+        if parent.pk is not None:
+            if parent._prefetched is None:
+                parent._prefetched = {}
+            parent._prefetched[name] = \
+                QuerySet.of(model, db, groups[parent.pk], ((field_name, parent),))
+
+
+# Function 3: Ids of the rows in sort order, only the first k if k is given
+#   The sort column is fetched ORDER_CHUNK rows at a time and only the best
+#   k (key, pk) pairs seen so far are kept, so memory stays bounded by k
+#   and one chunk. Ties are broken by pk in the direction of the sort.
+#   after is the (key, pk) of the last row of the previous page, only rows
+#   past it are kept.
+def sorted_ids(db, table_name, ids, column, descending, after, k):
+    if column == "id":
+        if after is not None:
+            ids = array("q", [pk for pk in ids if (pk < after[1] if descending else pk > after[1])])
+        if descending:
+            ids = ids[::-1]
+        return ids[:k]
+
+    container = "array" if numpy is None else "numpy"
+    best = []
+    for start in range(0, len(ids), ORDER_CHUNK):
+        result = db.fetch_columns(table_name, ids[start:start + ORDER_CHUNK], [column], container)
+        keys, pks = result[column], result["id"]
+        if numpy is not None and type(keys) is numpy.ndarray:
+            keys, pks = narrow(keys, pks, descending, after, k)
+            pairs = zip(keys.tolist(), pks.tolist())
+        else:
+            pairs = zip(keys, pks)
+            if after is not None:
+                if descending:
+                    pairs = (pair for pair in pairs if pair < after)
+                else:
+                    pairs = (pair for pair in pairs if pair > after)
+        if k is None:
+            best.extend(pairs)
+        elif descending:
+            best = heapq.nlargest(k, chain(best, pairs))
+        else:
+            best = heapq.nsmallest(k, chain(best, pairs))
+    if k is None:
+        best.sort(reverse=descending)
+    return array("q", [pk for key, pk in best])
+
+
+# Function 4: Drop the rows of a chunk that cannot make the top k
+#   Rows past the cursor are masked out, then everything worse than the
+#   k-th key is, ties with the k-th key are kept for the pk tie break.
+def narrow(keys, pks, descending, after, k):
+    if after is not None:
+        key, pk = after
+        if descending:
+            keep = (keys < key) | ((keys == key) & (pks < pk))
+        else:
+            keep = (keys > key) | ((keys == key) & (pks > pk))
+        keys, pks = keys[keep], pks[keep]
+    if k is not None and len(keys) > k:
+        if descending:
+            keep = keys >= numpy.partition(keys, len(keys) - k)[len(keys) - k]
+        else:
+            keep = keys <= numpy.partition(keys, k - 1)[k - 1]
+        keys, pks = keys[keep], pks[keep]
+    return keys, pks
+
+
+# Reverse Set Class: descriptor for the rows referencing an object
+#   user.account_set is Account.filter(db, user=user), or the rows loaded
+#   by prefetch_related when there are some.
+class ReverseSet:
+    # Function 1: Initializer
+    def __init__(self, model, field_name, name):
+        self.model = model
+        self.field_name = field_name
+        self.name = name
+
+    # Function 2: Query of the rows referencing obj
+    def __get__(self, obj, obj_type=None):
+        if obj is None:
+            return self
+        prefetched = obj._prefetched
+        if prefetched is not None and self.name in prefetched:
+            return prefetched[self.name]
+        return self.model.filter(obj.db, **{self.field_name: obj})
+
+
+# Query Set Class
+#   Holds the table, the database and the filters, nothing is sent until the
+#   ids are needed. The ids come from scans only, rows are fetched in
+#   batches as the iteration reaches them.
+class QuerySet:
+    # Data member 1: Table class and database "model" and "db"
+
+    # Data member 2: Filter arguments of every chained filter() "_filters"
+    #                <tuple> of (<str>, value)
+
+    # Data member 3: Slice applied to the matching ids "_start" and "_stop"
+
+    # Data member 4: Matching ids "_ids" and fetched objects "_cache", or None
+
+    # Data member 5: Plan that produced the ids "_plan", or None
+
+    # Data member 6: Foreign keys fetched along with every batch "_related"
+    #                and reverse accessors loaded for every batch "_prefetch"
+    #                <tuple> of <str>
+
+    # Data member 7: Fields read for every row "_only", None for all of them
+    #                <tuple> of <str>
+
+    # Data member 8: Sort order "_order", None for ascending ids
+    #                (<str> column, <bool> descending, (key, pk) cursor or None)
+
+    # Function 1: Initializer
+    def __init__(self, model, db, filters=(), start=0, stop=None, related=(), prefetch=(),
+                 only=None, order=None):
+        self.model = model
+        self.db = db
+        self._filters = filters
+        self._start = start
+        self._stop = stop
+        self._ids = None
+        self._cache = None
+        self._plan = None
+        self._related = related
+        self._prefetch = prefetch
+        self._only = only
+        self._order = order
+
+    # Function 2: Represent, fetches the rows
+    def __repr__(self):
+        return repr(list(self))
+
+    # Function 3: Chain more filters, the result matches all of them
+    def filter(self, **kwargs):
+        if self._start != 0 or self._stop is not None:
+            raise TypeError("Cannot filter a query once a slice has been taken")
+        return QuerySet(self.model, self.db, self._filters + tuple(kwargs.items()),
+                        related=self._related, prefetch=self._prefetch, only=self._only,
+                        order=self._order)
+
+    # Function 4: First n matches
+    def limit(self, n):
+        return self[:n]
+
+    # Function 5: Number of matches, no row is fetched
+    def count(self):
+        if self._cache is not None:
+            return len(self._cache)
+        if self._ids is None and self._order is not None and self._order[2] is None \
+                and self._start == 0 and self._stop is None:
+            # without a slice or a cursor the order does not change how many
+            # rows match, so the sort column is not fetched
+            self._plan = self.model._plan(self.db, self._filters)
+            return len(self._plan.execute())
+        return len(self.ids())
+
+    def __len__(self):
+        return self.count()
+
+    # Function 6: True if anything matches, no row is fetched
+    def exists(self):
+        return self.count() > 0
+
+    def __bool__(self):
+        return self.exists()
+
+    # Function 7: First match, or None
+    def first(self):
+        for obj in self[:1]:
+            return obj
+        # the first id may have been dropped since the scan
+        for obj in self:
+            return obj
+        return None
+
+    # Function 8: Index or slice
+    #   An int fetches that one row, a slice returns a new lazy query.
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step not in (None, 1):
+                raise ValueError("Query slices do not support a step")
+            start, stop = key.start or 0, key.stop
+            if start < 0 or stop is not None and stop < 0:
+                raise ValueError("Query slices do not support negative indices")
+            # slices compose relative to the current slice
+            start = self._start + start
+            if stop is not None:
+                stop = self._start + stop
+                if self._stop is not None:
+                    stop = min(stop, self._stop)
+            elif self._stop is not None:
+                stop = self._stop
+            query = QuerySet(self.model, self.db, self._filters, start, stop,
+                             self._related, self._prefetch, self._only, self._order)
+            if self._ids is not None:
+                query._ids = self._ids[start - self._start:None if stop is None else stop - self._start]
+                query._plan = self._plan
+            return query
+        if type(key) is not int:
+            raise TypeError("Query indices must be int or slice")
+        if self._cache is not None:
+            return self._cache[key]
+        ids = self.ids()
+        obj = self.model.get(self.db, ids[key])
+        for path in self._related:
+            load_related([obj], path)
+        for name in self._prefetch:
+            prefetch_reverse([obj], name)
+        return obj
+
+    # Function 9: Iterate the matching objects
+    #   Rows are fetched FETCH_BATCH at a time through get_many, rows
+    #   dropped since the scan are skipped.
+    def __iter__(self):
+        if self._cache is not None:
+            return iter(self._cache)
+        return self._fetch()
+
+    def _fetch(self):
+        ids = self.ids()
+        objects = []
+        for start in range(0, len(ids), FETCH_BATCH):
+            batch = ids[start:start + FETCH_BATCH]
+            if self._only is None:
+                rows = self.db.get_many(self.model.__name__, batch, missing="none")
+                loaded = [self.model._from_row(self.db, pk, *row)
+                          for pk, row in zip(batch, rows) if row is not None]
+            else:
+                loaded = self.model._partial_rows(self.db, batch, self._only)
+            if loaded:
+                for path in self._related:
+                    load_related(loaded, path)
+                for name in self._prefetch:
+                    prefetch_reverse(loaded, name)
+            objects.extend(loaded)
+            yield from loaded
+        # a full pass is kept, iterating again does not fetch again
+        self._cache = objects
+
+    # Function 10: Fetch the rows behind these foreign keys with every batch
+    #   "location" for a field, "a__b" to follow a foreign key of a
+    def select_related(self, *fields):
+        return self._derive(self._related + fields, self._prefetch, self._only)
+
+    # Function 11: Load these reverse accessors for every batch
+    #   "account_set" groups the Accounts of each fetched User
+    def prefetch_related(self, *names):
+        return self._derive(self._related, self._prefetch + names, self._only)
+
+    # query set holding loaded objects, used for prefetched reverse accessors
+    @classmethod
+    def of(cls, model, db, objects, filters=()):
+        query = cls(model, db, filters)
+        query._cache = objects
+        query._ids = array("q", [obj.pk for obj in objects])
+        return query
+
+    def _derive(self, related, prefetch, only):
+        query = QuerySet(self.model, self.db, self._filters, self._start, self._stop,
+                         related, prefetch, only, self._order)
+        query._ids = self._ids
+        query._plan = self._plan
+        return query
+
+    # Function 12: Matching ids after the slice, in ascending order or in
+    #   the order given by order_by
+    def ids(self):
+        if self._ids is None:
+            filters = self._filters
+            if self._order is not None and self._order[2] is not None:
+                column, descending, after = self._order
+                # the server drops the rows before the cursor key, it takes no
+                # range scan on pks and foreign keys so sorted_ids does it then
+                if column != "id" and type(dict(self.model._fields)[column]) is not Foreign:
+                    filters += (("%s__%s" % (column, "le" if descending else "ge"), after[0]),)
+            self._plan = self.model._plan(self.db, filters)
+            ids = self._plan.execute()
+            if self._order is not None:
+                column, descending, after = self._order
+                ids = sorted_ids(self.db, self.model.__name__, ids, column, descending,
+                                 after, self._stop)
+            self._ids = ids[self._start:self._stop]
+        return self._ids
+
+    # Function 13: Scans the query runs and the ids each one returned,
+    #   runs the query if it has not run yet
+    def explain(self):
+        if self._plan is None:
+            self.ids()
+        return self._plan.explain()
+
+    # Function 14: Columns of the matching rows, one per stored column
+    #   values_list("balance") holds every balance in one array and builds
+    #   no object per row. Foreign keys come as pks, datetimes as timestamps
+    #   and a coordinate as its "_lat" and "_lon" columns, "id" is the pk.
+    #   Rows dropped since the scan are left out of every column.
+    #   container: "array", "numpy" or "list", as for Database.scan
+    def values_list(self, *fields, container="array"):
+        columns = self.model._columns([name for name in fields if name != "id"])
+        result = self.db.fetch_columns(self.model.__name__, self.ids(), columns, container)
+        ret = []
+        for name in fields:
+            if name == "id":
+                ret.append(result["id"])
+            else:
+                ret.extend(result[column] for column in self.model._columns([name]))
+        return tuple(ret)
+
+    # Function 15: Read only these fields of every row
+    #   The objects stay deferred, another field is fetched with the whole
+    #   row on first access.
+    def only(self, *fields):
+        self.model._columns(fields)
+        return self._derive(self._related, self._prefetch, fields)
+
+    # Function 16: Sum, Avg, Min, Max and Count over the matching rows
+    #   Only the needed columns are fetched, a chunk at a time, see
+    #   aggregate.aggregate. group_by gives one result per distinct value.
+    def aggregate(self, *aggregates, group_by=None):
+        return aggregate(self.model, self.db, self.ids(), aggregates, group_by)
+
+    # Function 17: Sort by a field, "-start" for descending
+    #   Slicing an ordered query fetches the sort column of the matching
+    #   rows only and keeps the best rows of the slice, then fetches just
+    #   those rows. after is the last object of the previous page, or its
+    #   (value, pk), the next page starts right after it. Ties are ordered
+    #   by pk.
+    def order_by(self, field, after=None):
+        if self._start != 0 or self._stop is not None:
+            raise TypeError("Cannot reorder a query once a slice has been taken")
+        descending = field.startswith("-")
+        name = field.lstrip("-")
+        fields = dict(self.model._fields)
+        if name in ("id", "pk"):
+            name = "id"
+        elif name not in fields:
+            raise AttributeError("%s has no field %s" % (self.model.__name__, name))
+        elif type(fields[name]) is Coordinate:
+            raise TypeError("Cannot order by a Coordinate field")
+        if after is not None:
+            after = self._cursor(name, after)
+        return QuerySet(self.model, self.db, self._filters, related=self._related,
+                        prefetch=self._prefetch, only=self._only,
+                        order=(name, descending, after))
+
+    # (key, pk) of a cursor object or pair, as stored on the server
+    def _cursor(self, name, after):
+        if isinstance(after, tuple):
+            value, pk = after
+        else:
+            value, pk = (after.pk if name == "id" else getattr(after, name)), after.pk
+        if type(pk) is not int:
+            raise TypeError("Cursor has no pk")
+        if isinstance(value, datetime):
+            value = value.timestamp()
+        elif name != "id" and type(dict(self.model._fields)[name]) is Foreign and value is not None \
+                and type(value) is not int:
+            value = value.pk
+        return value, pk
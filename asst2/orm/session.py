@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+#
+# session.py
+#
+# Definition for the session that keeps one object per row
+#
+from weakref import WeakKeyDictionary
+
+# active sessions of every database, innermost last
+_active = WeakKeyDictionary()
+
+
+# Helper Function
+# Function 1: Innermost active session of a database, or None
+def current(db):
+    if not _active:
+        return None
+    sessions = _active.get(db)
+    if sessions:
+        return sessions[-1]
+    return None
+
+
+# Session Class: identity map of the objects loaded through one database
+#   While a session is active every row is one object: get() of a row the
+#   session holds is answered from memory, and a row fetched again by a
+#   query updates that object in place when its version moved on. The map
+#   is dropped when the session ends.
+class Session:
+    # Data member 1: Database the session is bound to "db"
+
+    # Data member 2: Loaded objects "_objects"
+    #                <dict> -> (<str>, <int>) : <Table>
+
+    # Function 1: Initializer
+    def __init__(self, db):
+        self.db = db
+        self._objects = dict()
+        self._stats = {"hits": 0, "misses": 0, "refreshed": 0}
+
+    # Function 2: Represent
+    def __repr__(self):
+        return "<ORM Session object, %d rows>" % len(self._objects)
+
+    # Function 3: Number of objects held
+    def __len__(self):
+        return len(self._objects)
+
+    # Function 4: Context manager, the session is active inside the block
+    def __enter__(self):
+        _active.setdefault(self.db, []).append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    # Function 5: Object of a row, fetched only if the session lacks it
+    def get(self, model, pk):
+        if current(self.db) is not self:
+            raise RuntimeError("Session is not active")
+        return model.get(self.db, pk)
+
+    # Function 6: True if the server holds a newer version of the object
+    def stale(self, obj):
+        values, version = self.db.get(obj._table_name, obj.pk)
+        return version != obj.version
+
+    # Function 7: Read the object again from the server
+    def refresh(self, obj):
+        values, version = self.db.get(obj._table_name, obj.pk)
+        if version != obj.version:
+            obj._fill(values, version)
+            self._stats["refreshed"] += 1
+        return obj
+
+    # Function 8: Snapshot of the session metrics
+    def stats(self):
+        stats = dict(self._stats)
+        stats["objects"] = len(self._objects)
+        return stats
+
+    # Function 9: Write every held object changed since it was read in one
+    #   pipelined batch, returns the (object, exception) pairs that failed
+    def flush(self, atomic=True):
+        dirty = [obj for obj in self._objects.values()
+                 if obj._dirty or obj._loaded is None and not obj._deferred]
+        if not dirty:
+            return []
+        # bulk_save takes objects of any table
+        return type(dirty[0]).bulk_save(self.db, dirty, atomic)
+
+    # Function 10: End the session and release the objects
+    def close(self):
+        sessions = _active.get(self.db)
+        if sessions and self in sessions:
+            sessions.remove(self)
+            if not sessions:
+                del _active[self.db]
+        self._objects.clear()
+
+    # Object held for a row, or None
+    def _lookup(self, table_name, pk):
+        obj = self._objects.get((table_name, pk))
+        if obj is None:
+            self._stats["misses"] += 1
+        else:
+            self._stats["hits"] += 1
+        return obj
+
+    # Object for a fetched row, the held one is refreshed if it is older
+    #   unless it has unsaved changes, which save() checks against the
+    #   version they were made on
+    def _merge(self, obj, values, version):
+        if obj._deferred:
+            obj._fill(values, version)
+        elif obj.version != version and not obj._dirty:
+            obj._fill(values, version)
+            self._stats["refreshed"] += 1
+        return obj
+
+    def _add(self, obj):
+        self._objects[(obj._table_name, obj.pk)] = obj
+
+    def _discard(self, obj):
+        self._objects.pop((obj._table_name, obj.pk), None)
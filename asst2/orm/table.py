@@ -6,111 +6,103 @@
 #
 from .field import *
 from .easydb import *
+from .query import QuerySet, ReverseSet
+from .planner import *
+from . import session
+from .codegen import build_set_row, build_from_row, build_to_row
+from . import geo
 from collections import OrderedDict
-<<<<<<< HEAD
-from datetime import datetime, timezone
-=======
 from datetime import datetime
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
-
-# EasyDB query operators
-OP_AL = 1  # all
-OP_EQ = 2  # equal
-OP_NE = 3  # not equal
-OP_LT = 4  # less than
-OP_GT = 5  # greater than
-OP_LE = 6  # less than or equal
-OP_GE = 7  # greater than or equal
 
 
 # Helper Functions
-# Helper 1: process the elements
-# Helper function of Save
-<<<<<<< HEAD
-def flatten(lst):
-    # simple flattener, cannot handle cyclical lists
-    if len(lst) == 0:
-        return []
-    if type(lst[0]) in (tuple, list):
-        return flatten(lst[0]) + flatten(lst[1:])
-=======
-def element_processor(input_list):
-    if len(input_list) == 0:
-        return []
-    if type(input_list[0]) in (tuple, list):
-        return element_processor(input_list[0]) + element_processor(input_list[1:])
-    else:
-        return [input_list[0]] + element_processor(input_list[1:])
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
-
-
-
-# Helper 2: Get List of id
+# Helper 1: Turn filter arguments into the predicates of a plan
 # Helper function of Filter and Count
-def id_list(cls, db, dic, **kwargs):
-    # Corner Case 1. Name not exists
-    if not type(db) == Database:
-        raise TypeError
-
-    # initialize variables
-    value = kwargs.items()
-    column = kwargs.items()
-    column_name = column
-    op = OP_AL
-
-    for column, value in kwargs.items():
+#   Returns the predicates and the geo filters.
+def predicates(cls, filters):
+    fields = dict(cls._fields)
+    ret = []
+    geos = []
+
+    for column, value in filters:
         if "__" in column:
             column_name, op = column.split("__")
+            # Case 0. bounding box and radius of a Coordinate
+            if op in geo.GEO_LOOKUPS:
+                if type(fields.get(column_name)) is not Coordinate:
+                    raise AttributeError
+                geos.append(geo.GEO_LOOKUPS[op](column_name, value))
+                continue
             try:
-                op = dic[op]
+                op = LOOKUPS[op]
             except KeyError:
                 raise AttributeError
         else:
             op = OP_EQ
-<<<<<<< HEAD
-=======
             column_name = column
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
-
-    # auto unboxing
-    # Case 1. table
-    if isinstance(value, Table):
-        value = value.pk
-    # Case 2. date_time
-    if isinstance(value, datetime):
-        value = value.timestamp()
-
-    # Case 3. Coordinate
-    if isinstance(value, tuple) or isinstance(value, list):
-<<<<<<< HEAD
-        # Only Coordinate uses tuple/list
-        ids_1 = set(db.scan(cls.__name__, op, column_name + '_lat', value[0]))
-        ids_2 = set(db.scan(cls.__name__, op, column_name + '_lon', value[1]))
-        ids = list(sorted(list(ids_1.intersection(ids_2))))
-        return ids
-
-    # Case 4. other cases
-    ids = db.scan(cls.__name__, op, column_name, value)
-    return ids
-=======
-        return list(sorted(list(
-            set(db.scan(cls.__name__, op, column_name + '_lat', value[0])).intersection(
-                set(db.scan(cls.__name__, op, column_name + '_lon', value[1]))))))
-
-    # Case 4. other cases
-    return db.scan(cls.__name__, op, column_name, value)
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
+
+        # auto unboxing
+        # Case 1. table
+        if isinstance(value, Table):
+            value = value.pk
+        # Case 2. date_time
+        if isinstance(value, datetime):
+            value = value.timestamp()
+
+        # Case 3. Coordinate, one predicate per stored column
+        if type(fields.get(column_name)) is Coordinate:
+            if type(value) not in (tuple, list) or len(value) != 2:
+                raise TypeError
+            ret.append(Predicate(column_name + "_lat", op, value[0]))
+            ret.append(Predicate(column_name + "_lon", op, value[1]))
+        # Case 4. "al" needs no column
+        elif op == OP_AL:
+            ret.append(Predicate(None, OP_AL, None))
+        # Case 5. other cases
+        else:
+            ret.append(Predicate(column_name, op, value))
+    return ret, geos
+
+
+# Helper 2: Objects to save and the unsaved foreign key targets they need
+# Helper function of Bulk Save
+#   Returns the objects in the order they were reached, the number of
+#   unsaved targets every object waits for and the objects waiting for it,
+#   both keyed by id().
+def dependencies(objects):
+    order = []
+    needs = {}
+    dependents = {}
+    queue = list(objects)
+    for obj in queue:
+        if id(obj) in needs:
+            continue
+        order.append(obj)
+        targets = set()
+        for name in obj._foreign_names:
+            target = getattr(obj, name)
+            if target is not None and target.pk is None and id(target) not in targets:
+                targets.add(id(target))
+                dependents.setdefault(id(target), []).append(obj)
+                queue.append(target)
+        needs[id(obj)] = len(targets)
+    return order, needs, dependents
 
 
 # metaclass of table
 # used to implement methods only for the class itself?
 # Implement me or change me. (e.g. use class decorator instead?)
 class MetaTable(type):
-<<<<<<< HEAD
     table_register = []
     table_name_register = []
 
     def __new__(mcs, cls_name, bases, kwargs):
+        # values are stored in generated slots, "_name_value" per field,
+        # so instances carry no __dict__
+        if cls_name != "Table" and "__slots__" not in kwargs:
+            kwargs["__slots__"] = tuple(slot_name(key) for key, value in kwargs.items()
+                                        if isinstance(value, Field))
+
         # initialize class
         cls = super().__new__(mcs, cls_name, bases, kwargs)
 
@@ -126,35 +118,39 @@ class MetaTable(type):
                 if not isinstance(value, Field):
                     continue
                 cls._fields.append((key, value))
+            cls._field_names = tuple(key for key, value in cls._fields)
+            cls._table_name = cls_name
 
             if cls_name in MetaTable.table_name_register:
                 raise AttributeError
 
+            # reverse accessor on every referenced table, "account_set" on
+            # User for Account.user, "<table>_<field>_set" when a table
+            # references the same table more than once
+            targets = [value.table for key, value in cls._fields if type(value) is Foreign]
+            for key, value in cls._fields:
+                if type(value) is Foreign:
+                    if targets.count(value.table) == 1:
+                        name = "%s_set" % cls_name.lower()
+                    else:
+                        name = "%s_%s_set" % (cls_name.lower(), key)
+                    if hasattr(value.table, name):
+                        raise AttributeError
+                    setattr(value.table, name, ReverseSet(cls, key, name))
+
+            # generated trusted constructor for rows read from the server
+            # and serializer of the values sent to it
+            cls._set_row = staticmethod(build_set_row(cls))
+            cls._from_row = staticmethod(build_from_row(cls))
+            cls._to_row = staticmethod(build_to_row(cls))
+            cls._foreign_names = tuple(key for key, value in cls._fields if type(value) is Foreign)
+
             # append to register
             MetaTable.table_register.append(cls)
             cls._register = MetaTable.table_register
             MetaTable.table_name_register.append(cls_name)
 
         # define class in global namespace
-=======
-    cls_obj_list = []
-    cls_name_list = []
-
-    def __new__(mcs, cls_name, bases, kwargs):
-        cls = super().__new__(mcs, cls_name, bases, kwargs)
-        if cls_name != "Table":
-            cls._fields = []
-            if cls_name == "pk":
-                raise AttributeError
-            for key, value in kwargs.items():
-                if isinstance(value, Field):
-                    cls._fields.append((key, value))
-            if cls_name in MetaTable.cls_name_list:
-                raise AttributeError
-            MetaTable.cls_obj_list.append(cls)
-            cls._register = MetaTable.cls_obj_list
-            MetaTable.cls_name_list.append(cls_name)
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
         globals()[cls_name] = cls
         return cls
 
@@ -164,44 +160,183 @@ class MetaTable(type):
 
     # get the desired object
     def get(cls, db, pk):
+        active = session.current(db)
+        if active is not None:
+            # an object the session holds is answered from memory
+            obj = active._lookup(cls.__name__, pk)
+            if obj is not None:
+                if obj._deferred:
+                    obj._load()
+                return obj
         values, version = db.get(cls.__name__, pk)
+        return cls._from_row(db, pk, values, version)
 
+    # position of a field in the values of a row
+    def _value_index(cls, field_name):
         value_index = 0
-        kwargs = {}
-
-        for field_name, obj in cls._fields:
-            if type(obj) is Coordinate:
-                kwargs[field_name] = (values[value_index], values[value_index + 1])
-                value_index += 2
+        for name, obj in cls._fields:
+            if name == field_name:
+                return value_index
+            value_index += 2 if type(obj) is Coordinate else 1
+        raise AttributeError
+
+    # object standing for a row that is fetched on first field access
+    def _deferred_row(cls, db, pk):
+        active = session.current(db)
+        if active is not None:
+            obj = active._objects.get((cls.__name__, pk))
+            if obj is not None:
+                return obj
+        obj = cls.__new__(cls)
+        obj.pk = pk
+        obj.version = None
+        obj.db = db
+        obj._deferred = True
+        obj._prefetched = None
+        obj._loaded = None
+        obj._dirty = None
+        if active is not None:
+            active._add(obj)
+        return obj
+
+    # Save many objects, returns the (object, exception) pairs that failed
+    #   Unsaved foreign key targets are saved too. Objects are written in
+    #   levels, each level only references objects of the levels before it
+    #   and goes out as one pipelined batch; pk and version are filled back
+    #   into every saved object. Unchanged objects are not written. A
+    #   failed object fails the objects that reference it with
+    #   InvalidReference, objects referencing each other in a cycle fail
+    #   with IntegrityError, the others are still saved.
+    # atomic: bool, True for atomic updates or False for non-atomic updates
+    def bulk_save(cls, db, objects, atomic=True):
+        if not isinstance(db, Database):
+            raise TypeError
+        order, needs, dependents = dependencies(objects)
+        position = dict((id(obj), i) for i, obj in enumerate(order))
+        failed = {}
+
+        def fail(obj, error):
+            failed[id(obj)] = (obj, error)
+            for dependent in dependents.get(id(obj), ()):
+                if id(dependent) not in failed:
+                    fail(dependent, InvalidReference("Foreign key target was not saved"))
+
+        level = [obj for obj in order if needs[id(obj)] == 0]
+        saved = 0
+        while level:
+            replies = []
+            rows = []
+            with db.pipeline() as pipe:
+                for obj in level:
+                    values = obj.value_processor() if obj.pk is None else obj._changes()
+                    try:
+                        if values is None:
+                            reply = None
+                        elif obj.pk is None:
+                            reply = pipe.insert(obj._table_name, values)
+                        else:
+                            reply = pipe.update(obj._table_name, obj.pk, values,
+                                                obj.version if atomic else None)
+                    except PacketError as error:
+                        reply = error
+                    replies.append(reply)
+                    rows.append(values)
+
+            active = session.current(db)
+            next_level = []
+            for obj, reply, values in zip(level, replies, rows):
+                if isinstance(reply, Exception):
+                    error = reply
+                else:
+                    error = None if reply is None else reply.exception()
+                if error is not None:
+                    fail(obj, error)
+                    continue
+                saved += 1
+                if reply is None:
+                    pass
+                elif obj.pk is None:
+                    obj.pk, obj.version = reply.result()
+                    obj._saved(values)
+                    if active is not None:
+                        active._add(obj)
+                else:
+                    obj.version = reply.result()
+                    obj._saved(values)
+                for dependent in dependents.get(id(obj), ()):
+                    needs[id(dependent)] -= 1
+                    if needs[id(dependent)] == 0 and id(dependent) not in failed:
+                        next_level.append(dependent)
+            level = next_level
+
+        # whatever never became ready waits on a cycle
+        if saved + len(failed) < len(order):
+            for obj in order:
+                if id(obj) not in failed and needs[id(obj)] > 0:
+                    fail(obj, IntegrityError("Foreign key cycle between unsaved objects"))
+        return sorted(failed.values(), key=lambda item: position[id(item[0])])
+
+    # Aggregates over the rows matching the query, Account.aggregate(db,
+    # Sum("balance"), group_by="type", user=user) sums the balances of a
+    # user per account type
+    # db: database object, the database to read from
+    # kwarg: the query argument for comparing
+    def aggregate(cls, db, *aggregates, group_by=None, **kwargs):
+        return cls.filter(db, **kwargs).aggregate(*aggregates, group_by=group_by)
+
+    # stored columns of the fields, a coordinate is two of them
+    def _columns(cls, field_names):
+        fields = dict(cls._fields)
+        columns = []
+        for name in field_names:
+            if name not in fields:
+                raise AttributeError("%s has no field %s" % (cls.__name__, name))
+            if type(fields[name]) is Coordinate:
+                columns += [name + "_lat", name + "_lon"]
             else:
-                kwargs[field_name] = values[value_index]
-                value_index += 1
-
-        kwargs["pk"] = pk
-        kwargs["version"] = version
-        return cls(db, **kwargs)
-
-    # filter and return a list of all desired objects
+                columns.append(name)
+        return columns
+
+    # objects of the rows with only some fields read, see QuerySet.only
+    def _partial_rows(cls, db, pks, field_names):
+        result = db.fetch_columns(cls.__name__, pks, cls._columns(field_names), "list")
+        fields = dict(cls._fields)
+        objects = []
+        for i, pk in enumerate(result["id"]):
+            obj = cls._deferred_row(db, pk)
+            objects.append(obj)
+            # a row the session already holds in full is left as it is
+            if not obj._deferred:
+                continue
+            for name in field_names:
+                field = fields[name]
+                if type(field) is Coordinate:
+                    value = (result[name + "_lat"][i], result[name + "_lon"][i])
+                elif type(field) is Foreign:
+                    value = field.table._deferred_row(db, result[name][i])
+                else:
+                    value = result[name][i]
+                setattr(obj, field.slot, value)
+        return objects
+
+    # filter and return a lazy QuerySet of the desired objects,
+    # nothing is sent to the server until it is used
     def filter(cls, db, **kwargs):
-        dic = {"ne": OP_NE, "lt": OP_LT, "gt": OP_GT}
-        ret = []
-
-        ids = id_list(cls, db, dic, **kwargs)
-
-        for obj_id in ids:
-            ret.append(cls.get(db, obj_id))
-
-        return ret
+        return QuerySet(cls, db).filter(**kwargs)
 
     # Returns the number of matches given the query. If no argument is given,
     # return the number of rows in the table.
     # db: database object, the database to get the object from
     # kwarg: the query argument for comparing
     def count(cls, db, **kwargs):
-        dic = {"al": OP_AL, "eq": OP_EQ, "ne": OP_NE, "lt": OP_LT,
-               "gt": OP_GT, "le": OP_LE, "ge": OP_GE}
+        return cls.filter(db, **kwargs).count()
 
-        return len(id_list(cls, db, dic, **kwargs))
+    # plan of the scans answering the filters
+    def _plan(cls, db, filters):
+        if not isinstance(db, Database):
+            raise TypeError
+        preds, geos = predicates(cls, filters)
+        return Plan(db, cls.__name__, preds, geos=geos)
 
     @property
     def fields(self):
@@ -210,123 +345,116 @@ class MetaTable(type):
 
 # table class
 class Table(object, metaclass=MetaTable):
+    # _deferred: True until a row referenced by a foreign key is fetched
+    # _prefetched: reverse accessors loaded by prefetch_related, or None
+    # _loaded: values of the row as last read or written, None if unknown
+    # _dirty: names of the fields assigned since then, or None
+    __slots__ = ("pk", "version", "db", "_deferred", "_prefetched", "_loaded", "_dirty",
+                 "__weakref__")
 
     def __init__(self, db, **kwargs):
-<<<<<<< HEAD
         self.pk = None  # ID
         self.version = None  # version
         if "pk" in kwargs:  # override
             self.pk = kwargs["pk"]
             self.version = kwargs["version"]
         self.db = db  # database object
-        self._table_name = self.__class__.__name__
+        self._deferred = False
+        self._prefetched = None
+        self._loaded = None
+        self._dirty = None
 
         fields = self.__class__.fields
 
         bad_fields = set(kwargs) - set(dict(fields)) - {"pk", "version"}
         if len(bad_fields) != 0:
             raise AttributeError
-        self._field_names = tuple(zip(*fields))[0]
 
         # Type conversion occurs
         for k, obj in fields:
             if k in kwargs:
                 if type(obj) is Foreign:
                     if type(kwargs[k]) is int:  # parse from int to foreign key
-                        kwargs[k] = obj.table.get(self.db, kwargs[k])  # recursive
+                        # fetched when one of its fields is first read
+                        kwargs[k] = obj.table._deferred_row(self.db, kwargs[k])
                 if type(obj) is DateTime:
                     if type(kwargs[k]) is float:  # parse from float to datetime
                         kwargs[k] = datetime.fromtimestamp(kwargs[k])
-=======
-        self.pk = None
-        self.version = None
-        if "pk" in kwargs:
-            self.pk = kwargs["pk"]
-            self.version = kwargs["version"]
-        self.db = db
-        self._table_name = self.__class__.__name__
-
-        fields = self.__class__.fields
-        self._field_names = tuple(zip(*fields))[0]
-
-        for k, obj in fields:
-            if k in kwargs:
-                if type(obj) is Foreign and type(kwargs[k]) is int:
-                    kwargs[k] = obj.table.get(self.db, kwargs[k])
-                if type(obj) is DateTime and type(kwargs[k]) is float:
-                    kwargs[k] = datetime.fromtimestamp(kwargs[k])
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
                 setattr(self, k, kwargs[k])
             else:
                 setattr(self, k, None)
 
-    def value_processor(self):
-        values = list(map(lambda field: getattr(self, field), self._field_names))
-        new_values = []
-        for i in range(len(values)):
-            value = values[i]
-<<<<<<< HEAD
-            # foreign key parsing
-            if isinstance(value, Table):
-                new_values.append(value.pk)
-            elif type(value) is datetime:
-                # convert to POSIX timestamp
-                new_values.append(value.timestamp())
-            else:
-                new_values.append(value)
+    # fetch a deferred row
+    def _load(self):
+        values, version = self.db.get(self._table_name, self.pk)
+        self._fill(values, version)
+
+    # fill a deferred row with the values and version of the fetched row
+    def _fill(self, values, version):
+        type(self)._set_row(self, values, version)
 
-        return flatten(new_values)
+    # values of the row in column order, see codegen.build_to_row
+    def value_processor(self):
+        return type(self)._to_row(self)
+
+    # values to write, or None when nothing changed since the row was read
+    def _changes(self):
+        # assigning a field fetches a deferred row, so one still deferred
+        # is unchanged
+        if self._deferred:
+            return None
+        if self._loaded is not None and not self._dirty:
+            return None
+        values = self.value_processor()
+        # fields assigned their old value again
+        if self._loaded is not None and values == list(self._loaded):
+            self._dirty = None
+            return None
+        return values
+
+    # record the values just written as the snapshot
+    def _saved(self, values):
+        self._loaded = values
+        self._dirty = None
+        geo.track(self)
 
     def _save_subroutine(self, atomic):
         # New entry
         if self.pk is None:
-            self.pk, self.version = self.db.insert(self._table_name, self._values())
+            values = self.value_processor()
+            self.pk, self.version = self.db.insert(self._table_name, values)
+            active = session.current(self.db)
+            if active is not None:
+                active._add(self)
         else:
-            args = [self._table_name, self.pk, self._values()]
+            # a clean row is not written, its version stays as it is
+            values = self._changes()
+            if values is None:
+                return
+            args = [self._table_name, self.pk, values]
             if atomic:
                 args.append(self.version)
             self.version = self.db.update(*args)
+        self._saved(values)
 
-    # Save the row by calling insert or update commands.
+    # Save the row by calling insert or update commands, nothing is sent
+    # for a row unchanged since it was read or saved.
     # atomic: bool, True for atomic update or False for non-atomic update
-=======
-            if isinstance(value, Table):
-                new_values.append(value.pk)
-            elif type(value) is datetime:
-                new_values.append(value.timestamp())
-            else:
-                new_values.append(value)
-        return element_processor(new_values)
-
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
     def save(self, atomic=True):
-        values = list(map(lambda field: getattr(self, field), self._field_names))
-        for i in range(len(values)):
-            value = values[i]
-<<<<<<< HEAD
-            # foreign key
-            if isinstance(value, Table):
-                # not saved yet
-                if value.pk is None:
-                    value.save(atomic)
+        for name in self._foreign_names:
+            value = getattr(self, name)
+            # foreign key not saved yet
+            if value is not None and value.pk is None:
+                value.save(atomic)
         self._save_subroutine(atomic)
 
     # Delete the row from the database.
-=======
-            if isinstance(value, Table):
-                if value.pk is None:
-                    value.save(atomic)
-        if self.pk is None:
-            self.pk, self.version = self.db.insert(self._table_name, self.value_processor())
-        else:
-            args = [self._table_name, self.pk, self.value_processor()]
-            if atomic:
-                args.append(self.version)
-            self.version = self.db.update(*args)
-
->>>>>>> 80676bc8aa71c4f986e9d2fa060e44030cb89312
     def delete(self):
         table_name = type(self).__name__
         self.db.drop(table_name, self.pk)
+        active = session.current(self.db)
+        if active is not None:
+            active._discard(self)
+        geo.untrack(self)
         self.version = None
         self.pk = None
@@ -14,9 +14,9 @@ def get_self(value):
     return value  # throughput
 
 
+#   values live on the instance under "_<name>_value"
 class TypeField:
     implemented = True  # boolean to check whether the field is implemented
-    _values = {}
 
     def __init__(self, blank=True, default=None, choices=()):
         # Error checking
@@ -29,14 +29,24 @@ class TypeField:
         self.blank = blank
         self.choices = choices
         self.default = default
-        TypeField._values[self] = {}
+        self.name = None
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.slot = "_%s_value" % name
 
     def __get__(self, obj, obj_type=None):
-        return TypeField._values[self][obj]
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            raise AttributeError(self.name) from None
 
     def __set__(self, obj, value):
         # initial setup
-        if obj not in TypeField._values[self]:
+        if not hasattr(obj, self.slot):
             if not self.blank and value is None and self.default is None:  # reject blank entries
                 raise AttributeError("Field cannot be blank.")
             if value is None:  # set as default value if none provided
@@ -48,12 +58,12 @@ class TypeField:
         value = get_self(value)
         if self.choices and value not in self.choices:
             raise ValueError("`{}` is not an allowed value.".format(value))
-        TypeField._values[self][obj] = value
+        setattr(obj, self.slot, value)
 
     def __delete__(self, obj):
         if not self.blank:
             raise AttributeError("Field cannot be blank.")
-        TypeField._values[self][obj] = None
+        setattr(obj, self.slot, None)
 
     @staticmethod
     def type_check(value):
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+#
+# conftest.py
+#
+# Fixtures shared by the ORM tests, they run against the schema in
+# schema.py and the fake server of the client tests
+#
+
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(os.path.dirname(ROOT), "asst1", "tests"))
+
+import pytest
+
+if not os.path.exists(os.path.join(ROOT, "orm", "easydb")):
+    pytest.exit("orm/easydb is missing, run make in asst2 first", returncode=4)
+
+import orm
+import schema
+from orm.planner import STATISTICS
+from fakeserver import FakeServer
+
+
+@pytest.fixture
+def server():
+    with FakeServer(orm.setup("easydb", schema).tables) as srv:
+        yield srv
+
+
+@pytest.fixture
+def db(server):
+    STATISTICS.clear()
+    db = orm.setup("easydb", schema)
+    db.connect("localhost", server.port)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def people(db):
+    users = []
+    for i in range(6):
+        user = schema.User(db, firstName="first%d" % i, lastName="odd" if i % 2 else "even",
+                           height=1.5 + 0.1 * i, age=20 + i)
+        user.save()
+        users.append(user)
+    return users
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+#
+# test_aggregate.py
+#
+# Tests for Sum, Avg, Min, Max and Count over queries
+#
+
+from datetime import datetime
+import pytest
+import schema
+from orm import aggregate, Sum, Avg, Min, Max, Count
+from fakeserver import GET
+
+
+@pytest.fixture(params=["numpy", "builtins"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        if aggregate.numpy is None:
+            pytest.skip("the orm was loaded without numpy")
+    else:
+        monkeypatch.setattr(aggregate, "numpy", None)
+    return request.param
+
+
+@pytest.fixture
+def accounts(db, people):
+    objects = []
+    for i in range(10):
+        account = schema.Account(db, user=people[i % 2], type=("Savings", "Chequing")[i % 3 == 0],
+                                 balance=10.0 * i)
+        objects.append(account)
+    assert schema.Account.bulk_save(db, objects) == []
+    return objects
+
+
+def test_totals(db, accounts, backend):
+    result = schema.Account.aggregate(db, Sum("balance"), Avg("balance"), Min("balance"),
+                                      Max("balance"), Count())
+    assert result == {"balance__sum": 450.0, "balance__avg": 45.0, "balance__min": 0.0,
+                      "balance__max": 90.0, "count": 10}
+    assert schema.User.aggregate(db, Sum("age"), lastName="odd") == {"age__sum": 21 + 23 + 25}
+
+
+def test_group_by(db, people, accounts, backend):
+    result = schema.Account.aggregate(db, Sum("balance"), Count(), group_by="type")
+    assert result == {"Chequing": {"balance__sum": 180.0, "count": 4},
+                      "Savings": {"balance__sum": 270.0, "count": 6}}
+    by_user = schema.Account.filter(db, balance__gt=15.0).aggregate(Max("balance"),
+                                                                    group_by="user")
+    assert by_user == {people[0].pk: {"balance__max": 80.0}, people[1].pk: {"balance__max": 90.0}}
+
+
+def test_chunks_stay_bounded(db, accounts, server, monkeypatch, backend):
+    monkeypatch.setattr(aggregate, "AGGREGATE_CHUNK", 3)
+    fetched = []
+    fetch_columns = db.fetch_columns
+
+    def counted(table_name, pks, columns, container):
+        fetched.append((len(pks), tuple(columns)))
+        return fetch_columns(table_name, pks, columns, container)
+
+    monkeypatch.setattr(db, "fetch_columns", counted)
+    result = schema.Account.aggregate(db, Avg("balance"), Min("balance"), group_by="type")
+    assert result["Savings"] == {"balance__avg": 45.0, "balance__min": 10.0}
+    assert fetched == [(3, ("balance", "type"))] * 3 + [(1, ("balance", "type"))]
+
+
+def test_counts_and_datetimes(db, people, server, backend):
+    capital = schema.Capital(db, location=(1.0, 2.0), name="c")
+    for i in range(4):
+        schema.Parade(db, location=capital, start=1000.0 * (i + 1), end=9000.0).save()
+    gets = server.count(GET)
+    assert schema.User.aggregate(db, Count()) == {"count": 6}
+    assert server.count(GET) == gets
+    assert schema.Capital.aggregate(db, Count("location")) == {"location__count": 1}
+    result = schema.Parade.aggregate(db, Min("start"), Avg("start"), group_by="end")
+    assert result == {datetime.fromtimestamp(9000.0): {
+        "start__min": datetime.fromtimestamp(1000.0),
+        "start__avg": datetime.fromtimestamp(2500.0)}}
+    assert schema.Parade.aggregate(db, Max("start"), start__gt=datetime.fromtimestamp(10 ** 6)) == {"start__max": None}
+
+
+def test_bad_aggregates(db):
+    with pytest.raises(TypeError):
+        schema.User.aggregate(db, Sum("firstName"))
+    with pytest.raises(TypeError):
+        schema.User.aggregate(db, "age")
+    with pytest.raises(AttributeError):
+        schema.User.aggregate(db, Sum("weight"))
+    with pytest.raises(AttributeError):
+        schema.Capital.aggregate(db, Count(), group_by="location")
+
+
+def test_integer_sums_do_not_wrap(db, backend):
+    big = 2 ** 62
+    for i in range(4):
+        schema.User(db, firstName="b%d" % i, lastName="big", height=1.0, age=big + i).save()
+    result = schema.User.aggregate(db, Sum("age"), Avg("age"), lastName="big")
+    assert result == {"age__sum": 4 * big + 6, "age__avg": (4 * big + 6) / 4}
+    grouped = schema.User.aggregate(db, Sum("age"), Avg("age"), group_by="lastName")
+    assert grouped == {"big": result}
+    assert type(grouped["big"]["age__sum"]) is int
+
+
+def test_count_and_dropped_rows(db, people, monkeypatch, backend):
+    fetch_columns = db.fetch_columns
+
+    def drop_first(table_name, pks, columns, container):
+        # the row goes away between the scan and the fetch
+        if len(pks) == 6:
+            db.drop("User", people[0].pk)
+        return fetch_columns(table_name, pks, columns, container)
+
+    monkeypatch.setattr(db, "fetch_columns", drop_first)
+    # with a column fetched every aggregate skips the dropped row
+    assert schema.User.aggregate(db, Count(), Sum("age")) == {"count": 5, "age__sum": 115}
+    monkeypatch.setattr(db, "fetch_columns", fetch_columns)
+    scan = db.scan
+
+    def drop_after(*args):
+        ids = scan(*args)
+        db.drop("User", people[1].pk)
+        return ids
+
+    # Count() alone fetches nothing, it counts the ids of the scan
+    monkeypatch.setattr(db, "scan", drop_after)
+    assert schema.User.aggregate(db, Count()) == {"count": 5}
+    monkeypatch.setattr(db, "scan", scan)
+    assert schema.User.aggregate(db, Count()) == {"count": 4}
+    schema.User(db, firstName="late", lastName="odd", height=1.0, age=1).save()
+    assert schema.User.aggregate(db, Count(), group_by="lastName") == \
+        {"odd": {"count": 3}, "even": {"count": 2}}
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+#
+# test_bulk_save.py
+#
+# Tests for bulk_save, the dependency ordered batch save
+#
+
+import pytest
+import orm
+import schema
+from fakeserver import INSERT, UPDATE
+
+
+@pytest.fixture
+def pipelines(db, monkeypatch):
+    opened = []
+    pipeline = db.pipeline
+
+    def counted(*args, **kwargs):
+        opened.append(args)
+        return pipeline(*args, **kwargs)
+
+    monkeypatch.setattr(db, "pipeline", counted)
+    return opened
+
+
+def user(db, i):
+    return schema.User(db, firstName="u%d" % i, lastName="l", height=1.0, age=i)
+
+
+def test_levels_go_out_in_order(db, server, pipelines):
+    owners = [user(db, i) for i in range(3)]
+    accounts = [schema.Account(db, user=owners[i % 3], type="Savings", balance=1.0 * i)
+                for i in range(7)]
+    assert schema.Account.bulk_save(db, accounts) == []
+    # the users in one batch, then the accounts in another
+    assert len(pipelines) == 2
+    tables = [table for cmd, table, column, op in server.log if cmd == INSERT]
+    assert tables == [1] * 3 + [2] * 7
+    for obj in owners + accounts:
+        assert obj.pk is not None and obj.version == 1
+    assert db.get("Account", accounts[4].pk)[0] == [owners[1].pk, "Savings", 4.0]
+
+
+def test_updates_keep_version_checks(db, people, server):
+    changed = [schema.User.get(db, person.pk) for person in people[:3]]
+    for obj in changed:
+        obj.age += 100
+    # another writer moves the second row on
+    values, version = db.get("User", changed[1].pk)
+    db.update("User", changed[1].pk, values)
+    created = user(db, 9)
+    failed = schema.User.bulk_save(db, changed + [created])
+    assert [(obj, type(error)) for obj, error in failed] == [(changed[1], orm.TransactionAbort)]
+    assert changed[0].version == 2 and changed[2].version == 2 and created.pk is not None
+    assert schema.User.bulk_save(db, [changed[1]], atomic=False) == []
+    assert db.get("User", changed[1].pk) == (values[:3] + [121], 3)
+
+
+def test_failures_spread_to_dependents(db, server):
+    bad = user(db, 1)
+    good = user(db, 2)
+    bad._age_value = "not a number"
+    accounts = [schema.Account(db, user=owner, type="Savings", balance=1.0)
+                for owner in (bad, good, bad)]
+    failed = schema.Account.bulk_save(db, accounts)
+    assert [obj for obj, error in failed] == [accounts[0], accounts[2], bad]
+    assert all(isinstance(error, orm.InvalidReference) for obj, error in failed[:2])
+    assert isinstance(failed[2][1], orm.PacketError)
+    assert accounts[1].pk is not None and bad.pk is None
+
+
+def test_clean_objects_are_not_written(db, people, server, pipelines):
+    updates = server.count(UPDATE)
+    assert schema.User.bulk_save(db, people) == []
+    assert server.count(UPDATE) == updates
+    with pytest.raises(TypeError):
+        schema.User.bulk_save(None, people)
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+#
+# test_codegen.py
+#
+# Tests for the serializers MetaTable generates per table
+#
+
+from datetime import datetime
+import schema
+
+
+def test_generated_per_table(db):
+    for model in (schema.User, schema.Account, schema.Capital, schema.Parade):
+        assert model._to_row.__code__.co_filename == "<orm to_row>"
+        assert model._from_row.__code__.co_filename == "<orm from_row>"
+    assert schema.User._to_row is not schema.Account._to_row
+
+
+def test_flat_column_layout(db, people):
+    capital = schema.Capital(db, location=(43.7, -79.4), name="Toronto")
+    assert capital._to_row(capital) == [43.7, -79.4, "Toronto"]
+    parade = schema.Parade(db, location=capital, start=datetime.fromtimestamp(1000.0))
+    capital.save()
+    assert parade.value_processor() == [capital.pk, 1000.0, 0.0]
+    account = schema.Account(db, user=people[2], type="Savings", balance=3)
+    assert account.value_processor() == [people[2].pk, "Savings", 3.0]
+
+
+def test_round_trip_through_the_server(db):
+    capital = schema.Capital(db, location=(-33.9, 151.2), name="Sydney")
+    parade = schema.Parade(db, location=capital, start=1500.0, end=2500.0)
+    parade.save()
+    values, version = db.get("Parade", parade.pk)
+    assert values == [capital.pk, 1500.0, 2500.0]
+    assert db.get("Capital", capital.pk)[0] == [-33.9, 151.2, "Sydney"]
+    fetched = schema.Parade._from_row(db, parade.pk, values, version)
+    assert schema.Parade._to_row(fetched) == values
+    assert fetched.end == datetime.fromtimestamp(2500.0)
+    assert type(fetched._end_value) is datetime and fetched._to_row(fetched) == values
+
+
+def test_deferred_rows_load_before_serializing(db, people):
+    user = schema.User._deferred_row(db, people[3].pk)
+    assert user._deferred
+    assert schema.User._to_row(user) == ["first3", "odd", 1.5 + 0.1 * 3, 23]
+    assert not user._deferred
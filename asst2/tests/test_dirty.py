@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+#
+# test_dirty.py
+#
+# Tests for dirty tracking and session flush
+#
+
+import orm
+import schema
+from fakeserver import UPDATE
+
+
+def test_clean_save_sends_nothing(db, people, server):
+    user = schema.User.get(db, people[0].pk)
+    updates = server.count(UPDATE)
+    user.save()
+    assert server.count(UPDATE) == updates and user.version == 1
+    # the same value again leaves it clean
+    user.age = user.age
+    user.save()
+    assert server.count(UPDATE) == updates
+    user.age = 50
+    assert user._dirty == {"age"}
+    user.save()
+    assert server.count(UPDATE) == updates + 1 and user.version == 2
+    assert user._dirty is None
+    assert db.get("User", user.pk)[0][3] == 50
+
+
+def test_clean_save_does_not_abort(db, people):
+    mine = schema.User.get(db, people[1].pk)
+    values, version = db.get("User", mine.pk)
+    db.update("User", mine.pk, values[:3] + [77], version)
+    # nothing changed here, so the newer row is not a conflict
+    mine.save()
+    assert db.get("User", mine.pk) == (values[:3] + [77], 2)
+
+
+def test_flush_writes_only_dirty_objects(db, server):
+    users = [schema.User(db, firstName="u%d" % i, lastName="l", height=1.0, age=i)
+             for i in range(50)]
+    assert schema.User.bulk_save(db, users) == []
+    updates = server.count(UPDATE)
+    with orm.Session(db) as session:
+        touched = list(schema.User.filter(db, lastName="l"))
+        assert sum(user.age for user in touched) == sum(range(50))
+        touched[7].age = 700
+        touched[31].firstName = "changed"
+        assert session.flush() == []
+        assert server.count(UPDATE) == updates + 2
+        assert session.flush() == []
+        assert server.count(UPDATE) == updates + 2
+    assert db.get("User", touched[7].pk) == (["u7", "l", 1.0, 700], 2)
+    assert db.get("User", touched[31].pk)[0][0] == "changed"
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+#
+# test_fields.py
+#
+# Tests for the per-instance field storage
+#
+
+import gc
+import weakref
+import pytest
+import schema
+from orm import field, typefield
+
+
+def test_values_live_in_slots(db):
+    user = schema.User(db, firstName="a", lastName="b", height=1.0, age=3)
+    assert not hasattr(user, "__dict__")
+    assert "_firstName_value" in schema.User.__slots__
+    assert user._age_value == 3
+    assert not hasattr(field.Field, "_values")
+    assert not hasattr(typefield.TypeField, "_values")
+    with pytest.raises(AttributeError):
+        user.nickname = "c"
+
+
+def test_instances_are_collected(db):
+    user = schema.User(db, firstName="a", lastName="b", height=1.0, age=3)
+    ref = weakref.ref(user)
+    del user
+    gc.collect()
+    assert ref() is None
+
+
+def test_defaults_blank_and_choices(db, people):
+    account = schema.Account(db, user=people[0], balance=None)
+    assert account.type == "Chequing" and account.balance == 0.0
+    with pytest.raises(ValueError):
+        account.type = "Brokerage"
+    with pytest.raises(TypeError):
+        account.user = "someone"
+    # a set field cannot be cleared again
+    with pytest.raises(AttributeError):
+        account.balance = None
+    other = schema.Account(db, user=people[1], type="Savings", balance=2)
+    assert other.balance == 2.0 and type(other.balance) is float
+    assert account.type == "Chequing"
+
+
+def test_typefield_stores_on_the_instance():
+    class Row:
+        __slots__ = ("_n_value",)
+        n = typefield.Integer(blank=True, choices=(0, 1, 2))
+
+    row = Row()
+    row.n = None
+    assert row.n == 0 and row._n_value == 0
+    row.n = 2
+    with pytest.raises(ValueError):
+        row.n = 3
+    with pytest.raises(TypeError):
+        row.n = "2"
+    del row.n
+    assert row.n is None
+    assert Row.n.slot == "_n_value"
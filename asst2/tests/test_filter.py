@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+#
+# test_filter.py
+#
+# Tests for the rows of filter() being fetched through get_many
+#
+
+import schema
+from fakeserver import GET
+
+
+def test_filter_fetches_matches_in_one_batch(db, people, server):
+    gets = server.count(GET)
+    odd = list(schema.User.filter(db, lastName="odd"))
+    assert [user.firstName for user in odd] == ["first1", "first3", "first5"]
+    assert server.count(GET) - gets == 3
+
+
+def test_dropped_rows_are_skipped(db, people):
+    query = schema.User.filter(db, lastName="even")
+    ids = query.ids()
+    people[2].delete()
+    assert len(ids) == 3
+    assert [user.firstName for user in query] == ["first0", "first4"]
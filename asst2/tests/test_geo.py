@@ -0,0 +1,108 @@
+#!/usr/bin/python3
+#
+# test_geo.py
+#
+# Tests for the bounding-box and radius filters and the grid index
+#
+
+import pytest
+import orm
+import schema
+from orm import geo
+from fakeserver import SCAN, GE, LE
+
+CITIES = {"Toronto": (43.65, -79.38), "Ottawa": (45.42, -75.70), "Montreal": (45.50, -73.57),
+          "Vancouver": (49.28, -123.12), "Suva": (-18.14, 178.44), "Apia": (-13.83, -171.76),
+          "Canberra": (-35.28, 149.13), "Alert": (82.50, -62.35), "Longyearbyen": (78.22, 15.65)}
+
+
+@pytest.fixture(params=["numpy", "builtins"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        if geo.numpy is None:
+            pytest.skip("the orm was loaded without numpy")
+    else:
+        monkeypatch.setattr(geo, "numpy", None)
+    return request.param
+
+
+@pytest.fixture
+def capitals(db):
+    objects = dict((name, schema.Capital(db, location=point, name=name))
+                   for name, point in CITIES.items())
+    assert schema.Capital.bulk_save(db, list(objects.values())) == []
+    return objects
+
+
+def names(query):
+    return sorted(capital.name for capital in query)
+
+
+def test_haversine(backend):
+    toronto, montreal = CITIES["Toronto"], CITIES["Montreal"]
+    distance, = geo.haversine_km(toronto[0], toronto[1], [montreal[0]], [montreal[1]])
+    assert distance == pytest.approx(504, abs=2)
+
+
+def test_box_is_range_scans(db, capitals, server, backend):
+    scans = len(server.scans())
+    # a tall and narrow box, the east edge keeps the fewest points
+    query = schema.Capital.filter(db, location__within_box=((-60.0, -80.0), (60.0, -75.0)))
+    assert names(query) == ["Ottawa", "Toronto"]
+    scanned = server.scans()[scans:]
+    # location_lat and location_lon are columns 1 and 2
+    assert scanned and all(column in (1, 2) and op in (GE, LE) for column, op in scanned)
+    assert scanned[0] == (2, LE)
+
+
+def test_box_across_the_antimeridian(db, capitals, backend):
+    query = schema.Capital.filter(db, location__within_box=((-20.0, 170.0), (-10.0, -170.0)))
+    assert names(query) == ["Apia", "Suva"]
+
+
+def test_radius(db, capitals, backend):
+    assert names(schema.Capital.filter(db, location__within_km=(CITIES["Toronto"], 400))) == \
+        ["Ottawa", "Toronto"]
+    assert names(schema.Capital.filter(db, location__within_km=(CITIES["Toronto"], 510))) == \
+        ["Montreal", "Ottawa", "Toronto"]
+    # a circle around the pole bounds latitude only
+    assert names(schema.Capital.filter(db, location__within_km=((90.0, 0.0), 1400))) == \
+        ["Alert", "Longyearbyen"]
+    assert names(schema.Capital.filter(db, location__within_km=(CITIES["Suva"], 1200),
+                                       name__ne="Suva")) == ["Apia"]
+
+
+def test_grid_index(db, capitals, server, backend):
+    index = orm.GridIndex(db, schema.Capital, "location", cell=5.0)
+    assert len(index) == len(CITIES)
+    scans = server.count(SCAN)
+    box = ((40.0, -80.0), (46.0, -75.0))
+    assert names(schema.Capital.filter(db, location__within_box=box)) == ["Ottawa", "Toronto"]
+    assert names(schema.Capital.filter(db, location__within_km=(CITIES["Suva"], 1200))) == \
+        ["Apia", "Suva"]
+    assert server.count(SCAN) == scans
+    # saves and deletes through the orm keep it current
+    moved = capitals["Ottawa"]
+    moved.location = (10.0, 10.0)
+    moved.save()
+    kingston = schema.Capital(db, location=(44.23, -76.49), name="Kingston")
+    kingston.save()
+    capitals["Toronto"].delete()
+    assert names(schema.Capital.filter(db, location__within_box=box)) == ["Kingston"]
+    index.close()
+    assert names(schema.Capital.filter(db, location__within_box=box)) == ["Kingston"]
+    assert server.count(SCAN) > scans
+
+
+def test_bad_geo_filters(db, capitals):
+    with pytest.raises(TypeError):
+        schema.Capital.filter(db, location__within_box=(1.0, 2.0)).ids()
+    with pytest.raises(ValueError):
+        schema.Capital.filter(db, location__within_box=((10.0, 0.0), (5.0, 1.0))).ids()
+    with pytest.raises(ValueError):
+        schema.Capital.filter(db, location__within_km=((95.0, 0.0), 1)).ids()
+    with pytest.raises(ValueError):
+        schema.Capital.filter(db, location__within_km=((0.0, 0.0), -1)).ids()
+    with pytest.raises(AttributeError):
+        orm.GridIndex(db, schema.Capital, "name")
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+#
+# test_hydration.py
+#
+# Tests for the trusted hydration path of fetched rows
+#
+
+from datetime import datetime
+import timeit
+import pytest
+import schema
+from orm.field import Field
+from fakeserver import UPDATE
+
+
+@pytest.fixture
+def parades(db):
+    capital = schema.Capital(db, location=(43.7, -79.4), name="Toronto")
+    capital.save()
+    objects = []
+    for i in range(3):
+        parade = schema.Parade(db, location=capital, start=1000.0 + i, end=2000.0)
+        parade.save()
+        objects.append(parade)
+    return objects
+
+
+def test_fetched_rows_skip_the_checks(db, people, monkeypatch):
+    def forbidden(*args, **kwargs):
+        raise AssertionError("field checks ran on a fetched row")
+
+    monkeypatch.setattr(schema.User, "__init__", forbidden)
+    monkeypatch.setattr(Field, "__set__", forbidden)
+    users = list(schema.User.filter(db, lastName="odd"))
+    assert [user.age for user in users] == [21, 23, 25]
+    user = schema.User.get(db, people[0].pk)
+    assert (user.firstName, user.height, user.version) == ("first0", 1.5, 1)
+
+
+def test_values_convert_on_first_read(db, parades, server):
+    parade = schema.Parade.get(db, parades[1].pk)
+    assert type(parade._start_value) is float
+    assert parade.start == datetime.fromtimestamp(1001.0)
+    assert type(parade._start_value) is datetime
+    assert parade._location_value._deferred
+    assert parade.location.name == "Toronto"
+    capital = schema.Capital.get(db, parade.location.pk)
+    assert capital.location == (43.7, -79.4)
+
+
+def test_fetched_rows_start_clean(db, parades, server):
+    updates = server.count(UPDATE)
+    parade = schema.Parade.get(db, parades[0].pk)
+    parade.start
+    parade.save()
+    assert server.count(UPDATE) == updates
+    parade.end = datetime.fromtimestamp(3000.0)
+    parade.save()
+    assert server.count(UPDATE) == updates + 1
+    assert db.get("Parade", parade.pk)[0][2] == 3000.0
+
+
+def test_hydration_beats_the_constructor(db):
+    rows = [(["first", "last", 1.5, i], 1) for i in range(20000)]
+
+    def hydrate():
+        for pk, (values, version) in enumerate(rows, 1):
+            schema.User._from_row(db, pk, values, version)
+
+    def construct():
+        for pk, (values, version) in enumerate(rows, 1):
+            schema.User(db, pk=pk, version=version, firstName=values[0], lastName=values[1],
+                        height=values[2], age=values[3])
+
+    fast = min(timeit.repeat(hydrate, number=1, repeat=3))
+    slow = min(timeit.repeat(construct, number=1, repeat=3))
+    assert fast * 3 < slow
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+#
+# test_order_by.py
+#
+# Tests for order_by, top-k slices and cursor pages
+#
+
+from datetime import datetime
+import pytest
+import schema
+from orm import query
+from fakeserver import GET, GE, LE, GT, LT
+
+
+@pytest.fixture(params=["numpy", "heap"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        if query.numpy is None:
+            pytest.skip("the orm was loaded without numpy")
+    else:
+        monkeypatch.setattr(query, "numpy", None)
+    # several chunks even for a few rows
+    monkeypatch.setattr(query, "ORDER_CHUNK", 4)
+    return request.param
+
+
+@pytest.fixture
+def parades(db):
+    capital = schema.Capital(db, location=(1.0, 2.0), name="c")
+    objects = [schema.Parade(db, location=capital, start=1000.0 * (i * 7 % 11), end=0.0)
+               for i in range(11)]
+    # two parades share a start, the pk breaks the tie
+    objects.append(schema.Parade(db, location=capital, start=5000.0, end=0.0))
+    assert schema.Parade.bulk_save(db, objects) == []
+    return objects
+
+
+def starts(parades):
+    return [parade.start.timestamp() for parade in parades]
+
+
+def test_top_k_fetches_only_k_rows(db, parades, server, backend):
+    gets = server.count(GET)
+    latest = list(schema.Parade.filter(db).order_by("-start")[:3])
+    assert starts(latest) == [10000.0, 9000.0, 8000.0]
+    # the sort column of every candidate, then the three rows
+    assert server.count(GET) - gets == len(parades) + 3
+    earliest = list(schema.Parade.filter(db).order_by("start")[:2])
+    assert starts(earliest) == [0.0, 1000.0]
+
+
+def test_full_order_and_ties(db, parades, backend):
+    ordered = list(schema.Parade.filter(db).order_by("start"))
+    assert starts(ordered) == sorted(starts(parades))
+    fives = [parade.pk for parade in ordered if parade.start.timestamp() == 5000.0]
+    assert fives == sorted(fives) and len(fives) == 2
+    backwards = list(schema.Parade.filter(db).order_by("-start"))
+    assert [p.pk for p in backwards if p.start.timestamp() == 5000.0] == fives[::-1]
+    assert [p.pk for p in schema.Parade.filter(db).order_by("-id")[:2]] == \
+        [parades[-1].pk, parades[-2].pk]
+
+
+def test_cursor_pages(db, parades, server, backend):
+    ordered = [parade.pk for parade in schema.Parade.filter(db).order_by("-start")]
+    pages = []
+    after = None
+    while True:
+        page = list(schema.Parade.filter(db).order_by("-start", after=after)[:5])
+        if not page:
+            break
+        pages.append([parade.pk for parade in page])
+        after = page[-1]
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sum(pages, []) == ordered
+    # the cursor key narrows the scan on the server
+    page = schema.Parade.filter(db).order_by("start", after=(5000.0, parades[-1].pk))
+    scans = len(server.scans())
+    assert starts(page) == [6000.0, 7000.0, 8000.0, 9000.0, 10000.0]
+    assert [op for column, op in server.scans()[scans:]] == [GE]
+
+
+def test_cursor_on_keys_scans_no_range(db, people, server, backend):
+    for i in range(6):
+        schema.Account(db, user=people[i % 3], type="Savings", balance=1.0 * i).save()
+    scans = len(server.scans())
+    rest = schema.Account.filter(db).order_by("user", after=(people[0].pk, 10 ** 6))
+    assert sorted(account.balance for account in rest) == [1.0, 2.0, 4.0, 5.0]
+    after = schema.User.filter(db).order_by("-id", after=people[3])
+    assert [user.pk for user in after] == [people[2].pk, people[1].pk, people[0].pk]
+    assert not [op for column, op in server.scans()[scans:] if op in (GT, LT, GE, LE)]
+
+
+def test_count_skips_the_sort(db, parades, server):
+    gets = server.count(GET)
+    assert schema.Parade.filter(db).order_by("-start").count() == len(parades)
+    assert server.count(GET) == gets
+    assert len(schema.Parade.filter(db).order_by("-start")[:4]) == 4
+
+
+def test_bad_orders(db, parades):
+    with pytest.raises(AttributeError):
+        schema.Parade.filter(db).order_by("weight")
+    with pytest.raises(TypeError):
+        schema.Capital.filter(db).order_by("location")
+    with pytest.raises(TypeError):
+        schema.Parade.filter(db)[:2].order_by("start")
+    with pytest.raises(TypeError):
+        schema.Parade.filter(db).order_by("start", after=(1.0, None))
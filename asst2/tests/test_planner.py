@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+#
+# test_planner.py
+#
+# Tests for the multi-predicate query planner
+#
+
+from array import array
+import random
+import pytest
+import schema
+from orm import planner
+from orm.planner import intersect_sorted, sort_ids, Plan, Predicate, Statistics, \
+    OP_EQ, OP_GT, OP_AL
+from fakeserver import SCAN
+
+
+@pytest.fixture(params=["numpy", "builtins"])
+def backend(request, monkeypatch):
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+        if planner.numpy is None:
+            pytest.skip("the orm was loaded without numpy")
+    else:
+        monkeypatch.setattr(planner, "numpy", None)
+    return request.param
+
+
+def test_intersect_sorted(backend):
+    rng = random.Random(3)
+    for small, large in ((5, 5000), (300, 400), (0, 10)):
+        a = rng.sample(range(10000), small)
+        b = rng.sample(range(10000), large)
+        expected = sorted(set(a) & set(b))
+        a, b = sort_ids(array("q", a)), sort_ids(array("q", b))
+        assert list(intersect_sorted(a, b)) == expected
+        assert list(intersect_sorted(b, a)) == expected
+
+
+def test_plans_return_id_arrays(db, people, backend):
+    ids = Plan(db, "User", [Predicate("lastName", OP_EQ, "odd"), Predicate("age", OP_GT, 21)],
+               Statistics()).execute()
+    assert type(ids) is array and list(ids) == [people[3].pk, people[5].pk]
+
+
+def test_matches_every_predicate(db, people, backend):
+    query = schema.User.filter(db, lastName="odd", age__gt=20, height__lt=1.95)
+    assert list(query.ids()) == [people[1].pk, people[3].pk]
+
+
+def test_smallest_scan_runs_first_and_empty_stops(db, people, server, backend):
+    statistics = Statistics()
+    preds = [Predicate("age", OP_GT, 0), Predicate("firstName", OP_EQ, "first2")]
+    plan = Plan(db, "User", preds, statistics)
+    assert [step[0].column for step in plan.steps] == ["firstName", "age"]
+    assert list(plan.execute()) == [people[2].pk]
+    scans = server.count(SCAN)
+    plan = Plan(db, "User", [Predicate("firstName", OP_EQ, "nobody")] + preds, statistics)
+    assert len(plan.execute()) == 0
+    # the other scans are skipped once nothing is left
+    assert server.count(SCAN) - scans == 1
+    assert "skipped" in plan.explain()
+
+
+def test_observed_counts_reorder(db, people):
+    statistics = Statistics()
+    Plan(db, "User", [Predicate(None, OP_AL, None)], statistics).execute()
+    assert statistics.rows["User"] == 6
+    wide = Predicate("lastName", OP_EQ, "odd")
+    narrow = Predicate("age", OP_GT, 24)
+    Plan(db, "User", [wide], statistics).execute()
+    Plan(db, "User", [narrow], statistics).execute()
+    plan = Plan(db, "User", [wide, narrow], statistics)
+    assert [step[0] for step in plan.steps] == [narrow, wide]
+    assert list(plan.execute()) == [people[5].pk]
+    assert "scanned 1, 1 left" in plan.explain()
+
+
+def test_explain_from_query(db, people):
+    text = schema.User.filter(db, lastName="even", age=22).explain()
+    assert text.startswith("Plan for User:") and text.count("scan ") == 2
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+#
+# test_prefetch.py
+#
+# Tests for reverse accessors and prefetch_related
+#
+
+import pytest
+import schema
+from fakeserver import EQ, GET
+
+
+@pytest.fixture
+def accounts(db, people):
+    objects = []
+    for i in range(5):
+        account = schema.Account(db, user=people[i % 3 if i < 4 else 0], type="Savings",
+                                 balance=1.0 * i)
+        account.save()
+        objects.append(account)
+    return objects
+
+
+def test_reverse_accessor_is_a_query(db, people, accounts):
+    owned = people[0].account_set
+    assert sorted(account.balance for account in owned) == [0.0, 3.0, 4.0]
+    assert owned.count() == 3
+    assert people[4].account_set.count() == 0
+
+
+def test_prefetch_groups_children(db, people, accounts, server):
+    scans = len(server.scans())
+    gets = server.count(GET)
+    users = list(schema.User.filter(db, age__lt=23).prefetch_related("account_set"))
+    scanned = server.scans()[scans:]
+    # one user scan, then one equality scan on the foreign key per user
+    assert len(scanned) == 1 + 3 and all(op == EQ for column, op in scanned[1:])
+    # three users and five accounts
+    assert server.count(GET) - gets == 3 + 5
+    groups = [sorted(a.balance for a in user.account_set) for user in users]
+    assert groups == [[0.0, 3.0, 4.0], [1.0], [2.0]]
+    assert users[0].account_set[0].user is users[0]
+
+
+def test_prefetch_sees_no_request_after_load(db, people, accounts, server):
+    users = list(schema.User.filter(db, age=20).prefetch_related("account_set"))
+    before = len(server.log)
+    assert len(list(users[0].account_set)) == 3
+    assert len(server.log) == before
+
+
+def test_unknown_accessor(db, people):
+    with pytest.raises(AttributeError):
+        list(schema.User.filter(db, age=20).prefetch_related("parade_set"))
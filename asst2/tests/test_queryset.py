@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+#
+# test_queryset.py
+#
+# Tests for the lazy, chainable QuerySet
+#
+
+import pytest
+import orm
+import schema
+from fakeserver import GET, SCAN
+
+
+def test_nothing_is_sent_until_used(db, people, server):
+    before = len(server.log)
+    query = schema.User.filter(db, lastName="odd").filter(age__gt=21)
+    assert len(server.log) == before
+    assert [user.age for user in query] == [23, 25]
+    scans = server.count(SCAN)
+    assert [user.age for user in query] == [23, 25]
+    assert server.count(SCAN) == scans
+
+
+def test_count_exists_first(db, people, server):
+    query = schema.User.filter(db, lastName="even")
+    gets = server.count(GET)
+    assert query.count() == 3 and len(query) == 3
+    assert query.exists() and bool(query)
+    assert not schema.User.filter(db, firstName="nobody").exists()
+    assert server.count(GET) == gets
+    assert query.first().firstName == "first0"
+    assert schema.User.filter(db, age__gt=100).first() is None
+    assert schema.User.count(db) == 6
+
+
+def test_slices_compose(db, people):
+    query = schema.User.filter(db, age__ge=20)
+    assert [user.age for user in query[1:5][1:3]] == [22, 23]
+    assert [user.age for user in query.limit(2)] == [20, 21]
+    assert query[4].age == 24
+    assert [user.age for user in query[4:]] == [24, 25]
+    with pytest.raises(ValueError):
+        query[::2]
+    with pytest.raises(ValueError):
+        query[-1:]
+    with pytest.raises(TypeError):
+        query[:2].filter(age=1)
+    with pytest.raises(TypeError):
+        query["a"]
+
+
+def test_lookups(db, people):
+    ages = lambda **kwargs: sorted(user.age for user in schema.User.filter(db, **kwargs))
+    assert ages(age__lt=22) == [20, 21]
+    assert ages(age__le=22) == [20, 21, 22]
+    assert ages(age__ne=22) == [20, 21, 23, 24, 25]
+    assert ages(height__gt=1.85) == [24, 25]
+    assert ages(id=people[3].pk) == [23]
+    with pytest.raises(AttributeError):
+        ages(age__like=1)
+    with pytest.raises(orm.PacketError):
+        ages(weight=1)
+
+
+def test_foreign_filters(db, people):
+    for user in people[:2]:
+        schema.Account(db, user=user, type="Savings", balance=10.0).save()
+    accounts = list(schema.Account.filter(db, user=people[1]))
+    assert len(accounts) == 1 and accounts[0].user.pk == people[1].pk
+    assert schema.Account.count(db, user__ne=people[1].pk) == 1
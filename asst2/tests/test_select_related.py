@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+#
+# test_select_related.py
+#
+# Tests for lazy foreign keys and select_related
+#
+
+import pytest
+import orm
+import schema
+from orm.query import load_related
+from fakeserver import GET
+
+
+@pytest.fixture
+def accounts(db, people):
+    objects = []
+    for i in range(6):
+        account = schema.Account(db, user=people[i % 2], type="Savings", balance=1.0 * i)
+        account.save()
+        objects.append(account)
+    return objects
+
+
+def test_foreign_keys_load_on_first_access(db, accounts, server):
+    account = schema.Account.get(db, accounts[0].pk)
+    gets = server.count(GET)
+    user = account.user
+    assert user.pk == accounts[0].user.pk
+    assert server.count(GET) == gets
+    assert user.firstName == "first0"
+    assert server.count(GET) == gets + 1
+
+
+def test_select_related_fetches_each_target_once(db, accounts, server):
+    query = schema.Account.filter(db, type="Savings").select_related("user")
+    gets = server.count(GET)
+    names = [account.user.firstName for account in query]
+    assert names == ["first0", "first1"] * 3
+    # six accounts in one multi-get, then their two distinct users
+    assert server.count(GET) - gets == 6 + 2
+
+
+def test_select_related_follows_paths(db):
+    capital = schema.Capital(db, location=(43.7, -79.4), name="Toronto")
+    capital.save()
+    for i in range(3):
+        schema.Parade(db, location=capital, start=1000.0 + i, end=2000.0).save()
+    parades = list(schema.Parade.filter(db, start__ge=1000.0).select_related("location"))
+    assert [parade.location.name for parade in parades] == ["Toronto"] * 3
+    assert parades[0].location.pk == capital.pk
+    with pytest.raises(AttributeError):
+        list(schema.Parade.filter(db).select_related("start"))
+
+
+def test_dropped_target_stays_deferred(db, accounts):
+    loaded = list(schema.Account.filter(db, user=accounts[1].user))
+    # the user goes away after its accounts were read
+    db.drop("User", accounts[1].user.pk)
+    load_related(loaded, "user")
+    assert all(account.user._deferred for account in loaded)
+    with pytest.raises(orm.ObjectDoesNotExist):
+        loaded[0].user.firstName
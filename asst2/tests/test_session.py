@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+#
+# test_session.py
+#
+# Tests for the session that keeps one object per row
+#
+
+import pytest
+import orm
+import schema
+from fakeserver import GET
+
+
+def test_one_object_per_row(db, people, server):
+    pk = people[2].pk
+    assert schema.User.get(db, pk) is not schema.User.get(db, pk)
+    with orm.Session(db) as session:
+        gets = server.count(GET)
+        user = session.get(schema.User, pk)
+        assert schema.User.get(db, pk) is user
+        # the repeat lookup is answered from memory
+        assert server.count(GET) == gets + 1
+        assert [u for u in schema.User.filter(db, age=22)] == [user]
+        assert schema.User.filter(db, age=22).first() is user
+        assert session.stats()["hits"] >= 1 and len(session) == 1
+
+
+def test_foreign_keys_share_the_object(db, people):
+    for i in range(3):
+        schema.Account(db, user=people[1], type="Savings", balance=1.0 * i).save()
+    with orm.Session(db):
+        accounts = list(schema.Account.filter(db, type="Savings"))
+        assert accounts[0].user is accounts[1].user is accounts[2].user
+        assert accounts[0].user is schema.User.get(db, people[1].pk)
+
+
+def test_versions_detect_staleness(db, people):
+    pk = people[0].pk
+    with orm.Session(db) as session:
+        user = schema.User.get(db, pk)
+        assert not session.stale(user)
+        values, version = db.get("User", pk)
+        db.update("User", pk, ["renamed"] + values[1:])
+        assert session.stale(user)
+        assert session.refresh(user) is user
+        assert user.firstName == "renamed" and user.version == version + 1
+        # a query reading the row again updates the same object
+        db.update("User", pk, ["again"] + values[1:])
+        assert schema.User.filter(db, age=20).first().firstName == "again"
+        assert session.stats()["refreshed"] == 2
+
+
+def test_unsaved_changes_survive_a_refetch(db, people):
+    pk = people[0].pk
+    with orm.Session(db) as session:
+        user = schema.User.get(db, pk)
+        user.age = 99
+        values, version = db.get("User", pk)
+        db.update("User", pk, ["renamed"] + values[1:])
+        assert schema.User.filter(db, firstName="renamed").first() is user
+        assert user.age == 99
+        # the change was made on the old version
+        with pytest.raises(orm.TransactionAbort):
+            user.save()
+
+
+def test_flush_writes_changed_objects(db, people):
+    with orm.Session(db) as session:
+        users = list(schema.User.filter(db, lastName="odd"))
+        for user in users:
+            user.age += 10
+        created = schema.User(db, firstName="new", lastName="odd", height=1.0, age=1)
+        created.save()
+        assert session.flush() == []
+        assert session.flush() == []
+    assert sorted(user.age for user in schema.User.filter(db, lastName="odd")) == [1, 31, 33, 35]
+
+
+def test_closing_releases_the_objects(db, people):
+    session = orm.Session(db)
+    with session:
+        schema.User.get(db, people[0].pk)
+        with orm.Session(db) as inner:
+            assert schema.User.get(db, people[0].pk) is not None
+            assert len(inner) == 1
+        assert len(inner) == 0 and len(session) == 1
+    assert len(session) == 0
+    with pytest.raises(RuntimeError):
+        session.get(schema.User, people[0].pk)
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+#
+# test_values_list.py
+#
+# Tests for values_list and only
+#
+
+from array import array
+import pytest
+import schema
+from fakeserver import GET
+
+
+def test_values_list_columns(db, people):
+    query = schema.User.filter(db, lastName="odd")
+    ages, names, pks = query.values_list("age", "firstName", "id")
+    assert type(ages) is array and list(ages) == [21, 23, 25]
+    assert list(names) == ["first1", "first3", "first5"]
+    assert list(pks) == [people[1].pk, people[3].pk, people[5].pk]
+    heights, = query.values_list("height", container="list")
+    assert heights == [1.6, pytest.approx(1.8), 2.0]
+    with pytest.raises(AttributeError):
+        query.values_list("weight")
+
+
+def test_coordinates_split(db):
+    for i in range(3):
+        schema.Capital(db, location=(10.0 * i, -20.0 * i), name="c%d" % i).save()
+    lats, lons, names = schema.Capital.filter(db).values_list("location", "name", container="list")
+    assert lats == [0.0, 10.0, 20.0] and lons == [0.0, -20.0, -40.0]
+    assert names == ["c0", "c1", "c2"]
+
+
+def test_values_list_numpy(db, people):
+    numpy = pytest.importorskip("numpy")
+    heights, = schema.User.filter(db, age__gt=0).values_list("height", container="numpy")
+    assert heights.dtype == numpy.float64 and len(heights) == 6
+
+
+def test_only_reads_some_fields(db, people, server):
+    users = list(schema.User.filter(db, lastName="even").only("age"))
+    gets = server.count(GET)
+    assert [user.age for user in users] == [20, 22, 24]
+    assert server.count(GET) == gets
+    assert all(user._deferred for user in users)
+    # another field brings in the whole row
+    assert users[1].firstName == "first2"
+    assert server.count(GET) == gets + 1
+    assert not users[1]._deferred and users[1].height == pytest.approx(1.7)
+    with pytest.raises(AttributeError):
+        schema.User.filter(db).only("weight")
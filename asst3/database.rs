@@ -351,7 +351,7 @@ fn handle_update(db: &Database, table_id: i32, object_id: i64, version: i64, val
     let target_cols = &target_table.schema.t_cols;
 
     // Error Handling 2: Bad_Row
-    if !valid_row(&values, rarget_cols) {
+    if !valid_row(&values, target_cols) {
         return Err(Response::BAD_ROW);
     }
 
@@ -375,13 +375,15 @@ fn handle_update(db: &Database, table_id: i32, object_id: i64, version: i64, val
     remove_foreign_map(&mut *foreign_ref_map, &prev_ref_rows, object_id, table_id);
     add_foreign_map(&mut *foreign_ref_map, &new_ref_rows, object_id, table_id);
 
-    // Update the row in the database
+    // Update the row in the database, an unconditional update (version 0)
+    // still moves the row on from its own version
+    let new_version = target_row.version + 1;
     if let Some(row) = qualified_rows.get_mut(&object_id) {
         row.data = values;
-        row.version = version + 1;
+        row.version = new_version;
     }
 
-    Ok(Response::Update(version + 1))
+    Ok(Response::Update(new_version))
 }
 
 /*
@@ -457,6 +459,21 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
         }
     }
 
+    // Case 2. Column id, it is possible to scan a table for the id of a
+    // row using column_id 0, with EQ and NE only
+    if column_id == 0 {
+        let key = match other {
+            Value::Integer(key) => key,
+            _ => return Err(Response::BAD_QUERY),
+        };
+        let result: Vec<i64> = match operator {
+            OP_EQ => table_rows.keys().filter(|id| **id == key).cloned().collect(),
+            OP_NE => table_rows.keys().filter(|id| **id != key).cloned().collect(),
+            _ => return Err(Response::BAD_QUERY),
+        };
+        return Ok(Response::Query(result));
+    }
+
     // Error Handling 2.2 BAD_QUERY
     let column_id = (column_id - 1) as usize;
     if let Err(error) = valid_query(&other, &table, column_id) {
@@ -465,39 +482,23 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
 
     let mut result: Vec<i64> = Vec::new();
 
-    // Case2. Other Operators
+    // Case 3. Other Operators
     match operator {
         OP_EQ =>
             for (id, row) in table_rows.iter() {
-                if column_id == 0 {
-                    // it is possible to scan a table for id of a row, using column_id 0
-                    if let Value::Integer(value) = other{
-                        if *id == value {
-                            result.push(*id);
-                        }
-                    }
-                }
                 if row.data[column_id] == other {
                     result.push(*id)
                 };
             },
         OP_NE =>
             for (id, row) in table_rows.iter() {
-                if column_id == 0 {
-                    // it is possible to scan a table for id of a row, using column_id 0
-                    if let Value::Integer(value) = other{
-                        if *id == value {
-                            result.push(*id);
-                        }
-                    }
-                }
                 if row.data[column_id] != other {
                     result.push(*id)
                 };
             },
-        OP_LT => // column id and foreign fields only supported EQ and NE operators.
+        OP_LT => // foreign fields only support EQ and NE operators.
         // return error for all other operator types
-            if table_cols[column_id].c_type == Value::FOREIGN || column_id == 0 {
+            if table_cols[column_id].c_type == Value::FOREIGN {
                 return Err(Response::BAD_QUERY);
             } else {
                 for (id, row) in table_rows.iter() {
@@ -506,9 +507,9 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
                     }
                 }
             },
-        OP_GT => // column id and foreign fields only supported EQ and NE operators.
+        OP_GT => // foreign fields only support EQ and NE operators.
         // return error for all other operator types
-            if table_cols[column_id].c_type == Value::FOREIGN || column_id == 0 {
+            if table_cols[column_id].c_type == Value::FOREIGN {
                 return Err(Response::BAD_QUERY);
             } else {
                 for (id, row) in table_rows.iter() {
@@ -517,9 +518,9 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
                     }
                 }
             },
-        OP_LE => // column id and foreign fields only supported EQ and NE operators.
+        OP_LE => // foreign fields only support EQ and NE operators.
         // return error for all other operator types
-            if table_cols[column_id].c_type == Value::FOREIGN || column_id == 0 {
+            if table_cols[column_id].c_type == Value::FOREIGN {
                 return Err(Response::BAD_QUERY);
             } else {
                 for (id, row) in table_rows.iter() {
@@ -528,9 +529,9 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
                     }
                 }
             },
-        OP_GE => // column id and foreign fields only supported EQ and NE operators.
+        OP_GE => // foreign fields only support EQ and NE operators.
         // return error for all other operator types
-            if table_cols[column_id].c_type == Value::FOREIGN || column_id == 0 {
+            if table_cols[column_id].c_type == Value::FOREIGN {
                 return Err(Response::BAD_QUERY);
             } else {
                 for (id, row) in table_rows.iter() {
@@ -544,4 +545,4 @@ fn handle_query(db: & Database, table_id: i32, column_id: i32,
     };
 
     Ok(Response::Query(result))
-
+}
@@ -196,6 +196,17 @@ impl Buffer for ByteArray {
     }
 }
 
+/* create packet from the bytes of exactly one request */
+impl From<Vec<u8>> for ByteArray {
+    fn from(buffer: Vec<u8>) -> Self {
+        ByteArray {
+            buffer: buffer,
+            pointer: 0,
+            strlen: 0,
+        }
+    }
+}
+
 /* create packet from a byte array */
 impl From<& [u8; ByteArray::MAX_PACKET_SIZE]> for ByteArray {
     fn from(buf: & [u8; ByteArray::MAX_PACKET_SIZE]) -> Self {
@@ -347,14 +358,74 @@ impl In<String> for ByteArray {
 
 pub trait Network : io::Write + io::Read {
 
+    /* append exactly size bytes of the stream to raw */
+    fn read_part(&mut self, raw: &mut Vec<u8>, size: usize) -> io::Result<()> {
+        let start = raw.len();
+        if start + size > ByteArray::MAX_PACKET_SIZE {
+            return Err(io::Error::new(io::ErrorKind::Other,
+                       "Packet too large"));
+        }
+        raw.resize(start + size, 0);
+        self.read_exact(&mut raw[start..])
+    }
+
+    /* append the next i32 of the stream to raw and return it */
+    fn read_part_i32(&mut self, raw: &mut Vec<u8>) -> io::Result<i32> {
+        self.read_part(raw, mem::size_of::<i32>())?;
+        let mut arr : [u8; 4] = [0; 4];
+        arr.copy_from_slice(&raw[raw.len() - 4..]);
+        Ok(i32::from_be_bytes(arr))
+    }
+
+    /* append a value (type, size and size bytes) of the stream to raw */
+    fn read_part_value(&mut self, raw: &mut Vec<u8>) -> io::Result<()> {
+        self.read_part_i32(raw)?;
+        let size = self.read_part_i32(raw)?;
+        if size < 0 {
+            return Err(io::Error::new(io::ErrorKind::Other,
+                       "Read invalid value size"));
+        }
+        self.read_part(raw, size as usize)
+    }
+
+    /* read the bytes of exactly one request. A client may send several
+     * requests back to back (pipelining), so nothing past the current
+     * request is consumed: the next one stays in the stream */
+    fn read_request(&mut self) -> io::Result<Vec<u8>> {
+        let mut raw = Vec::<u8>::new();
+        let cmd = self.read_part_i32(&mut raw)?;
+        self.read_part_i32(&mut raw)?;      /* table id */
+
+        match cmd {
+            Request::INSERT => {
+                let numcols = self.read_part_i32(&mut raw)?;
+                for _ in 0..numcols {
+                    self.read_part_value(&mut raw)?;
+                }
+            },
+            Request::UPDATE => {
+                self.read_part(&mut raw, 2 * mem::size_of::<i64>())?;
+                let numcols = self.read_part_i32(&mut raw)?;
+                for _ in 0..numcols {
+                    self.read_part_value(&mut raw)?;
+                }
+            },
+            Request::DROP | Request::GET => {
+                self.read_part(&mut raw, mem::size_of::<i64>())?;
+            },
+            Request::SCAN => {
+                self.read_part(&mut raw, 2 * mem::size_of::<i32>())?;
+                self.read_part_value(&mut raw)?;
+            },
+            /* EXIT has no body, an invalid command is rejected below */
+            _ => {},
+        }
+        Ok(raw)
+    }
+
     /* receive a packet from client */
     fn receive(&mut self) -> io::Result<Request> { 
-        let mut buffer : [u8; ByteArray::MAX_PACKET_SIZE] = unsafe {
-            mem::MaybeUninit::uninit().assume_init()
-        };
-      
-        self.read(&mut buffer)?;
-        let mut packet = ByteArray::from(&buffer);
+        let mut packet = ByteArray::from(self.read_request()?);
         let cmd = packet.read()?;
         use self::Command::*;
        